@@ -0,0 +1,764 @@
+"""Benchmarks do bot de moderação de feedback (não usa Discord nem OpenAI reais).
+
+Uso:
+    python benchmark.py concorrencia --mensagens 20 --latencia 2.0
+    python benchmark.py preclassificador --corpus corpus_feedback.jsonl
+    python benchmark.py acoes --latencia-rest 0.15
+    python benchmark.py relatorios --incidentes 50
+    python benchmark.py replay --mensagens 200 --taxa 20 --latencia-ia 1.0 --erro-ia 0.05
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+import json
+from collections import Counter
+from io import BytesIO
+from types import SimpleNamespace
+
+from aiohttp import web
+
+import main
+
+
+# ==================== STAND-INS ====================
+
+class FakeCompletions:
+    """Imita client.chat.completions com latência configurável"""
+
+    def __init__(self, latency: float, blocking: bool = False):
+        self.latency = latency
+        self.blocking = blocking
+        self.calls = 0
+
+    def _response(self):
+        content = json.dumps({"c": "P", "p": 0.9, "m": None})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        if self.blocking:
+            # Simula o cliente síncrono antigo: trava o event loop durante a chamada
+            time.sleep(self.latency)
+        else:
+            await asyncio.sleep(self.latency)
+        return self._response()
+
+
+class FakeOpenAIClient:
+    """Imita openai.AsyncOpenAI"""
+
+    def __init__(self, latency: float, blocking: bool = False):
+        self.chat = SimpleNamespace(completions=FakeCompletions(latency, blocking))
+
+    async def close(self):
+        pass
+
+
+class FakeRest:
+    """Camada REST do Discord falsa: latência, taxa de erro e contagem de chamadas por tipo"""
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, seed: int = 42):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.calls = Counter()
+
+    async def call(self, kind: str):
+        self.calls[kind] += 1
+        await asyncio.sleep(self.latency)
+        if self.error_rate and self.random.random() < self.error_rate:
+            raise RuntimeError(f"Erro REST simulado ({kind})")
+
+
+class FakeUser:
+    """Imita discord.User/discord.Member (DMs e timeout com latência de REST)"""
+
+    def __init__(self, user_id: int, name: str, rest_latency: float = 0.0, rest: FakeRest = None):
+        self.id = user_id
+        self.name = name
+        self.discriminator = "0"
+        self.mention = f"<@{user_id}>"
+        self.bot = False
+        self.rest = rest or FakeRest(rest_latency)
+        self.guild = None
+        self.dms = []
+        self.timed_out_for = None
+        self.timed_out_until = None
+        self.dm_channel = None
+
+    def is_timed_out(self) -> bool:
+        return self.timed_out_until is not None and time.monotonic() < self.timed_out_until
+
+    async def create_dm(self):
+        await self.rest.call("create_dm")
+        self.dm_channel = self
+        return self
+
+    async def send(self, content=None, **kwargs):
+        await self.rest.call("dm")
+        self.dms.append(content if content is not None else kwargs)
+
+    async def timeout(self, duration, reason=None):
+        await self.rest.call("timeout")
+        self.timed_out_for = duration
+        self.timed_out_until = time.monotonic() + duration.total_seconds()
+
+
+class FakeGuild:
+    """Imita discord.Guild (cache de membros)"""
+
+    def __init__(self, guild_id: int, members: list):
+        self.id = guild_id
+        self.members = {m.id: m for m in members}
+        for member in members:
+            member.guild = self
+
+    def get_member(self, user_id: int):
+        return self.members.get(user_id)
+
+
+class FakeChannel:
+    """Imita discord.TextChannel (bulk delete e histórico)"""
+
+    def __init__(self, channel_id: int, rest: FakeRest = None, messages: list = None):
+        self.id = channel_id
+        self.rest = rest
+        self.messages = messages or []
+
+    async def history(self, limit=100, after=None, oldest_first=True):
+        messages = sorted(self.messages, key=lambda m: m.id, reverse=not oldest_first)
+        if after is not None:
+            messages = [m for m in messages if m.id > after.id]
+        for i, message in enumerate(messages[:limit]):
+            if i % 100 == 0:
+                await self.rest.call("history")
+            yield message
+
+    async def delete_messages(self, messages: list):
+        await self.rest.call("bulk_delete")
+        deleted_at = time.perf_counter()
+        for message in messages:
+            message.deleted_at = deleted_at
+
+
+class FakeMessage:
+    """Imita discord.Message"""
+
+    def __init__(self, message_id: int, content: str, author: FakeUser, guild: FakeGuild,
+                 channel_id: int, rest_latency: float = 0.0, attachments: list = None, rest: FakeRest = None):
+        self.id = message_id
+        self.content = content
+        self.author = author
+        self.guild = guild
+        self.attachments = attachments or []
+        self.rest = rest or author.rest
+        self.channel = FakeChannel(channel_id, self.rest)
+        self.deleted_at = None
+
+    async def delete(self):
+        await self.rest.call("delete")
+        self.deleted_at = time.perf_counter()
+
+    def edited(self, content: str) -> "FakeMessage":
+        """Cópia da mensagem com o conteúdo editado (como o `after` do on_message_edit)"""
+        after = FakeMessage(self.id, content, self.author, self.guild, self.channel.id,
+                            attachments=self.attachments, rest=self.rest)
+        return after
+
+
+class FakeAttachment:
+    """Imita discord.Attachment"""
+
+    def __init__(self, attachment_id: int, url: str, size: int, filename: str = "imagem.png"):
+        self.id = attachment_id
+        self.url = url
+        self.size = size
+        self.filename = filename
+
+
+def make_fake_scenario(rest_latency: float, content: str = "Não comprem, é scam", message_id: int = 1):
+    """Monta autor, líder, servidor e mensagem falsos no canal de feedback"""
+    author = FakeUser(1000 + message_id, f"usuario{message_id}", rest_latency)
+    leader = FakeUser(main.LEADER_ID, "lider", rest_latency)
+    guild = FakeGuild(main.GUILD_ID, [author, leader])
+    message = FakeMessage(message_id, content, author, guild, main.FEEDBACK_CHANNEL_ID, rest_latency)
+    return message
+
+
+# ==================== SERVIDOR OPENAI FALSO ====================
+
+def _sample_png() -> bytes:
+    """Imagem de exemplo servida pelo CDN falso"""
+    if main.Image is None:
+        return os.urandom(2048)
+    image = main.Image.new("RGB", (1280, 720), (54, 57, 63))
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class MockOpenAIServer:
+    """Servidor HTTP local que imita a API da OpenAI (POST /v1/chat/completions), o CDN do
+    Discord (GET /cdn/...) e a API REST do Discord usada no fallback de timeout (/discord/...).
+
+    As respostas seguem os rótulos do corpus (texto normalizado → classificação); textos
+    desconhecidos são POSITIVO. Latência e taxa de erro (HTTP 500) são configuráveis.
+    """
+
+    def __init__(self, latency: float, error_rate: float, labels: dict, seed: int = 42, outage: float = 0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.outage = outage
+        self.outage_until = 0.0
+        self.labels = labels
+        self.random = random.Random(seed)
+        self.image = _sample_png()
+        self.runner: web.AppRunner | None = None
+        self.calls = 0
+        self.errors = 0
+        self.cdn_calls = 0
+        self.discord_calls = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        self.seen_prefixes: set[str] = set()
+        self.model_noise: dict[str, float] = {}  # modelo -> fração de respostas com outro rótulo
+
+    async def start(self) -> str:
+        """Inicia o servidor numa porta livre e retorna a URL base"""
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/v1/chat/completions", self._completions)
+        app.router.add_get("/cdn/{name}", self._cdn)
+        app.router.add_patch("/discord/guilds/{guild_id}/members/{user_id}", self._discord_member)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, "127.0.0.1", 0).start()
+        self.outage_until = time.monotonic() + self.outage
+        host, port = self.runner.addresses[0][:2]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+    def verdict(self, feedback: str, model: str = None) -> dict:
+        """Veredito compacto ({"c", "p", "m"}) para o texto do feedback, pelo rótulo do corpus"""
+        classification = self.labels.get(main.normalize_feedback_text(feedback))
+        if classification is None:
+            # Rajada agrupada (uma mensagem por linha): vale a linha mais grave
+            severity = list(main.VERDICT_CODES.values())
+            classification = max(
+                (self.labels.get(main.normalize_feedback_text(line), "POSITIVO") for line in feedback.split("\n")),
+                key=severity.index
+            )
+        if self.model_noise.get(model) and self.random.random() < self.model_noise[model]:
+            classification = self.random.choice([name for name in main.VERDICT_CODES.values() if name != classification])
+        code = next(code for code, name in main.VERDICT_CODES.items() if name == classification)
+        return {"c": code, "p": 0.9, "m": None if code == "P" else "Resposta simulada"}
+
+    def answer(self, body: dict) -> str:
+        """Conteúdo da resposta do modelo para a requisição"""
+        user_content = body["messages"][-1]["content"]
+        texts = [part["text"] for part in user_content if part["type"] == "text"]
+
+        # Modo em lote: um bloco "ID: <id>\nFEEDBACK DO CLIENTE:\n<texto>" por mensagem
+        if texts and texts[0].startswith("ID: "):
+            results = []
+            for text in texts:
+                header = text.split("\n", 1)[0]
+                results.append({"id": header[len("ID: "):], **self.verdict(self.feedback_text(text))})
+            return json.dumps({"r": results})
+
+        return json.dumps(self.verdict(self.feedback_text(texts[0]), body.get("model")))
+
+    @staticmethod
+    def feedback_text(text: str) -> str:
+        """Texto do cliente dentro do bloco (depois de ID e instruções da loja)"""
+        marker = "FEEDBACK DO CLIENTE:\n"
+        return text.split(marker, 1)[1] if marker in text else text
+
+    def cached_prefix_tokens(self, body: dict) -> int:
+        """Imita o cache de prompt da OpenAI: prefixo (system + formato) igual a um já visto, com 1024+ tokens"""
+        system = [message for message in body["messages"] if message["role"] == "system"]
+        prefix = json.dumps([system, body.get("response_format")], ensure_ascii=False, sort_keys=True)
+        tokens = len(prefix) // 4
+        if prefix in self.seen_prefixes:
+            return tokens if tokens >= 1024 else 0
+        self.seen_prefixes.add(prefix)
+        return 0
+
+    async def _completions(self, request: web.Request) -> web.Response:
+        self.calls += 1
+        body = await request.json()
+        await asyncio.sleep(self.latency * self.random.uniform(0.8, 1.2))
+        if time.monotonic() < self.outage_until:
+            self.errors += 1
+            return web.json_response({"error": {"message": "Fora do ar", "type": "server_error"}}, status=503)
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.errors += 1
+            return web.json_response({"error": {"message": "Erro simulado", "type": "server_error"}}, status=500)
+
+        content = self.answer(body)
+        prompt_tokens = len(json.dumps(body["messages"], ensure_ascii=False)) // 4
+        cached_tokens = self.cached_prefix_tokens(body)
+        completion_tokens = len(content) // 4
+        self.prompt_tokens += prompt_tokens
+        self.cached_tokens += cached_tokens
+        self.completion_tokens += completion_tokens
+        return web.json_response({
+            "id": f"chatcmpl-{self.calls}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": cached_tokens},
+            },
+        })
+
+    async def _cdn(self, request: web.Request) -> web.Response:
+        self.cdn_calls += 1
+        return web.Response(body=self.image, content_type="image/png")
+
+    async def _discord_member(self, request: web.Request) -> web.Response:
+        self.discord_calls += 1
+        return web.json_response({"user": {"id": request.match_info["user_id"]}}, headers={
+            "X-RateLimit-Bucket": "mock-members",
+            "X-RateLimit-Remaining": "9",
+            "X-RateLimit-Reset-After": "1.0",
+        })
+
+
+# ==================== CENÁRIOS ====================
+
+async def _run_concurrent(n: int, latency: float, blocking: bool) -> float:
+    main.openai_client = FakeOpenAIClient(latency, blocking)
+    main.ai_semaphore = asyncio.Semaphore(n)
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        main.analyze_feedback_with_ai(f"Feedback de teste {i}") for i in range(n)
+    ])
+    elapsed = time.perf_counter() - start
+    main.openai_client = None
+    return elapsed
+
+
+async def bench_concurrency(n: int, latency: float):
+    """N mensagens concorrentes: cliente bloqueante vs cliente assíncrono compartilhado"""
+    blocking = await _run_concurrent(n, latency, blocking=True)
+    non_blocking = await _run_concurrent(n, latency, blocking=False)
+
+    print(f"{'=' * 50}")
+    print(f"📊 {n} mensagens concorrentes, latência da IA = {latency:.2f}s")
+    print(f"   • Cliente bloqueante:  {blocking:.2f}s ({blocking / latency:.1f}x uma chamada)")
+    print(f"   • Cliente assíncrono:  {non_blocking:.2f}s ({non_blocking / latency:.1f}x uma chamada)")
+    print(f"{'=' * 50}")
+
+
+async def _sequential_actions(message, classification: str, reason: str, confidence: float):
+    """Cadeia antiga: excluir → silenciar → avisar → relatório, um após o outro"""
+    started = time.perf_counter()
+    leader = await main.resolve_leader(message.guild)
+    await main.delete_message_safely(message)
+    time_to_delete = time.perf_counter() - started
+    member = message.guild.get_member(message.author.id)
+    await main.timeout_user(member, main.TIMEOUT_NEGATIVO_DURATION, "benchmark")
+    await main.send_user_warning(message.author, classification)
+    await main.send_leader_report(leader, [main.build_incident(message, classification, reason, confidence)])
+    return time_to_delete, time.perf_counter() - started
+
+
+async def bench_actions(rest_latency: float):
+    """Tempo até a exclusão e tempo total: cadeia sequencial vs executor de ações"""
+    args = ("NEGATIVO", "benchmark", 0.9)
+
+    seq_delete, seq_total = await _sequential_actions(make_fake_scenario(rest_latency), *args)
+
+    started = time.monotonic()
+    outcome = await main.execute_moderation_actions(
+        make_fake_scenario(rest_latency), *args,
+        timeout_duration=main.TIMEOUT_NEGATIVO_DURATION, timeout_reason="benchmark", started=started
+    )
+
+    print(f"{'=' * 50}")
+    print(f"📊 Ações de moderação (NEGATIVO), latência REST = {rest_latency * 1000:.0f}ms")
+    print(f"   • Sequencial: exclusão em {seq_delete * 1000:.0f}ms | total {seq_total * 1000:.0f}ms")
+    print(f"   • Executor:   exclusão em {outcome['tempo_ate_exclusao'] * 1000:.0f}ms | total {outcome['tempo_total'] * 1000:.0f}ms")
+    print(f"{'=' * 50}")
+
+
+async def bench_reports(incidents: int, window: float, max_incidents: int):
+    """Mensagens enviadas ao líder: uma por incidente vs resumos agrupados"""
+    messages = [make_fake_scenario(0.0, "O suporte demora", message_id=i) for i in range(incidents)]
+    leader = messages[0].guild.get_member(main.LEADER_ID)
+    for message in messages:
+        message.guild.members[main.LEADER_ID] = leader
+
+    reporter = main.LeaderReporter(window=window, max_incidents=max_incidents, escalation_confidence=0.85)
+    await reporter.start()
+    for message in messages:
+        await reporter.report(main.build_incident(message, "POSSO_PERDER_CLIENTE", "benchmark", 0.8))
+    await reporter.stop()
+
+    print(f"{'=' * 50}")
+    print(f"📊 {incidents} incidentes")
+    print(f"   • Antes (1 relatório + até 3 anexos por incidente): {incidents}-{incidents * 4} DMs")
+    print(f"   • Resumos (janela {window:.0f}s, máx. {max_incidents}): {len(leader.dms)} DMs")
+    print(f"{'=' * 50}")
+
+
+def load_corpus(path: str) -> list:
+    """Lê um corpus JSONL ({"texto", "imagens", "rotulo"} por linha; opcionais "editar_para", "rotulo_edicao")"""
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+async def bench_replay(args):
+    """Reproduz um corpus pelo pipeline completo com Discord e OpenAI falsos"""
+    corpus = load_corpus(args.corpus)
+    labels = {main.normalize_feedback_text(item.get("texto", "")): item["rotulo"] for item in corpus}
+    labels.update({
+        main.normalize_feedback_text(item["editar_para"]): item["rotulo_edicao"]
+        for item in corpus if item.get("editar_para") and item.get("rotulo_edicao")
+    })
+    rng = random.Random(args.seed)
+
+    server = MockOpenAIServer(args.latencia_ia, args.erro_ia, labels, seed=args.seed, outage=args.queda_ia)
+    base_url = await server.start()
+    main.openai_client = main.openai.AsyncOpenAI(api_key="benchmark", base_url=f"{base_url}/v1", max_retries=0)
+    for backend in main.ai_router.backends:
+        backend.breaker.cooldown = args.cooldown_ia
+    main.held_messages.retry_interval = args.cooldown_ia
+    main.DISCORD_API_BASE = f"{base_url}/discord"
+    main.edit_tracker.debounce = args.debounce
+    main.AI_BATCH_ENABLED = args.lote
+    main.classification_batcher.window = args.janela_lote / 1000
+    main.classification_batcher.max_size = args.max_lote
+
+    rest = FakeRest(args.latencia_rest, args.erro_rest, seed=args.seed)
+    leader = FakeUser(main.LEADER_ID, "lider", rest=rest)
+    authors = [FakeUser(10_000 + i, f"usuario{i}", rest=rest) for i in range(args.autores or args.mensagens)]
+    guild = FakeGuild(main.GUILD_ID, [leader, *authors])
+
+    # Mensagens a reproduzir (o corpus é repetido até completar --mensagens)
+    messages = []
+    for i in range(args.mensagens):
+        item = corpus[i % len(corpus)]
+        attachments = [
+            FakeAttachment(i * 10 + k, f"{base_url}/cdn/{i}-{k}.png", len(server.image))
+            for k in range(item.get("imagens", 0))
+        ]
+        message = FakeMessage(i + 1, item.get("texto", ""), authors[i % len(authors)], guild,
+                              main.FEEDBACK_CHANNEL_ID, attachments=attachments, rest=rest)
+        edit_to = item.get("editar_para")
+        if edit_to is None and rng.random() < args.edicoes:
+            edit_to = message.content + " !!"
+        messages.append((message, edit_to))
+
+    # Mensagens "enviadas com o bot fora do ar": não chegam ao vivo, só pelo histórico do canal
+    missed = [message for message, _ in messages if rng.random() < args.perdidas]
+    missed_ids = {message.id for message in missed}
+    history_channel = FakeChannel(main.FEEDBACK_CHANNEL_ID, rest, messages=missed)
+    main.catch_up.max_age = 0
+    main.catch_up.concurrency = args.concorrencia_recuperacao
+    main.coupon_dispatcher.send_interval = args.intervalo_cupom
+    if args.sombra > 0:
+        # Candidato falso: mesmo servidor, preços de um modelo mini e uma fração de respostas diferentes
+        server.model_noise["candidato-mini"] = args.ruido_sombra
+        main.shadow_classifier = main.ShadowClassifier(
+            model="candidato-mini", prompt=main.ANALYSIS_PROMPT, sample_rate=args.sombra, max_pending=50,
+            max_concurrency=2, prices=(0.15, 0.075, 0.60), report_interval=0
+        )
+
+    # Marca o fim do processamento de cada mensagem
+    submitted, finished = {}, {}
+    analyzed = Counter()
+    original_process = main.process_feedback_message
+
+    async def traced_process(message, is_edit=False, *process_args, **kwargs):
+        outcome = await original_process(message, is_edit, *process_args, **kwargs)
+        finished[(message.id, is_edit)] = time.perf_counter()
+        analyzed[(message.id, is_edit)] += 1
+        return outcome
+
+    main.process_feedback_message = traced_process
+    state_dir = tempfile.TemporaryDirectory()
+    main.moderation_store.db_path = os.path.join(state_dir.name, "moderacao.db")
+    await main.classification_cache.open()
+    await main.moderation_store.start()
+    await main.leader_reporter.start()
+    await main.moderation_queue.start()
+    await main.held_messages.start()
+    await main.coupon_dispatcher.start()
+
+    # "Gateway" falso: entrega os eventos na taxa configurada
+    async def deliver(message, edit_to, delay):
+        await asyncio.sleep(delay)
+        submitted[(message.id, False)] = time.perf_counter()
+        main.catch_up.note_live(message)
+        main.moderation_store.open_message(message)
+        await main.flood_guard.admit(message)
+        if edit_to is not None:
+            await asyncio.sleep(args.atraso_edicao)
+            submitted[(message.id, True)] = time.perf_counter()
+            await main.edit_tracker.handle_edit(message, message.edited(edit_to))
+
+    # Reconexão no meio do tráfego: novo on_ready lê o histórico com mensagens ao vivo ainda em análise
+    async def reconnect(delay):
+        await asyncio.sleep(delay)
+        while main.catch_up.running:
+            await asyncio.sleep(0.05)
+        history_channel.messages = [message for message, _ in messages if (message.id, False) in submitted]
+        main.catch_up.schedule([history_channel])
+
+    started = time.perf_counter()
+    if missed or args.reconexao > 0:
+        main.moderation_store.checkpoints[main.FEEDBACK_CHANNEL_ID] = 0
+    if missed:
+        for message in missed:
+            submitted[(message.id, False)] = started
+        main.catch_up.schedule([history_channel])
+    await asyncio.gather(*[
+        deliver(message, edit_to, i / args.taxa if args.taxa > 0 else 0.0)
+        for i, (message, edit_to) in enumerate(messages) if message.id not in missed_ids
+    ], *([reconnect(args.reconexao)] if args.reconexao > 0 else []))
+    while (main.edit_tracker.pending or main.flood_guard.bursts or main.flood_guard.tasks
+           or main.moderation_queue.queue.qsize() or main.moderation_queue.busy_workers
+           or main.held_messages.jobs or main.catch_up.running or main.coupon_dispatcher.pending):
+        await asyncio.sleep(0.05)
+    await main.moderation_queue.queue.join()
+    elapsed = time.perf_counter() - started
+
+    await main.coupon_dispatcher.stop()
+    await main.held_messages.stop()
+    await main.moderation_queue.stop()
+    await main.leader_reporter.stop()
+    await main.moderation_store.stop()
+    state_dir.cleanup()
+    await main.close_openai_client()
+    await main.close_http_sessions()
+    await server.stop()
+    main.process_feedback_message = original_process
+
+    # Relatório
+    new_latencies = [finished[key] - submitted[key] for key in finished if not key[1] and key in submitted]
+    edit_latencies = [finished[key] - submitted[key] for key in finished if key[1] and key in submitted]
+    delete_times = [
+        message.deleted_at - submitted[(message.id, False)]
+        for message, _ in messages if message.deleted_at and (message.id, False) in submitted
+    ]
+    processed = len(finished)
+    rest_calls = sum(rest.calls.values()) + server.discord_calls
+    ai_calls = server.calls
+
+    print(f"{'=' * 60}")
+    print(f"📊 Replay: {len(messages)} mensagens ({args.corpus}), {len(edit_latencies)} edições reanalisadas")
+    print(f"   • IA: latência {args.latencia_ia:.2f}s, erro {args.erro_ia * 100:.0f}% | "
+          f"REST: latência {args.latencia_rest * 1000:.0f}ms, erro {args.erro_rest * 100:.0f}%")
+    print(f"   • Vazão: {processed / elapsed:.1f} análises/s ({processed} em {elapsed:.2f}s)")
+    print(f"   • Latência fim a fim: p50 {main.percentile(new_latencies, 50) * 1000:.0f}ms | "
+          f"p99 {main.percentile(new_latencies, 99) * 1000:.0f}ms")
+    if edit_latencies:
+        print(f"   • Latência das edições (após debounce de {args.debounce:.2f}s): "
+              f"p50 {main.percentile(edit_latencies, 50) * 1000:.0f}ms | "
+              f"{main.edit_tracker.stats()['removed']} ignorada(s) (mensagem já excluída)")
+    if delete_times:
+        print(f"   • Tempo até exclusão ({len(delete_times)} excluídas): "
+              f"p50 {main.percentile(delete_times, 50) * 1000:.0f}ms | "
+              f"p99 {main.percentile(delete_times, 99) * 1000:.0f}ms")
+    print(f"   • Chamadas por mensagem: IA {ai_calls / len(messages):.2f} ({server.errors} erros) | "
+          f"CDN {server.cdn_calls / len(messages):.2f} | REST {rest_calls / len(messages):.2f} "
+          f"({', '.join(f'{kind}={n}' for kind, n in sorted(rest.calls.items()))}, api={server.discord_calls})")
+    if missed:
+        live_latencies = [
+            finished[key] - submitted[key] for key in finished
+            if not key[1] and key in submitted and key[0] not in missed_ids
+        ]
+        catch_up_stats = main.catch_up.stats()
+        print(f"   • Recuperação: {catch_up_stats['recovered']} de {len(missed)} perdidas | "
+              f"{catch_up_stats['yields']} pausa(s) p/ tráfego ao vivo | latência ao vivo p50 "
+              f"{main.percentile(live_latencies, 50) * 1000:.0f}ms")
+    if args.sombra > 0:
+        while main.shadow_classifier.tasks:
+            await asyncio.sleep(0.05)
+        shadow_stats = main.shadow_classifier.stats()
+        print(f"   • Modo sombra: {shadow_stats['compared']} comparadas, concordância "
+              f"{shadow_stats['agreed'] / max(shadow_stats['compared'], 1) * 100:.1f}% | p50 IA "
+              f"{shadow_stats['primary_p50'] * 1000:.0f}ms x {shadow_stats['candidate_p50'] * 1000:.0f}ms | "
+              f"custo/1000 US$ {shadow_stats['primary_cost']:.3f} x {shadow_stats['candidate_cost']:.3f}")
+    coupon_stats = main.coupon_dispatcher.stats()
+    print(f"   • Cupons: {coupon_stats['sent']} enviados | {coupon_stats['deduped']} repetidos (mesmo usuário) | "
+          f"{coupon_stats['yields']} pausa(s) p/ moderação | {coupon_stats['forced']} após a espera máxima")
+    held_stats = main.held_messages.stats()
+    if held_stats["held"]:
+        print(f"   • IA indisponível: {held_stats['held']} mensagem(ns) guardada(s), "
+              f"{held_stats['released']} reanalisada(s), {held_stats['dropped']} perdida(s), "
+              f"{held_stats['reviews']} para revisão | "
+              f"circuito aberto {sum(main.metrics.counters_by('feedback_ai_breaker_trips_total', 'modelo').values()):.0f}x")
+    print(f"   • Tokens (estimados): prompt {server.prompt_tokens} ({server.cached_tokens} em cache) | "
+          f"resposta {server.completion_tokens}")
+    if args.lote:
+        batch_stats = main.classification_batcher.stats()
+        print(f"   • Lotes: {batch_stats['batches']} chamadas, média {batch_stats['avg_size']:.1f} mensagens "
+              f"(janela {args.janela_lote}ms, máx {args.max_lote}) | reenviadas sozinhas: {batch_stats['fallbacks']}")
+    flood_stats = main.flood_guard.stats()
+    print(f"   • Flood: {flood_stats['collapsed']} mensagens agrupadas em {flood_stats['bursts']} rajada(s) | "
+          f"{flood_stats['direct_deletes']} excluídas sem análise (autor silenciado)")
+    store_stats = main.moderation_store.stats()
+    print(f"   • Histórico: {store_stats['written']} linhas gravadas em lote | "
+          f"reincidentes: {store_stats['repeat_offenders']}")
+    print(f"   • Descartadas pela fila: {main.moderation_queue.shed}")
+    duplicated = sum(1 for key, count in analyzed.items() if not key[1] and count > 1)
+    if args.reconexao > 0 or duplicated:
+        print(f"   • Reconexão: {main.catch_up.runs} leitura(s) do histórico | "
+              f"{duplicated} mensagem(ns) moderada(s) mais de uma vez")
+    print(f"{'=' * 60}")
+
+
+def bench_preclassifier(corpus_path: str):
+    """Taxa de escalonamento e concordância do pré-classificador local com os rótulos da IA"""
+    corpus = load_corpus(corpus_path)
+    classifier = main.LocalPreClassifier.from_config(main.LEXICON_PATH, main.LOCAL_MODEL_PATH, main.LOCAL_MODEL_THRESHOLD)
+
+    agreements = 0
+    per_class = {}
+    disagreements = []
+    start = time.perf_counter()
+    for item in corpus:
+        result = classifier.classify(item.get("texto", ""), item.get("imagens", 0))
+        if result is None:
+            continue
+        label = item["rotulo"]
+        decided, agreed = per_class.get(result["classificacao"], (0, 0))
+        if result["classificacao"] == label:
+            agreements += 1
+            agreed += 1
+        else:
+            disagreements.append((item.get("texto", ""), result["classificacao"], label))
+        per_class[result["classificacao"]] = (decided + 1, agreed)
+    elapsed = time.perf_counter() - start
+
+    stats = classifier.stats()
+    decided = stats["decided"]
+    print(f"{'=' * 50}")
+    print(f"📊 Pré-classificador local - {len(corpus)} mensagens ({corpus_path})")
+    print(f"   • Decididas localmente: {decided} | Escaladas para a IA: {stats['escalated']}")
+    print(f"   • Taxa de escalonamento: {stats['escalation_rate'] * 100:.1f}%")
+    print(f"   • Concordância com a IA: {agreements}/{decided} ({agreements / decided * 100 if decided else 0:.1f}%)")
+    for classification, (count, agreed) in sorted(per_class.items()):
+        print(f"     - {classification}: {agreed}/{count}")
+    print(f"   • Tempo médio por mensagem: {elapsed / max(len(corpus), 1) * 1e6:.1f}µs")
+    for text, got, expected in disagreements:
+        print(f"   ❌ \"{text[:60]}\": local={got}, IA={expected}")
+    print(f"{'=' * 50}")
+
+
+async def bench_evaluation(corpus_path: str, concurrency: int, ai_latency: float, noise: float, seed: int = 42):
+    """Avaliação com exemplos rotulados (!avaliar): um por vez vs pool concorrente, com a IA falsa"""
+    corpus = load_corpus(corpus_path)
+    items = [
+        {"texto": item.get("texto", ""), "rotulo": item["rotulo"], "imagens": []}
+        for item in corpus if item.get("texto")
+    ]
+    # A IA falsa erra uma fração dos rótulos, para a matriz de confusão não ficar trivial
+    rng = random.Random(seed)
+    labels = {}
+    for item in items:
+        label = item["rotulo"]
+        if rng.random() < noise:
+            label = rng.choice([other for other in main.EVALUATION_LABELS if other != label])
+        labels[main.normalize_feedback_text(item["texto"])] = label
+
+    server = MockOpenAIServer(ai_latency, 0.0, labels, seed=seed)
+    base_url = await server.start()
+    main.openai_client = main.openai.AsyncOpenAI(api_key="benchmark", base_url=f"{base_url}/v1", max_retries=0)
+    sequential = await main.evaluate_labeled_feedback(items, concurrency=1)
+    concurrent = await main.evaluate_labeled_feedback(items, concurrency=concurrency)
+    await main.close_openai_client()
+    await server.stop()
+
+    print(f"{'=' * 60}")
+    print(f"📊 Avaliação de {len(items)} exemplos ({corpus_path}), latência da IA = {ai_latency:.2f}s")
+    print(f"   • Um por vez:       {sequential['duracao']:.2f}s")
+    print(f"   • {concurrency} por vez:       {concurrent['duracao']:.2f}s "
+          f"({sequential['duracao'] / max(concurrent['duracao'], 1e-9):.1f}x mais rápido)")
+    print(f"{'-' * 60}")
+    print(main.format_evaluation_report(concurrent))
+    print(f"{'=' * 60}")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Benchmarks do bot de moderação")
+    sub = parser.add_subparsers(dest="cenario", required=True)
+
+    conc = sub.add_parser("concorrencia", help="Classificações concorrentes")
+    conc.add_argument("--mensagens", type=int, default=20)
+    conc.add_argument("--latencia", type=float, default=1.0)
+
+    pre = sub.add_parser("preclassificador", help="Relatório do pré-classificador local")
+    pre.add_argument("--corpus", default="corpus_feedback.jsonl")
+
+    acoes = sub.add_parser("acoes", help="Tempo até a exclusão e tempo total das ações")
+    acoes.add_argument("--latencia-rest", type=float, default=0.15)
+
+    rel = sub.add_parser("relatorios", help="DMs enviadas ao líder com resumos agrupados")
+    rel.add_argument("--incidentes", type=int, default=50)
+    rel.add_argument("--janela", type=float, default=60.0)
+    rel.add_argument("--max", type=int, default=10)
+
+    aval = sub.add_parser("avaliacao", help="Avaliação com exemplos rotulados: um por vez vs concorrente")
+    aval.add_argument("--corpus", default="corpus_feedback.jsonl")
+    aval.add_argument("--concorrencia", type=int, default=8)
+    aval.add_argument("--latencia-ia", type=float, default=0.5)
+    aval.add_argument("--ruido", type=float, default=0.1, help="Fração de respostas erradas da IA falsa")
+
+    rep = sub.add_parser("replay", help="Reproduz um corpus pelo pipeline completo (Discord/OpenAI falsos)")
+    rep.add_argument("--corpus", default="corpus_feedback.jsonl")
+    rep.add_argument("--mensagens", type=int, default=100, help="Mensagens a reproduzir (repete o corpus)")
+    rep.add_argument("--taxa", type=float, default=20.0, help="Mensagens por segundo (0 = todas de uma vez)")
+    rep.add_argument("--autores", type=int, default=0, help="Autores distintos (0 = um por mensagem)")
+    rep.add_argument("--edicoes", type=float, default=0.1, help="Fração de mensagens editadas")
+    rep.add_argument("--atraso-edicao", type=float, default=0.5, help="Segundos entre a mensagem e a edição")
+    rep.add_argument("--debounce", type=float, default=0.5, help="Debounce das edições (segundos)")
+    rep.add_argument("--latencia-ia", type=float, default=1.0)
+    rep.add_argument("--erro-ia", type=float, default=0.0, help="Fração de respostas HTTP 500 da IA")
+    rep.add_argument("--perdidas", type=float, default=0.0,
+                     help="Fração de mensagens enviadas com o bot fora (chegam só pela recuperação)")
+    rep.add_argument("--concorrencia-recuperacao", type=int, default=4, help="BACKFILL_CONCURRENCY")
+    rep.add_argument("--reconexao", type=float, default=0.0,
+                     help="Segundos até uma reconexão (nova recuperação com mensagens ao vivo em análise; 0 = não)")
+    rep.add_argument("--intervalo-cupom", type=float, default=0.0, help="COUPON_SEND_INTERVAL (segundos)")
+    rep.add_argument("--sombra", type=float, default=0.0, help="Fração das mensagens comparadas no modo sombra")
+    rep.add_argument("--ruido-sombra", type=float, default=0.1, help="Fração de respostas diferentes do candidato")
+    rep.add_argument("--queda-ia", type=float, default=0.0, help="Segundos iniciais com a IA fora do ar (HTTP 503)")
+    rep.add_argument("--cooldown-ia", type=float, default=2.0, help="Cooldown do circuit breaker e reteste (segundos)")
+    rep.add_argument("--latencia-rest", type=float, default=0.1)
+    rep.add_argument("--erro-rest", type=float, default=0.0, help="Fração de chamadas REST com erro")
+    rep.add_argument("--lote", action="store_true", help="Classifica em lote (AI_BATCH_ENABLED)")
+    rep.add_argument("--janela-lote", type=int, default=250, help="Janela do lote em ms")
+    rep.add_argument("--max-lote", type=int, default=8, help="Mensagens por chamada no modo em lote")
+    rep.add_argument("--seed", type=int, default=42)
+
+    args = parser.parse_args()
+    main.setup_logging(os.getenv("LOG_LEVEL", "WARNING"))
+    if args.cenario == "concorrencia":
+        asyncio.run(bench_concurrency(args.mensagens, args.latencia))
+    elif args.cenario == "preclassificador":
+        bench_preclassifier(args.corpus)
+    elif args.cenario == "acoes":
+        asyncio.run(bench_actions(args.latencia_rest))
+    elif args.cenario == "relatorios":
+        asyncio.run(bench_reports(args.incidentes, args.janela, args.max))
+    elif args.cenario == "avaliacao":
+        asyncio.run(bench_evaluation(args.corpus, args.concorrencia, args.latencia_ia, args.ruido))
+    elif args.cenario == "replay":
+        asyncio.run(bench_replay(args))
+
+
+if __name__ == "__main__":
+    main_cli()
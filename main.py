@@ -3,11 +3,37 @@ from discord.ext import commands
 import openai
 import os
 import asyncio
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 import base64
 import aiohttp
 import json
+import time
+import hashlib
+import sqlite3
+import threading
+import unicodedata
+import re
+import difflib
+import logging
+import logging.handlers
+import queue
+import bisect
+import random
+import signal
+import argparse
+import csv
+import io
+import sys
+from collections import Counter, OrderedDict, deque
+from io import BytesIO
+from aiohttp import web
+
+# Pillow é opcional: sem ele as imagens vão para a IA sem redimensionar
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
 
 # Carrega variáveis de ambiente
 load_dotenv()
@@ -18,455 +44,4438 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 LEADER_ID = int(os.getenv("LEADER_ID", "0"))  # Configurar no .env
 FEEDBACK_CHANNEL_ID = int(os.getenv("FEEDBACK_CHANNEL_ID", "0"))  # Configurar no .env
 GUILD_ID = int(os.getenv("GUILD_ID", "0"))  # Configurar no .env
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o")  # Modelo usado na classificação
+AI_FALLBACK_MODEL = os.getenv("AI_FALLBACK_MODEL", "")  # Modelo mais barato usado se o principal falhar (vazio = nenhum)
+# Preço por milhão de tokens (USD), usado nas estimativas de custo da avaliação
+AI_PRICE_PROMPT = float(os.getenv("AI_PRICE_PROMPT", "2.50"))  # Tokens de prompt
+AI_PRICE_CACHED_PROMPT = float(os.getenv("AI_PRICE_CACHED_PROMPT", "1.25"))  # Tokens de prompt do cache da OpenAI
+AI_PRICE_COMPLETION = float(os.getenv("AI_PRICE_COMPLETION", "10.00"))  # Tokens de resposta
+# Formato da resposta: "json_schema" (saída estruturada) ou "json_object" (modelos sem suporte a schema)
+AI_RESPONSE_FORMAT = os.getenv("AI_RESPONSE_FORMAT", "json_schema").lower()
 
 # Tempos de silenciamento
 # POSSO_PERDER_CLIENTE = 1 hora, NEGATIVO = 1 dia
 TIMEOUT_MEDIO_DURATION = timedelta(hours=1)  # 1 hora
 TIMEOUT_NEGATIVO_DURATION = timedelta(days=1)  # 1 dia
 
+# Loja (usados quando não há CHANNELS_CONFIG_PATH)
+STORE_NAME = os.getenv("STORE_NAME", "Blazerd Store")  # Nome da loja nos avisos
+STORE_URL = os.getenv("STORE_URL", "https://blazerdstore.com/")  # Link enviado com o cupom
+COUPON_CODE = os.getenv("COUPON_CODE", "E9GSMSBS")  # Cupom de 5% para feedbacks positivos
+
+# Vários servidores/canais: JSON com líder, silenciamentos, cupom e prompt de cada canal
+CHANNELS_CONFIG_PATH = os.getenv("CHANNELS_CONFIG_PATH", "")  # Vazio = um canal, pelas variáveis acima
+
+# Shards: "" (sem shards), "auto" (o Discord decide) ou o número total de shards
+SHARD_COUNT = os.getenv("SHARD_COUNT", "").strip().lower()
+SHARD_IDS = os.getenv("SHARD_IDS", "")  # Shards deste processo, separados por vírgula (vazio = todos)
+
+# Fila de moderação
+# Os eventos do Discord apenas enfileiram; um pool de workers faz a análise
+QUEUE_WORKERS = int(os.getenv("QUEUE_WORKERS", "4"))  # Workers que processam a fila
+QUEUE_MAX_SIZE = int(os.getenv("QUEUE_MAX_SIZE", "100"))  # Tamanho máximo da fila
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "4"))  # Chamadas simultâneas à OpenAI
+# Política com fila cheia: "defer" (espera vaga), "shed" (descarta) ou "cheap" (classificação local)
+QUEUE_FULL_POLICY = os.getenv("QUEUE_FULL_POLICY", "defer").lower()
+QUEUE_DEFER_TIMEOUT = float(os.getenv("QUEUE_DEFER_TIMEOUT", "30"))  # Segundos esperando vaga (defer)
+
+# Resiliência da IA
+# Prazo por chamada, retentativas com jitter em 429/5xx e circuit breaker por modelo
+AI_TIMEOUT = float(os.getenv("AI_TIMEOUT", "10"))  # Prazo de cada tentativa (segundos)
+AI_DEADLINE = float(os.getenv("AI_DEADLINE", "25"))  # Prazo total da classificação, com retentativas e fallback
+AI_MAX_RETRIES = int(os.getenv("AI_MAX_RETRIES", "2"))  # Retentativas por modelo em 429/5xx/timeout
+AI_RETRY_BASE_DELAY = float(os.getenv("AI_RETRY_BASE_DELAY", "0.5"))  # Base do backoff exponencial (segundos)
+AI_BREAKER_FAILURES = int(os.getenv("AI_BREAKER_FAILURES", "5"))  # Falhas seguidas que abrem o circuito
+AI_BREAKER_COOLDOWN = float(os.getenv("AI_BREAKER_COOLDOWN", "30"))  # Segundos com o circuito aberto antes de testar
+HOLD_MAX = int(os.getenv("HOLD_MAX", "500"))  # Mensagens guardadas para reanálise quando a IA está fora
+HOLD_RETRY_INTERVAL = float(os.getenv("HOLD_RETRY_INTERVAL", "30"))  # Segundos entre tentativas de liberar as guardadas
+HOLD_MAX_ATTEMPTS = int(os.getenv("HOLD_MAX_ATTEMPTS", "5"))  # Análises sem veredito antes de pedir revisão ao líder
+
+# Lotes de classificação
+# Mensagens que chegam dentro da janela vão juntas em uma única chamada à IA
+AI_BATCH_ENABLED = os.getenv("AI_BATCH_ENABLED", "false").lower() in ("1", "true", "sim", "yes")
+AI_BATCH_WINDOW_MS = int(os.getenv("AI_BATCH_WINDOW_MS", "250"))  # Janela de espera para formar o lote
+AI_BATCH_MAX_SIZE = int(os.getenv("AI_BATCH_MAX_SIZE", "8"))  # Máximo de mensagens por chamada
+
+# Controle de flood
+# Limite por usuário (token bucket); o excesso de uma rajada é agrupado em uma única análise
+FLOOD_BURST = int(os.getenv("FLOOD_BURST", "3"))  # Mensagens seguidas analisadas uma a uma (0 = sem limite)
+FLOOD_RATE_PER_MINUTE = float(os.getenv("FLOOD_RATE_PER_MINUTE", "6"))  # Reposição do limite por minuto
+FLOOD_COLLAPSE_WINDOW = float(os.getenv("FLOOD_COLLAPSE_WINDOW", "5"))  # Segundos juntando o excesso da rajada
+FLOOD_COLLAPSE_MAX = min(int(os.getenv("FLOOD_COLLAPSE_MAX", "20")), 100)  # Mensagens por grupo (bulk delete: 100)
+
+# Cache de entidades do Discord
+# Líderes (canal de DM), membros e servidores resolvidos uma vez e reaproveitados
+MEMBER_CACHE_MAX = int(os.getenv("MEMBER_CACHE_MAX", "5000"))  # Membros buscados via API mantidos em memória
+
+# Modo sombra
+# Uma amostra das mensagens também vai para um classificador candidato, fora do caminho crítico
+SHADOW_MODEL = os.getenv("SHADOW_MODEL", "")  # Modelo candidato (vazio = OPENAI_MODEL, se houver SHADOW_PROMPT_PATH)
+SHADOW_PROMPT_PATH = os.getenv("SHADOW_PROMPT_PATH", "")  # Arquivo com o prompt candidato (vazio = ANALYSIS_PROMPT)
+SHADOW_SAMPLE_RATE = float(os.getenv("SHADOW_SAMPLE_RATE", "0.1"))  # Fração das mensagens comparadas
+SHADOW_MAX_CONCURRENCY = int(os.getenv("SHADOW_MAX_CONCURRENCY", "2"))  # Chamadas simultâneas ao candidato
+SHADOW_MAX_PENDING = int(os.getenv("SHADOW_MAX_PENDING", "50"))  # Comparações em andamento (acima disso, pula)
+SHADOW_PRICE_PROMPT = float(os.getenv("SHADOW_PRICE_PROMPT", str(AI_PRICE_PROMPT)))  # Preços do candidato (USD/1M)
+SHADOW_PRICE_CACHED_PROMPT = float(os.getenv("SHADOW_PRICE_CACHED_PROMPT", str(AI_PRICE_CACHED_PROMPT)))
+SHADOW_PRICE_COMPLETION = float(os.getenv("SHADOW_PRICE_COMPLETION", str(AI_PRICE_COMPLETION)))
+SHADOW_REPORT_HOURS = float(os.getenv("SHADOW_REPORT_HOURS", "24"))  # Horas entre os resumos ao líder (0 = sem resumo)
+
+# Avaliação (!avaliar / python main.py avaliar)
+EVAL_CONCURRENCY = int(os.getenv("EVAL_CONCURRENCY", "8"))  # Exemplos classificados ao mesmo tempo
+EVAL_MAX_ITEMS = int(os.getenv("EVAL_MAX_ITEMS", "2000"))  # Exemplos aceitos por arquivo
+EVAL_MAX_CONCURRENCY = int(os.getenv("EVAL_MAX_CONCURRENCY", "16"))  # Teto da concorrência pedida no !avaliar
+
+# Cupons por DM
+# Enviados com prioridade baixa: um por usuário no período, cedendo a vez à moderação
+COUPON_DEDUPE_HOURS = float(os.getenv("COUPON_DEDUPE_HOURS", "24"))  # Período sem repetir o cupom ao mesmo usuário
+COUPON_QUEUE_MAX = int(os.getenv("COUPON_QUEUE_MAX", "1000"))  # DMs de cupom aguardando envio
+COUPON_SEND_INTERVAL = float(os.getenv("COUPON_SEND_INTERVAL", "1"))  # Segundos entre DMs de cupom
+COUPON_MIN_HEADROOM = float(os.getenv("COUPON_MIN_HEADROOM", "0.5"))  # Folga mínima do rate limit global (0-1) para enviar
+COUPON_BUSY_QUEUE_DEPTH = int(os.getenv("COUPON_BUSY_QUEUE_DEPTH", "5"))  # Mensagens na fila de moderação que seguram os cupons
+COUPON_MAX_WAIT = float(os.getenv("COUPON_MAX_WAIT", "60"))  # Espera máxima de um cupom pela moderação (0 = sem limite)
+
+# Executor de ações
+ACTION_TIMEOUT = float(os.getenv("ACTION_TIMEOUT", "10"))  # Limite em segundos de cada ação (timeout, DM, relatório)
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "20"))  # Segundos para terminar a fila ao encerrar
+
+# Relatórios ao líder
+# Incidentes são agrupados em resumos; NEGATIVO com confiança alta é enviado na hora
+REPORT_DIGEST_WINDOW = float(os.getenv("REPORT_DIGEST_WINDOW", "60"))  # Segundos entre resumos (0 = envio imediato)
+REPORT_DIGEST_MAX = int(os.getenv("REPORT_DIGEST_MAX", "10"))  # Incidentes que forçam o envio do resumo
+REPORT_ESCALATION_CONFIDENCE = float(os.getenv("REPORT_ESCALATION_CONFIDENCE", "0.85"))  # NEGATIVO acima disso vai na hora
+
+# Edições
+# Edições triviais não são reanalisadas; edições em sequência viram uma única análise
+EDIT_DEBOUNCE = float(os.getenv("EDIT_DEBOUNCE", "5"))  # Segundos sem novas edições antes de analisar
+EDIT_SIMILARITY_THRESHOLD = float(os.getenv("EDIT_SIMILARITY_THRESHOLD", "0.9"))  # Similaridade para edição trivial
+EDIT_TRACK_MAX = int(os.getenv("EDIT_TRACK_MAX", "5000"))  # Mensagens com veredito guardado
+
+# Histórico de moderação
+# Vereditos, ações e tempos gravados em SQLite; reincidentes recebem punições progressivas
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", "moderacao.db")  # Arquivo SQLite do histórico (vazio = só memória)
+STATE_FLUSH_INTERVAL = float(os.getenv("STATE_FLUSH_INTERVAL", "2"))  # Segundos entre gravações em lote
+STATE_FLUSH_MAX = int(os.getenv("STATE_FLUSH_MAX", "200"))  # Linhas pendentes que forçam a gravação
+OFFENSE_WINDOW_DAYS = float(os.getenv("OFFENSE_WINDOW_DAYS", "30"))  # Infrações mais antigas não contam
+ESCALATION_FACTOR = float(os.getenv("ESCALATION_FACTOR", "2"))  # Silenciamento multiplicado a cada reincidência
+BAN_SUGGEST_AFTER = int(os.getenv("BAN_SUGGEST_AFTER", "3"))  # Infrações na janela para sugerir banimento (0 = nunca)
+
+# Recuperação de mensagens perdidas
+# Ao iniciar/reconectar, o histórico dos canais é lido a partir da última mensagem processada
+BACKFILL_ENABLED = os.getenv("BACKFILL_ENABLED", "true").lower() in ("1", "true", "sim", "yes")
+BACKFILL_MAX_MESSAGES = int(os.getenv("BACKFILL_MAX_MESSAGES", "500"))  # Mensagens lidas por canal a cada recuperação
+BACKFILL_MAX_AGE_HOURS = float(os.getenv("BACKFILL_MAX_AGE_HOURS", "24"))  # Mensagens mais antigas não são recuperadas (0 = sem limite)
+BACKFILL_CONCURRENCY = int(os.getenv("BACKFILL_CONCURRENCY", "4"))  # Mensagens recuperadas analisadas ao mesmo tempo
+
+# Cache de classificação
+# Mensagens repetidas (mesmo texto normalizado + mesmas imagens) reaproveitam o veredito
+CACHE_MAX_SIZE = int(os.getenv("CACHE_MAX_SIZE", "1000"))  # Entradas em memória (LRU)
+CACHE_TTL = float(os.getenv("CACHE_TTL", "86400"))  # Validade de cada entrada em segundos
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", "")  # Arquivo SQLite para persistir o cache (vazio = só memória)
+
+# Pré-processamento de imagens
+# Anexos são baixados, redimensionados e recebem um hash perceptual antes da IA
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(8 * 1024 * 1024)))  # Tamanho máximo baixado por anexo
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "1024"))  # Maior lado após redimensionar (pixels)
+IMAGE_DETAIL = os.getenv("IMAGE_DETAIL", "auto").lower()  # "auto" (escolhe pelo conteúdo), "low" ou "high"
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp')
+
+# Pré-classificador local
+# Decide casos óbvios (só imagem, só emoji, "ok", "é scam") sem chamar a IA
+PRECLASSIFIER_ENABLED = os.getenv("PRECLASSIFIER_ENABLED", "true").lower() in ("1", "true", "sim", "yes")
+LEXICON_PATH = os.getenv("LEXICON_PATH", "")  # JSON com o léxico (vazio = léxico padrão)
+LOCAL_MODEL_PATH = os.getenv("LOCAL_MODEL_PATH", "")  # Modelo local opcional (joblib, com predict_proba)
+LOCAL_MODEL_THRESHOLD = float(os.getenv("LOCAL_MODEL_THRESHOLD", "0.9"))  # Confiança mínima do modelo local
+
+# Observabilidade
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()  # DEBUG, INFO, WARNING, ERROR
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()  # "text" (legível) ou "json" (estruturado)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")  # Interface do endpoint /metrics
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))  # Porta do endpoint /metrics (0 = desativado)
+
+# ==================== LOGS ====================
+# Logs estruturados e não bloqueantes: os handlers escrevem numa fila e uma thread
+# (QueueListener) faz a escrita no stdout, fora do event loop.
+logger = logging.getLogger("moderador")
+
+
+def log_fields(**fields) -> dict:
+    """Campos estruturados para um log: logger.info("...", extra=log_fields(mensagem_id=...))"""
+    return {"fields": fields}
+
+
+class JsonLogFormatter(logging.Formatter):
+    """Uma linha JSON por log, com os campos estruturados"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            **getattr(record, "fields", {}),
+        }
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class TextLogFormatter(logging.Formatter):
+    """Formato legível: data, nível, mensagem e campos chave=valor"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s", "%Y-%m-%d %H:%M:%S")
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            text += " | " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return text
+
+
+def setup_logging(level: str = None) -> logging.handlers.QueueListener:
+    """Configura os logs (nível/formato do .env) com escrita fora do event loop"""
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(JsonLogFormatter() if LOG_FORMAT == "json" else TextLogFormatter())
+
+    root = logging.getLogger()
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+    root.setLevel(level or LOG_LEVEL)
+    logging.getLogger("discord").setLevel(max(logging.INFO, root.level))
+
+    listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+# ==================== MÉTRICAS ====================
+
+class Histogram:
+    """Histograma com buckets fixos (Prometheus) + amostras recentes para percentis"""
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=1000)
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.recent.append(value)
+
+    def percentile(self, p: float) -> float:
+        """Percentil (0-100) das amostras recentes"""
+        return percentile(self.recent, p)
+
+
+def percentile(values, p: float) -> float:
+    """Percentil (0-100) de uma lista de valores"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * p / 100), len(ordered) - 1)]
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32)
+
+
+class Metrics:
+    """Registro de contadores, histogramas e gauges, exportado no formato do Prometheus"""
+
+    def __init__(self):
+        self.counters: dict[tuple, float] = {}
+        self.histograms: dict[tuple, Histogram] = {}
+        self.gauges: dict[tuple, callable] = {}
+        self.help: dict[str, tuple[str, str]] = {}
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return (name, tuple(sorted(labels.items())))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """Incrementa um contador"""
+        key = self._key(name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, buckets: tuple = LATENCY_BUCKETS, **labels):
+        """Registra um valor em um histograma"""
+        key = self._key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(buckets)
+        histogram.observe(value)
+
+    def gauge(self, name: str, fn, **labels):
+        """Registra um gauge calculado na hora da leitura"""
+        self.gauges[self._key(name, labels)] = fn
+
+    def describe(self, name: str, kind: str, text: str):
+        """Tipo e descrição de uma métrica (linhas # TYPE / # HELP)"""
+        self.help[name] = (kind, text)
+
+    def counter(self, name: str, **labels) -> float:
+        """Valor atual de um contador"""
+        return self.counters.get(self._key(name, labels), 0)
+
+    def counters_by(self, name: str, label: str) -> dict:
+        """Soma de um contador agrupada por um rótulo"""
+        totals = {}
+        for (metric, labels), value in self.counters.items():
+            if metric == name:
+                group = dict(labels).get(label, "")
+                totals[group] = totals.get(group, 0) + value
+        return totals
+
+    def histogram(self, name: str, **labels) -> Histogram | None:
+        """Histograma de uma métrica (ou None se ainda não tem amostras)"""
+        return self.histograms.get(self._key(name, labels))
+
+    @staticmethod
+    def _labels(labels, extra: dict = None) -> str:
+        items = list(labels) + list((extra or {}).items())
+        if not items:
+            return ""
+        return "{" + ",".join(f'{k}="{str(v).replace(chr(34), chr(39))}"' for k, v in items) + "}"
+
+    def render_prometheus(self) -> str:
+        """Exporta todas as métricas no formato de texto do Prometheus"""
+        lines = []
+        described = set()
+
+        def header(name, kind):
+            if name not in described:
+                described.add(name)
+                kind, text = self.help.get(name, (kind, ""))
+                if text:
+                    lines.append(f"# HELP {name} {text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in sorted(self.counters.items()):
+            header(name, "counter")
+            lines.append(f"{name}{self._labels(labels)} {value}")
+        for (name, labels), fn in sorted(self.gauges.items(), key=lambda item: item[0]):
+            header(name, "gauge")
+            try:
+                lines.append(f"{name}{self._labels(labels)} {float(fn())}")
+            except Exception:
+                pass
+        for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+            header(name, "histogram")
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{self._labels(labels, {'le': bound})} {cumulative}")
+            lines.append(f"{name}_bucket{self._labels(labels, {'le': '+Inf'})} {histogram.count}")
+            lines.append(f"{name}_sum{self._labels(labels)} {histogram.sum}")
+            lines.append(f"{name}_count{self._labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+metrics.describe("feedback_queue_wait_seconds", "histogram", "Tempo das mensagens na fila de moderação")
+metrics.describe("feedback_ai_call_seconds", "histogram", "Duração das chamadas à OpenAI")
+metrics.describe("feedback_ai_parse_seconds", "histogram", "Duração do parse da resposta da IA")
+metrics.describe("feedback_action_seconds", "histogram", "Duração de cada ação de moderação")
+metrics.describe("feedback_message_seconds", "histogram", "Tempo total de processamento por mensagem")
+metrics.describe("feedback_ai_tokens_per_call", "histogram", "Tokens usados por chamada à OpenAI")
+metrics.describe("feedback_ai_batch_size", "histogram", "Mensagens por chamada à OpenAI no modo em lote")
+metrics.describe("feedback_classifications_total", "counter", "Classificações por resultado e origem")
+metrics.describe("feedback_failures_total", "counter", "Falhas por caminho (erro da IA, JSON inválido, ações)")
+metrics.describe("feedback_ai_tokens_total", "counter", "Tokens usados na OpenAI")
+metrics.describe("feedback_flood_total", "counter", "Controle de flood (silenciado, agrupada, rajada)")
+metrics.describe("feedback_ai_retries_total", "counter", "Retentativas de chamadas à OpenAI por modelo e motivo")
+metrics.describe("feedback_ai_breaker_trips_total", "counter", "Aberturas do circuit breaker por modelo")
+metrics.describe("feedback_shadow_total", "counter", "Comparações do modo sombra (concorda, discorda, erro, descartada)")
+metrics.describe("feedback_shadow_call_seconds", "histogram", "Chamada ao classificador candidato do modo sombra")
+metrics.describe("feedback_coupon_total", "counter", "Cupons por DM (agendado, enviado, repetido, dm_fechada, fila_cheia)")
+metrics.describe("feedback_entity_fetch_total", "counter", "Buscas via API de líderes e membros fora do cache")
+metrics.describe("feedback_backfill_total", "counter", "Mensagens lidas na recuperação (recuperada, ignorada)")
+metrics.describe("feedback_held_total", "counter", "Mensagens guardadas para reanálise (IA indisponível)")
+metrics.describe("feedback_held_review_total", "counter", "Mensagens sem veredito após HOLD_MAX_ATTEMPTS, enviadas para revisão")
+metrics.describe("feedback_journal_replayed_total", "counter", "Moderações retomadas pelo diário de ações")
+
+
+class MetricsServer:
+    """Endpoint HTTP local /metrics (formato Prometheus)"""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.runner: web.AppRunner | None = None
+
+    async def _handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=metrics.render_prometheus(), content_type="text/plain", charset="utf-8")
+
+    async def start(self):
+        """Inicia o servidor (se METRICS_PORT > 0)"""
+        if self.port <= 0:
+            return
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle_metrics)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        try:
+            await web.TCPSite(self.runner, self.host, self.port).start()
+            logger.info(f"Métricas disponíveis em http://{self.host}:{self.port}/metrics")
+        except OSError as e:
+            logger.warning(f"Não foi possível abrir o endpoint de métricas ({e})")
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def stop(self):
+        """Para o servidor"""
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+
+metrics_server = MetricsServer(METRICS_HOST, METRICS_PORT)
+
+# ==================== LOJAS E CANAIS ====================
+
+class ChannelConfig:
+    """Configuração de um canal de feedback: loja, líder, silenciamentos, cupom e instruções extras do prompt"""
+
+    __slots__ = (
+        "channel_id", "guild_id", "leader_id", "store_name", "store_url", "coupon_code",
+        "timeout_medio", "timeout_negativo", "prompt"
+    )
+
+    def __init__(self, channel_id: int, guild_id: int, leader_id: int, store_name: str = STORE_NAME,
+                 store_url: str = STORE_URL, coupon_code: str = COUPON_CODE,
+                 timeout_medio: timedelta = TIMEOUT_MEDIO_DURATION,
+                 timeout_negativo: timedelta = TIMEOUT_NEGATIVO_DURATION, prompt: str = ""):
+        self.channel_id = channel_id
+        self.guild_id = guild_id
+        self.leader_id = leader_id
+        self.store_name = store_name
+        self.store_url = store_url
+        self.coupon_code = coupon_code
+        self.timeout_medio = timeout_medio
+        self.timeout_negativo = timeout_negativo
+        self.prompt = prompt
+
+    @classmethod
+    def from_dict(cls, data: dict, defaults: dict = None) -> "ChannelConfig":
+        """Monta a configuração de um item de "canais" (campos ausentes vêm de "padrao")"""
+        merged = {**(defaults or {}), **data}
+        return cls(
+            channel_id=int(merged["canal_id"]),
+            guild_id=int(merged.get("servidor_id", 0)),
+            leader_id=int(merged.get("lider_id", 0)),
+            store_name=merged.get("loja", STORE_NAME),
+            store_url=merged.get("loja_url", STORE_URL),
+            coupon_code=merged.get("cupom", COUPON_CODE),
+            timeout_medio=timedelta(
+                minutes=float(merged.get("timeout_medio_minutos", TIMEOUT_MEDIO_DURATION.total_seconds() / 60))
+            ),
+            timeout_negativo=timedelta(
+                minutes=float(merged.get("timeout_negativo_minutos", TIMEOUT_NEGATIVO_DURATION.total_seconds() / 60))
+            ),
+            prompt=merged.get("prompt", "")
+        )
+
+
+def load_channel_configs(path: str = "") -> dict[int, ChannelConfig]:
+    """Canais de feedback por ID (lookup O(1) no caminho de cada mensagem).
+
+    Sem `path`, um único canal montado a partir de FEEDBACK_CHANNEL_ID/GUILD_ID/LEADER_ID.
+    """
+    if not path:
+        config = ChannelConfig(FEEDBACK_CHANNEL_ID, GUILD_ID, LEADER_ID)
+        return {config.channel_id: config}
+
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    defaults = data.get("padrao", {})
+    configs = {}
+    for entry in data.get("canais", []):
+        config = ChannelConfig.from_dict(entry, defaults)
+        configs[config.channel_id] = config
+    return configs
+
+
+channel_configs = load_channel_configs(CHANNELS_CONFIG_PATH)
+
+
+def get_channel_config(channel_id: int) -> ChannelConfig | None:
+    """Configuração do canal de feedback (None se o canal não for moderado)"""
+    return channel_configs.get(channel_id)
+
+
+def guild_channel_configs(guild_id: int) -> list[ChannelConfig]:
+    """Canais de feedback configurados em um servidor"""
+    return [config for config in channel_configs.values() if config.guild_id == guild_id]
+
+
 # ==================== CONFIGURAÇÃO DO OPENAI ====================
-openai.api_key = OPENAI_API_KEY
+# Cliente assíncrono único, criado no setup_hook e compartilhado por todas as análises.
+# Um cliente síncrono bloquearia o event loop do Discord durante cada chamada.
+openai_client: openai.AsyncOpenAI | None = None
+
+
+def get_openai_client() -> openai.AsyncOpenAI:
+    """Retorna o cliente AsyncOpenAI compartilhado (cria na primeira chamada)"""
+    global openai_client
+    if openai_client is None:
+        # Retentativas e prazos ficam a cargo do AIRouter (ver BACKEND DE IA)
+        openai_client = openai.AsyncOpenAI(api_key=OPENAI_API_KEY, max_retries=0)
+    return openai_client
+
+
+async def close_openai_client():
+    """Fecha o cliente AsyncOpenAI compartilhado"""
+    global openai_client
+    if openai_client is not None:
+        await openai_client.close()
+        openai_client = None
+
+
+# Limita quantas chamadas à OpenAI podem estar em andamento ao mesmo tempo
+ai_semaphore = asyncio.Semaphore(AI_MAX_CONCURRENCY)
+
+# ==================== BACKEND DE IA ====================
+
+class AIUnavailable(Exception):
+    """Nenhum modelo conseguiu responder dentro do prazo"""
+
+
+class AIBackendError(Exception):
+    """Falha de um modelo depois das retentativas (ou erro que não vale repetir)"""
+
+
+class CircuitBreaker:
+    """Circuit breaker de um modelo: abre após `failure_threshold` falhas seguidas.
+
+    Aberto, recusa chamadas por `cooldown` segundos; depois deixa passar uma chamada de
+    teste (meio aberto). Se ela der certo o circuito fecha e os ouvintes são avisados.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, cooldown: float):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.listeners: list = []
+
+    def allow(self) -> bool:
+        """A chamada pode ir para este modelo agora?"""
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+            self.state = "half_open"
+        if self.state == "half_open" and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def success(self):
+        self.failures = 0
+        self.probing = False
+        if self.state != "closed":
+            self.state = "closed"
+            logger.info(f"✅ Circuito de {self.name} fechado - modelo respondendo de novo")
+            for listener in self.listeners:
+                listener()
+
+    def failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            metrics.inc("feedback_ai_breaker_trips_total", modelo=self.name)
+            logger.error(f"🔌 Circuito de {self.name} aberto após {self.failures} falha(s) - pausa de {self.cooldown:.0f}s")
+
+
+class AIBackend:
+    """Um modelo da OpenAI com prazo por tentativa, retentativas com jitter e circuit breaker"""
+
+    def __init__(self, model: str, timeout: float, max_retries: int, retry_base_delay: float,
+                 breaker: CircuitBreaker, semaphore: asyncio.Semaphore = None, name: str = None):
+        self.model = model
+        self.name = name or model  # Rótulo nos logs e métricas
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.breaker = breaker
+        self.own_semaphore = semaphore
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        """Semáforo próprio (modo sombra) ou o global das chamadas à IA, lido na hora da chamada"""
+        return self.own_semaphore or ai_semaphore
+
+    async def complete(self, deadline: float, **request):
+        """Faz a chamada até dar certo, acabar as retentativas ou o prazo (time.monotonic)"""
+        try:
+            return await self._complete(deadline, **request)
+        finally:
+            # Libera a chamada de teste do circuito meio aberto em qualquer saída (inclusive cancelamento)
+            self.breaker.probing = False
+
+    async def _complete(self, deadline: float, **request):
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.breaker.failure()
+                raise AIBackendError(f"{self.name}: prazo esgotado")
+
+            retry_after = None
+            try:
+                async with self.semaphore:
+                    call_started = time.monotonic()
+                    response = await asyncio.wait_for(
+                        get_openai_client().chat.completions.create(model=self.model, **request),
+                        timeout=min(self.timeout, remaining)
+                    )
+                    metrics.observe("feedback_ai_call_seconds", time.monotonic() - call_started, modelo=self.name)
+                self.breaker.success()
+                return response
+            except asyncio.TimeoutError:
+                reason = "timeout"
+            except openai.RateLimitError as e:
+                reason = "429"
+                retry_after = e.response.headers.get("retry-after") if e.response is not None else None
+            except openai.APIStatusError as e:
+                if e.status_code < 500:
+                    # 4xx (requisição inválida, modelo sem suporte...): repetir não adianta
+                    raise AIBackendError(f"{self.name}: HTTP {e.status_code}") from e
+                reason = str(e.status_code)
+            except openai.APIConnectionError:
+                reason = "conexao"
+
+            metrics.inc("feedback_ai_retries_total", modelo=self.name, motivo=reason)
+            attempt += 1
+            if attempt > self.max_retries:
+                self.breaker.failure()
+                raise AIBackendError(f"{self.name}: {reason} após {attempt} tentativa(s)")
+
+            # Backoff exponencial com jitter completo (ou o Retry-After do 429)
+            try:
+                delay = float(retry_after)
+            except (TypeError, ValueError):
+                delay = random.uniform(0, self.retry_base_delay * 2 ** attempt)
+            delay = min(delay, max(deadline - time.monotonic(), 0))
+            logger.warning(f"⚠️ {self.name}: {reason} - nova tentativa em {delay:.2f}s ({attempt}/{self.max_retries})")
+            await asyncio.sleep(delay)
+
+
+class AIRouter:
+    """Escolhe o modelo de cada chamada: o principal e, se ele falhar ou estiver com o
+    circuito aberto, o modelo reserva (mais barato). Sem nenhum disponível, AIUnavailable.
+    """
+
+    def __init__(self, backends: list, deadline: float):
+        self.backends = backends
+        self.deadline = deadline
+
+    def available(self) -> bool:
+        """Algum modelo aceitando chamadas (circuito fechado)?"""
+        return any(backend.breaker.state == "closed" for backend in self.backends)
+
+    def on_recover(self, listener):
+        """Avisa `listener` quando algum circuito voltar a fechar"""
+        for backend in self.backends:
+            backend.breaker.listeners.append(listener)
+
+    async def complete(self, **request) -> tuple:
+        """Faz a chamada pelo primeiro modelo disponível e devolve (modelo que respondeu, resposta)"""
+        deadline = time.monotonic() + self.deadline
+        errors = []
+        for backend in self.backends:
+            if not backend.breaker.allow():
+                errors.append(f"{backend.model}: circuito aberto")
+                continue
+            try:
+                return backend.model, await backend.complete(deadline, **request)
+            except AIBackendError as e:
+                errors.append(str(e))
+                logger.warning(f"⚠️ {e}")
+        raise AIUnavailable("; ".join(errors))
+
+    def stats(self) -> list:
+        return [
+            {"model": backend.model, "state": backend.breaker.state, "failures": backend.breaker.failures}
+            for backend in self.backends
+        ]
+
+
+def build_ai_backend(model: str, semaphore: asyncio.Semaphore = None, name: str = None) -> AIBackend:
+    return AIBackend(
+        model=model,
+        timeout=AI_TIMEOUT,
+        max_retries=AI_MAX_RETRIES,
+        retry_base_delay=AI_RETRY_BASE_DELAY,
+        breaker=CircuitBreaker(name or model, AI_BREAKER_FAILURES, AI_BREAKER_COOLDOWN),
+        semaphore=semaphore,
+        name=name
+    )
+
+
+ai_router = AIRouter(
+    backends=[build_ai_backend(model) for model in dict.fromkeys([OPENAI_MODEL, AI_FALLBACK_MODEL]) if model],
+    deadline=AI_DEADLINE
+)
+
+for _backend in ai_router.backends:
+    metrics.gauge("feedback_ai_breaker_open", lambda b=_backend: int(b.breaker.state != "closed"), modelo=_backend.model)
+
+# ==================== SESSÕES HTTP ====================
+# Uma sessão com pool de conexões (keep-alive + cache de DNS) por upstream,
+# criada no setup_hook e fechada no desligamento do bot.
+DISCORD_API_BASE = "https://discord.com/api/v10"
+
+http_sessions: dict[str, aiohttp.ClientSession] = {}
+
+
+def get_http_session(upstream: str) -> aiohttp.ClientSession:
+    """Retorna a sessão compartilhada do upstream ("discord" ou "cdn")"""
+    session = http_sessions.get(upstream)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(limit=20, ttl_dns_cache=300, keepalive_timeout=60)
+        session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=30))
+        http_sessions[upstream] = session
+    return session
+
+
+async def close_http_sessions():
+    """Fecha todas as sessões HTTP compartilhadas"""
+    for session in http_sessions.values():
+        await session.close()
+    http_sessions.clear()
+
+
+# Limite global de requisições por segundo de um bot na API REST do Discord
+DISCORD_GLOBAL_RATE_LIMIT = 50
+
+
+class DiscordRateLimiter:
+    """Buckets de rate limit por rota da API REST do Discord (X-RateLimit-* e 429)"""
+
+    def __init__(self):
+        self.buckets: dict[str, dict] = {}
+        self.global_reset_at = 0.0
+        self.recent_requests: deque[float] = deque()
+
+    def record_request(self):
+        """Conta uma requisição de moderação para a folga do limite global"""
+        self.recent_requests.append(time.monotonic())
+
+    def headroom(self) -> float:
+        """Fração livre do limite global no último segundo (0 = sem folga ou 429 global ativo)"""
+        now = time.monotonic()
+        if self.global_reset_at > now:
+            return 0.0
+        while self.recent_requests and self.recent_requests[0] < now - 1.0:
+            self.recent_requests.popleft()
+        return max(0.0, 1.0 - len(self.recent_requests) / DISCORD_GLOBAL_RATE_LIMIT)
+
+    def bucket(self, route: str) -> dict:
+        """Estado do bucket da rota (criado na primeira requisição)"""
+        bucket = self.buckets.get(route)
+        if bucket is None:
+            bucket = {"lock": asyncio.Lock(), "remaining": 1, "reset_at": 0.0, "hash": None}
+            self.buckets[route] = bucket
+        return bucket
+
+    async def wait(self, route: str):
+        """Espera até a rota (e o limite global) ter requisições disponíveis"""
+        bucket = self.bucket(route)
+        now = time.monotonic()
+        delay = max(self.global_reset_at - now, 0.0)
+        if bucket["remaining"] <= 0 and bucket["reset_at"] > now:
+            delay = max(delay, bucket["reset_at"] - now)
+        if delay > 0:
+            logger.debug(f"⏳ Rate limit do Discord ({route}) - aguardando {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    def update(self, route: str, headers):
+        """Atualiza o bucket a partir dos cabeçalhos X-RateLimit-*"""
+        bucket = self.bucket(route)
+        if "X-RateLimit-Bucket" in headers:
+            bucket["hash"] = headers["X-RateLimit-Bucket"]
+        if "X-RateLimit-Remaining" in headers:
+            bucket["remaining"] = int(headers["X-RateLimit-Remaining"])
+        if "X-RateLimit-Reset-After" in headers:
+            bucket["reset_at"] = time.monotonic() + float(headers["X-RateLimit-Reset-After"])
+
+    def limited(self, route: str, retry_after: float, is_global: bool):
+        """Registra um 429: bloqueia a rota (ou tudo, se global) por retry_after segundos"""
+        reset_at = time.monotonic() + retry_after
+        if is_global:
+            self.global_reset_at = reset_at
+        else:
+            bucket = self.bucket(route)
+            bucket["remaining"] = 0
+            bucket["reset_at"] = reset_at
+
+
+discord_rate_limiter = DiscordRateLimiter()
+
+
+async def discord_api_request(method: str, path: str, route: str, max_retries: int = 3, **kwargs):
+    """Faz uma requisição à API REST do Discord respeitando os rate limits.
+
+    `route` identifica o bucket (método + rota + parâmetro principal, ex: "PATCH /guilds/123/members").
+    Retorna (status, corpo em texto).
+    """
+    headers = {"Authorization": f"Bot {DISCORD_TOKEN}", **kwargs.pop("headers", {})}
+    session = get_http_session("discord")
+    bucket_lock = discord_rate_limiter.bucket(route)["lock"]
+
+    for attempt in range(max_retries + 1):
+        async with bucket_lock:
+            await discord_rate_limiter.wait(route)
+            discord_rate_limiter.record_request()
+            async with session.request(method, f"{DISCORD_API_BASE}{path}", headers=headers, **kwargs) as response:
+                discord_rate_limiter.update(route, response.headers)
+                body = await response.text()
+                if response.status != 429:
+                    return response.status, body
+
+                try:
+                    data = json.loads(body)
+                except json.JSONDecodeError:
+                    data = {}
+                retry_after = float(data.get("retry_after") or response.headers.get("Retry-After", 1))
+                is_global = bool(data.get("global")) or response.headers.get("X-RateLimit-Global") == "true"
+                discord_rate_limiter.limited(route, retry_after, is_global)
+                logger.warning(f"⚠️ 429 do Discord em {route} (tentativa {attempt + 1}) - retry_after={retry_after:.2f}s")
+
+    return 429, body
 
 # ==================== PROMPT DE ANÁLISE ====================
-ANALYSIS_PROMPT = """🧩 PROMPT DE JULGAMENTO DE FEEDBACK — BLAZERD STORE
+# O prompt é estático e vai sempre no início da requisição (antes do feedback). Com ~770 tokens
+# ele fica abaixo do mínimo de 1024 do cache de prompt da OpenAI, então hoje não há tokens em
+# cache; a ordem só garante que o prefixo seja reaproveitado se o prompt passar desse tamanho.
+# Não interpolar nada aqui.
+ANALYSIS_PROMPT = """PROMPT DE JULGAMENTO DE FEEDBACK — LOJAS DE BOTS NO DISCORD
 
-🎯 OBJETIVO
+OBJETIVO
 Seu papel é analisar mensagens e imagens de feedback enviadas por clientes e classificar em três categorias:
-- POSITIVO
-- POSSO_PERDER_CLIENTE
-- NEGATIVO
+- POSITIVO (código P)
+- POSSO_PERDER_CLIENTE (código R)
+- NEGATIVO (código N)
 
 Você deve julgar com base no texto e/ou imagem.
 O foco é proteger o servidor e a imagem da marca, evitando punir feedbacks construtivos.
 
-🟢 1. POSITIVO
+1. POSITIVO (P)
 Use esta categoria se:
 - O cliente elogia o bot, o suporte ou o serviço;
 - Dá sugestões educadas (ex: "poderia adicionar tal função");
 - Envia apenas uma imagem mostrando o produto funcionando (sem texto ofensivo);
 - Diz algo neutro, mas sem risco de prejudicar vendas.
 
-🧠 Exemplo de mensagens POSITIVAS:
+Exemplos:
 - "Funciona perfeitamente!"
 - "Seria legal adicionar suporte para mais contas."
 - "Top bot 🔥"
 - (Apenas imagem do bot em uso)
 
-🟡 2. POSSO_PERDER_CLIENTE
+2. POSSO_PERDER_CLIENTE (R)
 Use esta categoria se:
 - O cliente não está sendo ofensivo, mas faz comentários negativos sobre o produto, servidor ou suporte que podem afastar novos clientes;
 - Reclama de banimento, demora, erro, ou insinua que o produto tem falhas, mas ainda de forma moderada;
 - Diz algo que pode prejudicar a reputação da loja, mesmo sem insultos diretos.
 
-💬 Exemplo de mensagens POSSO_PERDER_CLIENTE:
+Exemplos:
 - "O bot parou de funcionar pra mim."
 - "Fui banido do servidor e não sei o motivo."
 - "Demorou muito pra receber o produto."
 - "O suporte às vezes demora a responder."
 
-🛑 Ação: excluir a mensagem, mas NÃO silenciar o usuário.
+Ação: excluir a mensagem, mas NÃO silenciar o usuário.
+
+3. NEGATIVO (N)
+Use esta categoria se:
+- O usuário está ofendendo, acusando, mentindo ou tentando prejudicar a imagem da loja;
+- Usa palavras agressivas ou ofensivas;
+- Chama o produto de "scam", "lixo", "roubo", "enganoso", etc.;
+- O tom é claramente de ataque, difamação ou intenção de causar dano.
+
+Exemplos:
+- "Esse servidor é uma fraude."
+- "Roubaram meu dinheiro."
+- "Não comprem, é scam."
+- "Suporte horrível, não funciona nada."
+
+Ação: silenciar o usuário e reprovar o feedback.
+
+OBSERVAÇÕES IMPORTANTES
+- Se só houver imagem, NUNCA marque como negativo (pode ser apenas o cliente mostrando o bot funcionando).
+- Se houver texto + imagem, analise o texto como prioridade.
+- Se for só emoji, "ok", "funciona", ou qualquer frase curta neutra → POSITIVO.
+- Se a crítica for forte, agressiva ou insultante, mesmo curta → NEGATIVO.
+- Se for crítica leve mas pública, que pode afastar outros clientes, → POSSO_PERDER_CLIENTE.
+- Se vierem "INSTRUÇÕES DA LOJA" antes do feedback, siga-as junto com as regras acima.
+
+FORMATO DA RESPOSTA
+Responda APENAS com um JSON compacto:
+{"c": "P" | "R" | "N", "p": confiança de 0.0 a 1.0, "m": motivo}
+- "m": motivo curto (até 15 palavras) para R e N; use null para P.
+"""
+
+# Instrução extra do modo em lote (ver AI_BATCH_ENABLED)
+BATCH_ANALYSIS_PROMPT = """MODO EM LOTE
+Você receberá VÁRIOS feedbacks de clientes diferentes na mesma mensagem.
+Cada feedback começa com uma linha "ID: <id>" e vem seguido das imagens dele, se houver.
+Julgue cada feedback de forma independente, com as mesmas regras acima.
+
+Responda APENAS com um JSON compacto, com um item para cada ID recebido:
+{"r": [{"id": "<id>", "c": "P" | "R" | "N", "p": confiança, "m": motivo ou null}]}
+"""
+
+# ==================== FORMATO DA RESPOSTA ====================
+# Código curto da resposta -> classificação usada no resto do bot
+VERDICT_CODES = {"P": "POSITIVO", "R": "POSSO_PERDER_CLIENTE", "N": "NEGATIVO"}
+
+# Limite de tokens da resposta por feedback (o JSON compacto com motivo cabe com folga)
+VERDICT_MAX_TOKENS = 80
+
+_VERDICT_PROPERTIES = {
+    "c": {"type": "string", "enum": list(VERDICT_CODES)},
+    "p": {"type": "number"},
+    "m": {"type": ["string", "null"]}
+}
+
+VERDICT_SCHEMA = {
+    "type": "object",
+    "properties": _VERDICT_PROPERTIES,
+    "required": ["c", "p", "m"],
+    "additionalProperties": False
+}
+
+BATCH_VERDICT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "r": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"id": {"type": "string"}, **_VERDICT_PROPERTIES},
+                "required": ["id", "c", "p", "m"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["r"],
+    "additionalProperties": False
+}
+
+
+def build_response_format(name: str, schema: dict) -> dict:
+    """response_format da chamada: JSON schema estrito ou só modo JSON (AI_RESPONSE_FORMAT)"""
+    if AI_RESPONSE_FORMAT == "json_object":
+        return {"type": "json_object"}
+    return {"type": "json_schema", "json_schema": {"name": name, "strict": True, "schema": schema}}
+
+
+def parse_verdict(data) -> dict | None:
+    """Valida um veredito {"c", "p", "m"} e converte para o formato interno.
+
+    Retorna None se o veredito não seguir o schema (nada de adivinhar pelo texto).
+    """
+    if not isinstance(data, dict) or data.get("c") not in VERDICT_CODES:
+        return None
+    confidence = data.get("p")
+    if isinstance(confidence, bool) or not isinstance(confidence, (int, float)):
+        return None
+    reason = data.get("m")
+    if reason is not None and not isinstance(reason, str):
+        return None
+
+    result = {"classificacao": VERDICT_CODES[data["c"]], "confianca": min(max(float(confidence), 0.0), 1.0)}
+    if reason:
+        result["motivo"] = reason
+    return result
+
+
+# ==================== CACHE DE CLASSIFICAÇÃO ====================
+
+def normalize_feedback_text(text: str) -> str:
+    """Normaliza o texto para o cache: minúsculas, sem acentos, sem pontuação e espaços extras"""
+    text = unicodedata.normalize("NFKD", (text or "").casefold())
+    text = "".join(c for c in text if not unicodedata.combining(c) and not unicodedata.category(c).startswith("P"))
+    return " ".join(text.split())
+
+
+class ClassificationCache:
+    """Cache LRU com TTL de classificações, com persistência opcional em SQLite.
+
+    A versão (hash do prompt + modelo) faz parte da chave: se o ANALYSIS_PROMPT ou o
+    modelo mudarem, nenhuma entrada antiga é reaproveitada.
+    """
+
+    def __init__(self, max_size: int, ttl: float, version: str, db_path: str = ""):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.version = version
+        self.db_path = db_path
+        self.entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._db: sqlite3.Connection | None = None
+        self._db_lock = threading.Lock()
+
+    def make_key(self, text_content: str, image_hashes: list = None, instructions: str = "") -> str:
+        """Chave = versão + texto normalizado + hashes dos anexos (+ instruções da loja, se houver)"""
+        parts = [self.version, normalize_feedback_text(text_content), *(image_hashes or [])]
+        if instructions:
+            parts.append("instrucoes:" + instructions)
+        raw = "\x1f".join(parts)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def open(self):
+        """Abre o banco SQLite (se configurado) e descarta entradas de outras versões"""
+        if self.db_path:
+            await asyncio.to_thread(self._open_db)
+            logger.info(f"✅ Cache de classificação persistente em {self.db_path}")
+
+    def _open_db(self):
+        with self._db_lock:
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            # WAL: vários processos (shards) podem compartilhar o mesmo arquivo de cache
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS classification_cache ("
+                "key TEXT PRIMARY KEY, version TEXT NOT NULL, created_at REAL NOT NULL, result TEXT NOT NULL)"
+            )
+            self._db.execute("DELETE FROM classification_cache WHERE version != ?", (self.version,))
+            self._db.execute("DELETE FROM classification_cache WHERE created_at < ?", (time.time() - self.ttl,))
+            self._db.commit()
+
+    async def close(self):
+        """Fecha o banco SQLite"""
+        if self._db is not None:
+            await asyncio.to_thread(self._close_db)
+
+    def _close_db(self):
+        with self._db_lock:
+            self._db.close()
+            self._db = None
+
+    def _remember(self, key: str, created_at: float, result: dict):
+        self.entries[key] = (created_at, result)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    async def get(self, key: str) -> dict | None:
+        """Retorna a classificação em cache ou None"""
+        now = time.time()
+        entry = self.entries.get(key)
+        if entry is None and self._db is not None:
+            entry = await asyncio.to_thread(self._db_get, key)
+            if entry is not None:
+                self._remember(key, *entry)
+
+        if entry is None or now - entry[0] > self.ttl:
+            self.entries.pop(key, None)
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return dict(entry[1])
+
+    def _db_get(self, key: str):
+        with self._db_lock:
+            if self._db is None:
+                return None
+            row = self._db.execute(
+                "SELECT created_at, result FROM classification_cache WHERE key = ? AND version = ?",
+                (key, self.version)
+            ).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    async def set(self, key: str, result: dict):
+        """Guarda uma classificação"""
+        created_at = time.time()
+        self._remember(key, created_at, dict(result))
+        if self._db is not None:
+            await asyncio.to_thread(self._db_set, key, created_at, result)
+
+    def _db_set(self, key: str, created_at: float, result: dict):
+        with self._db_lock:
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO classification_cache (key, version, created_at, result) VALUES (?, ?, ?, ?)",
+                (key, self.version, created_at, json.dumps(result, ensure_ascii=False))
+            )
+            self._db.commit()
+
+    def stats(self) -> dict:
+        """Contadores de acertos/erros do cache"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+classification_cache = ClassificationCache(
+    max_size=CACHE_MAX_SIZE,
+    ttl=CACHE_TTL,
+    version=hashlib.sha256(
+        f"{OPENAI_MODEL}\x1f{ANALYSIS_PROMPT}\x1f{BATCH_ANALYSIS_PROMPT}".encode("utf-8")
+    ).hexdigest()[:16],
+    db_path=CACHE_DB_PATH
+)
+
+
+# ==================== PRÉ-CLASSIFICADOR LOCAL ====================
+
+DEFAULT_LEXICON = {
+    # Termos que, sem negação por perto, indicam NEGATIVO com alta certeza
+    "negativo": [
+        "scam", "scammer", "scammers", "fraude", "fraudes", "fraudulento", "golpe", "golpista", "golpistas",
+        "roubo", "roubaram", "roubando", "ladrao", "ladroes", "lixo", "enganoso", "enganacao",
+        "nao comprem", "nao compre", "fraud", "thief", "thieves", "stole", "stolen", "ripoff", "rip off",
+        "garbage", "trash", "dont buy", "do not buy",
+    ],
+    # Frases curtas e neutras/positivas que são POSITIVO quando são a mensagem inteira
+    "positivo": [
+        "ok", "okay", "blz", "beleza", "funciona", "funcionando", "funcionou", "top", "top bot", "muito bom",
+        "bom", "otimo", "excelente", "perfeito", "show", "valeu", "vlw", "obrigado", "obrigada", "obg",
+        "recomendo", "works", "working", "good", "nice", "great", "perfect", "thanks", "thank you", "love it",
+    ],
+    # Palavras de negação que tornam um termo negativo ambíguo ("não é scam")
+    "negacao": ["nao", "nem", "nunca", "sem", "not", "never", "no", "isnt", "aint"],
+    # Palavras de contraste: "achei que era golpe mas funcionou" vai para a IA
+    "contraste": ["mas", "porem", "entretanto", "contudo", "mesmo assim", "but", "however", "though", "although"],
+    # Emojis hostis: mensagens só de emoji com eles vão para a IA
+    "emojis_negativos": ["🖕", "💩", "🤮", "👎", "🤬", "😡", "🤡", "🗑"],
+}
+
+CUSTOM_EMOJI_PATTERN = re.compile(r"<a?:\w+:\d+>")
+
+
+def _build_term_pattern(terms: list) -> re.Pattern:
+    """Compila uma lista de termos em uma única regex com limites de palavra"""
+    alternatives = sorted({normalize_feedback_text(term) for term in terms if term}, key=len, reverse=True)
+    return re.compile(r"\b(?:" + "|".join(re.escape(term) for term in alternatives) + r")\b")
+
+
+class LocalPreClassifier:
+    """Regras + léxico (e modelo local opcional) que decidem casos de alta certeza sem a IA.
+
+    Retorna None quando o caso é ambíguo e precisa ser escalado para a IA. NEGATIVO só é
+    decidido localmente em mensagens curtas (até `max_negative_words` palavras), em que o
+    termo de ataque é o assunto: com contraste, termo positivo ou texto longo, decide a IA.
+    """
+
+    def __init__(self, lexicon: dict, model=None, model_threshold: float = 0.9, max_negative_words: int = 6):
+        self.negative_pattern = _build_term_pattern(lexicon["negativo"])
+        self.positive_phrases = {normalize_feedback_text(term) for term in lexicon["positivo"]}
+        self.positive_pattern = _build_term_pattern(lexicon["positivo"])
+        self.contrast_pattern = _build_term_pattern(lexicon["contraste"])
+        self.max_negative_words = max_negative_words
+        negation_words = "|".join(re.escape(normalize_feedback_text(w)) for w in lexicon["negacao"])
+        self.negation_pattern = re.compile(r"\b(?:" + negation_words + r")\b(?:\s+\w+){0,2}\s*$")
+        self.negation_words = re.compile(r"\b(?:" + negation_words + r")\b")
+        self.negative_emojis = set(lexicon.get("emojis_negativos", []))
+        self.model = model
+        self.model_threshold = model_threshold
+
+        # Estatísticas
+        self.decided = 0
+        self.escalated = 0
+
+    @classmethod
+    def from_config(cls, lexicon_path: str = "", model_path: str = "", model_threshold: float = 0.9):
+        """Monta o pré-classificador a partir do léxico/modelo configurados"""
+        lexicon = dict(DEFAULT_LEXICON)
+        if lexicon_path:
+            with open(lexicon_path, encoding="utf-8") as f:
+                lexicon.update(json.load(f))
+
+        model = None
+        if model_path:
+            try:
+                import joblib
+                model = joblib.load(model_path)
+                logger.info(f"✅ Modelo local carregado: {model_path}")
+            except ImportError:
+                logger.warning("⚠️ joblib não instalado - modelo local desativado")
+            except Exception as e:
+                logger.warning(f"⚠️ Erro ao carregar modelo local ({e}) - modelo local desativado")
+
+        return cls(lexicon, model, model_threshold)
+
+    def _is_emoji_only(self, text: str) -> bool:
+        text = CUSTOM_EMOJI_PATTERN.sub("", text)
+        chars = [c for c in text if not c.isspace()]
+        return bool(chars) and all(unicodedata.category(c) in ("So", "Sk", "Mn", "Cf") for c in chars)
+
+    def _decide(self, text_content: str, image_count: int) -> dict | None:
+        raw = (text_content or "").strip()
+
+        # Sem texto: apenas imagem (ou figurinha) nunca é negativo
+        if not raw:
+            return {"classificacao": "POSITIVO", "motivo": "Apenas imagem, sem texto", "confianca": 0.95}
+
+        # Só emojis (sem emojis hostis)
+        if CUSTOM_EMOJI_PATTERN.fullmatch(raw) or self._is_emoji_only(raw):
+            if any(emoji in raw for emoji in self.negative_emojis):
+                return None
+            return {"classificacao": "POSITIVO", "motivo": "Mensagem apenas com emojis", "confianca": 0.95}
+
+        text = normalize_feedback_text(raw)
+
+        # Termo de ataque numa mensagem curta, sem negação antes dele, sem contraste nem
+        # termo positivo (e que não seja uma pergunta)
+        match = self.negative_pattern.search(text)
+        if match:
+            if (
+                "?" in raw
+                or len(text.split()) > self.max_negative_words
+                or self.negation_pattern.search(text[:match.start()])
+                or self.contrast_pattern.search(text)
+                or self.positive_pattern.search(text)
+            ):
+                return None
+            return {"classificacao": "NEGATIVO", "motivo": f"Termo ofensivo: \"{match.group(0)}\"", "confianca": 0.9}
+
+        # Frase curta neutra/positiva (a mensagem inteira); com imagem, a IA confere a imagem
+        if text in self.positive_phrases and image_count == 0:
+            return {"classificacao": "POSITIVO", "motivo": "Frase curta neutra/positiva", "confianca": 0.9}
+
+        # Modelo local opcional
+        if self.model is not None and image_count == 0:
+            try:
+                probabilities = self.model.predict_proba([text])[0]
+                best = max(range(len(probabilities)), key=lambda i: probabilities[i])
+                if probabilities[best] >= self.model_threshold:
+                    return {
+                        "classificacao": str(self.model.classes_[best]),
+                        "motivo": "Modelo local",
+                        "confianca": float(probabilities[best]),
+                    }
+            except Exception as e:
+                logger.warning(f"⚠️ Erro no modelo local: {e}")
+
+        return None
+
+    def classify(self, text_content: str, image_count: int = 0) -> dict | None:
+        """Classifica localmente; None = ambíguo, escalar para a IA"""
+        result = self._decide(text_content, image_count)
+        if result is None:
+            self.escalated += 1
+            return None
+        self.decided += 1
+        result["fonte"] = "local"
+        return result
+
+    def has_signal_terms(self, normalized_text: str) -> bool:
+        """Verifica se o texto (já normalizado) tem termos ofensivos ou de negação"""
+        return bool(self.negative_pattern.search(normalized_text) or self.negation_words.search(normalized_text))
+
+    def stats(self) -> dict:
+        """Decisões locais vs escaladas para a IA"""
+        total = self.decided + self.escalated
+        return {
+            "decided": self.decided,
+            "escalated": self.escalated,
+            "escalation_rate": self.escalated / total if total else 0.0,
+        }
+
+
+local_classifier = LocalPreClassifier.from_config(LEXICON_PATH, LOCAL_MODEL_PATH, LOCAL_MODEL_THRESHOLD)
+
+
+# ==================== HISTÓRICO DE MODERAÇÃO ====================
+
+def day_key(timestamp: float) -> str:
+    """Dia (horário local) usado nos agregados diários"""
+    return time.strftime("%Y-%m-%d", time.localtime(timestamp))
+
+
+class ModerationStore:
+    """Histórico de moderação em SQLite (WAL): vereditos, ações, tempos e infrações por usuário.
+
+    As gravações ficam pendentes em memória e são feitas em lote, numa thread, a cada
+    `flush_interval` segundos (ou ao acumular `flush_max` linhas), sem bloquear o event loop.
+    O índice de infrações por usuário e os agregados diários ficam espelhados em memória:
+    consultar a reincidência de um usuário ou montar o !status é O(1), sem varrer o histórico.
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS verdicts ("
+        "id INTEGER PRIMARY KEY, message_id INTEGER NOT NULL, guild_id INTEGER, channel_id INTEGER, "
+        "user_id INTEGER NOT NULL, classification TEXT NOT NULL, confidence REAL, source TEXT, "
+        "reason TEXT, is_edit INTEGER NOT NULL, offenses INTEGER, time_to_delete REAL, "
+        "total_seconds REAL, created_at REAL NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS idx_verdicts_user ON verdicts (user_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_verdicts_message ON verdicts (message_id)",
+        "CREATE TABLE IF NOT EXISTS actions ("
+        "id INTEGER PRIMARY KEY, message_id INTEGER NOT NULL, action TEXT NOT NULL, ok INTEGER NOT NULL, "
+        "duration REAL, error TEXT, created_at REAL NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS idx_actions_message ON actions (message_id)",
+        "CREATE TABLE IF NOT EXISTS user_offenses ("
+        "user_id INTEGER PRIMARY KEY, offenses INTEGER NOT NULL, total_offenses INTEGER NOT NULL, "
+        "last_classification TEXT, last_offense_at REAL NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS daily_stats ("
+        "day TEXT NOT NULL, classification TEXT NOT NULL, count INTEGER NOT NULL, total_seconds REAL NOT NULL, "
+        "PRIMARY KEY (day, classification))",
+        "CREATE TABLE IF NOT EXISTS dm_status ("
+        "user_id INTEGER PRIMARY KEY, last_coupon_at REAL, dm_closed INTEGER NOT NULL DEFAULT 0)",
+        "CREATE TABLE IF NOT EXISTS shadow_comparisons ("
+        "id INTEGER PRIMARY KEY, message_id INTEGER NOT NULL, channel_id INTEGER, primary_model TEXT, "
+        "candidate_model TEXT, primary_classification TEXT NOT NULL, candidate_classification TEXT NOT NULL, "
+        "primary_source TEXT, agree INTEGER NOT NULL, primary_latency REAL, candidate_latency REAL, "
+        "primary_cost REAL, candidate_cost REAL, created_at REAL NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS action_journal ("
+        "id INTEGER PRIMARY KEY, message_id INTEGER NOT NULL, payload TEXT NOT NULL, "
+        "done TEXT NOT NULL DEFAULT '', created_at REAL NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS checkpoints ("
+        "channel_id INTEGER PRIMARY KEY, message_id INTEGER NOT NULL, updated_at REAL NOT NULL)",
+    )
+
+    def __init__(self, db_path: str, flush_interval: float, flush_max: int, offense_window: float):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.flush_max = max(1, flush_max)
+        self.offense_window = offense_window
+        # user_id -> [horários das infrações na janela (deque), infrações no total, última classificação, timestamp]
+        self.offenders: dict[int, list] = {}
+        # (dia, classificação) -> [mensagens, soma dos tempos de processamento]
+        self.daily: dict[tuple[str, str], list] = {}
+        self.totals: dict[str, int] = {}
+        # channel_id -> ID até o qual todas as mensagens novas têm veredito (ponto de partida da recuperação)
+        self.checkpoints: dict[int, int] = {}
+        # channel_id -> mensagens novas ainda sem veredito (na fila, em análise, guardadas ou descartadas)
+        self.open_messages: dict[int, set[int]] = {}
+        # channel_id -> maior mensagem nova com veredito
+        self.finished_up_to: dict[int, int] = {}
+        # Cupons: último envio por usuário e usuários com DMs fechadas
+        self.coupons_sent: dict[int, float] = {}
+        self.dms_closed: set[int] = set()
+        self.pending: list[tuple[str, tuple]] = []
+        self.flush_event = asyncio.Event()
+        self.writer: asyncio.Task | None = None
+        self.written = 0
+        self._db: sqlite3.Connection | None = None
+        self._db_lock = threading.Lock()
+
+    async def start(self):
+        """Abre o banco, carrega os índices em memória e inicia a gravação em lote"""
+        if self.db_path:
+            await asyncio.to_thread(self._open_db)
+            logger.info(
+                f"✅ Histórico de moderação em {self.db_path} "
+                f"({len(self.offenders)} usuário(s) com infrações recentes)"
+            )
+        self.writer = asyncio.create_task(self._writer_loop(), name="moderation-store-writer")
+
+    async def stop(self):
+        """Grava o que estiver pendente e fecha o banco"""
+        if self.writer:
+            self.writer.cancel()
+            await asyncio.gather(self.writer, return_exceptions=True)
+            self.writer = None
+        await self.flush()
+        if self._db is not None:
+            await asyncio.to_thread(self._close_db)
+
+    def _open_db(self):
+        with self._db_lock:
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            for statement in self.SCHEMA:
+                self._db.execute(statement)
+            self._db.commit()
+
+            # Só os reincidentes da janela atual ficam em memória
+            since = time.time() - self.offense_window
+            for user_id, offenses, total, classification, last_at in self._db.execute(
+                "SELECT user_id, offenses, total_offenses, last_classification, last_offense_at "
+                "FROM user_offenses WHERE last_offense_at >= ?", (since,)
+            ):
+                self.offenders[user_id] = [deque(), total, classification, last_at]
+            # Horários de cada infração da janela (uma linha por análise: as rajadas repetem o horário)
+            for user_id, created_at in self._db.execute(
+                "SELECT DISTINCT user_id, created_at FROM verdicts "
+                "WHERE offenses IS NOT NULL AND created_at >= ? ORDER BY created_at", (since,)
+            ):
+                if user_id in self.offenders:
+                    self.offenders[user_id][0].append(created_at)
+            for day, classification, count, total_seconds in self._db.execute(
+                "SELECT day, classification, count, total_seconds FROM daily_stats WHERE day = ?",
+                (day_key(time.time()),)
+            ):
+                self.daily[(day, classification)] = [count, total_seconds]
+            for classification, count in self._db.execute(
+                "SELECT classification, SUM(count) FROM daily_stats GROUP BY classification"
+            ):
+                self.totals[classification] = count
+            for channel_id, message_id in self._db.execute("SELECT channel_id, message_id FROM checkpoints"):
+                self.checkpoints[channel_id] = message_id
+            for user_id, last_coupon_at, dm_closed in self._db.execute(
+                "SELECT user_id, last_coupon_at, dm_closed FROM dm_status"
+            ):
+                if last_coupon_at:
+                    self.coupons_sent[user_id] = last_coupon_at
+                if dm_closed:
+                    self.dms_closed.add(user_id)
+
+    def _close_db(self):
+        with self._db_lock:
+            self._db.close()
+            self._db = None
+
+    async def _writer_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.flush_event.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.flush_event.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Grava as linhas pendentes numa única transação"""
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        if self._db is None:
+            return
+        try:
+            await asyncio.to_thread(self._write, batch)
+            self.written += len(batch)
+        except Exception as e:
+            logger.error(f"❌ Erro ao gravar o histórico de moderação ({len(batch)} linhas): {e}")
+            metrics.inc("feedback_failures_total", caminho="historico")
+
+    def _write(self, batch: list):
+        with self._db_lock:
+            if self._db is None:
+                return
+            with self._db:
+                for sql, params in batch:
+                    self._db.execute(sql, params)
+
+    def _enqueue(self, sql: str, params: tuple):
+        self.pending.append((sql, params))
+        if len(self.pending) >= self.flush_max:
+            self.flush_event.set()
+
+    def checkpoint(self, channel_id: int) -> int | None:
+        """ID até o qual as mensagens novas do canal têm veredito (None = canal nunca processado)"""
+        return self.checkpoints.get(channel_id)
+
+    def open_message(self, message: discord.Message):
+        """Mensagem nova entrou na moderação: o checkpoint não passa dela até o veredito"""
+        self.open_messages.setdefault(message.channel.id, set()).add(message.id)
+
+    def close_message(self, channel_id: int, message_id: int):
+        """Mensagem nova com veredito: o checkpoint vai até antes da mais antiga ainda aberta"""
+        open_ids = self.open_messages.get(channel_id)
+        if open_ids:
+            open_ids.discard(message_id)
+        finished = max(self.finished_up_to.get(channel_id, 0), message_id)
+        self.finished_up_to[channel_id] = finished
+        self.advance_checkpoint(channel_id, min(finished, min(open_ids) - 1) if open_ids else finished)
+
+    def advance_checkpoint(self, channel_id: int, message_id: int):
+        """Avança o ponto de partida da recuperação do canal (nunca volta)"""
+        if message_id <= self.checkpoints.get(channel_id, 0):
+            return
+        self.checkpoints[channel_id] = message_id
+        self._enqueue(
+            "INSERT INTO checkpoints (channel_id, message_id, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (channel_id) DO UPDATE SET message_id = MAX(message_id, excluded.message_id), "
+            "updated_at = excluded.updated_at",
+            (channel_id, message_id, time.time())
+        )
+
+    def rewind_checkpoint(self, channel_id: int, message_id: int):
+        """Volta o checkpoint para antes de uma mensagem não processada (a recuperação vai relê-la)"""
+        checkpoint = self.checkpoints.get(channel_id)
+        if checkpoint is not None and checkpoint < message_id:
+            return
+        self.checkpoints[channel_id] = message_id - 1
+        self._enqueue(
+            "INSERT INTO checkpoints (channel_id, message_id, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (channel_id) DO UPDATE SET message_id = MIN(message_id, excluded.message_id), "
+            "updated_at = excluded.updated_at",
+            (channel_id, message_id - 1, time.time())
+        )
+
+    async def processed_messages(self, message_ids: list) -> set:
+        """IDs, dentre os informados, que já têm veredito gravado (mensagens novas)"""
+        if self._db is None or not message_ids:
+            return set()
+        await self.flush()
+        return await asyncio.to_thread(self._processed_messages, list(message_ids))
+
+    def _processed_messages(self, message_ids: list) -> set:
+        with self._db_lock:
+            if self._db is None:
+                return set()
+            placeholders = ", ".join("?" * len(message_ids))
+            return {
+                row[0] for row in self._db.execute(
+                    f"SELECT DISTINCT message_id FROM verdicts WHERE is_edit = 0 AND message_id IN ({placeholders})",
+                    message_ids
+                )
+            }
+
+    # Diário de ações: gravado na hora (não em lote), antes e depois de cada ação
+
+    def _execute_now(self, sql: str, params: tuple) -> int | None:
+        with self._db_lock:
+            if self._db is None:
+                return None
+            with self._db:
+                return self._db.execute(sql, params).lastrowid
+
+    async def journal_open(self, message_id: int, payload: dict) -> int | None:
+        """Grava a entrada do diário e retorna o ID (None sem banco)"""
+        if self._db is None:
+            return None
+        return await asyncio.to_thread(
+            self._execute_now,
+            "INSERT INTO action_journal (message_id, payload, created_at) VALUES (?, ?, ?)",
+            (message_id, json.dumps(payload, ensure_ascii=False), time.time())
+        )
+
+    async def journal_mark(self, entry_id: int, step: str):
+        """Marca uma ação da entrada como concluída"""
+        await asyncio.to_thread(
+            self._execute_now, "UPDATE action_journal SET done = done || ? WHERE id = ?", (f"{step},", entry_id)
+        )
+
+    async def journal_close(self, entry_id: int):
+        """Remove a entrada (todas as ações terminaram)"""
+        await asyncio.to_thread(self._execute_now, "DELETE FROM action_journal WHERE id = ?", (entry_id,))
+
+    async def journal_pending(self) -> list[dict]:
+        """Entradas que ficaram abertas (o processo parou no meio das ações)"""
+        if self._db is None:
+            return []
+        return await asyncio.to_thread(self._journal_pending)
+
+    def _journal_pending(self) -> list[dict]:
+        with self._db_lock:
+            if self._db is None:
+                return []
+            return [
+                {"id": entry_id, "message_id": message_id, "payload": json.loads(payload),
+                 "done": {step for step in done.split(",") if step}}
+                for entry_id, message_id, payload, done in self._db.execute(
+                    "SELECT id, message_id, payload, done FROM action_journal ORDER BY id"
+                )
+            ]
+
+    def last_coupon_at(self, user_id: int) -> float | None:
+        """Quando o usuário recebeu o último cupom (None = nunca)"""
+        return self.coupons_sent.get(user_id)
+
+    def record_coupon(self, user_id: int):
+        now = time.time()
+        self.coupons_sent[user_id] = now
+        self._enqueue(
+            "INSERT INTO dm_status (user_id, last_coupon_at) VALUES (?, ?) "
+            "ON CONFLICT (user_id) DO UPDATE SET last_coupon_at = excluded.last_coupon_at",
+            (user_id, now)
+        )
+
+    def dm_closed(self, user_id: int) -> bool:
+        return user_id in self.dms_closed
+
+    def mark_dm_closed(self, user_id: int):
+        """O usuário não aceita DMs do bot (Forbidden): cupons não são mais tentados"""
+        if user_id in self.dms_closed:
+            return
+        self.dms_closed.add(user_id)
+        self._enqueue(
+            "INSERT INTO dm_status (user_id, dm_closed) VALUES (?, 1) "
+            "ON CONFLICT (user_id) DO UPDATE SET dm_closed = 1",
+            (user_id,)
+        )
+
+    def record_shadow(self, comparison: dict, primary_model: str, candidate_model: str):
+        """Registra uma comparação do modo sombra (classificador principal vs candidato)"""
+        self._enqueue(
+            "INSERT INTO shadow_comparisons (message_id, channel_id, primary_model, candidate_model, "
+            "primary_classification, candidate_classification, primary_source, agree, primary_latency, "
+            "candidate_latency, primary_cost, candidate_cost, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                comparison["mensagem_id"], comparison["canal_id"], primary_model, candidate_model,
+                comparison["principal"], comparison["candidato"], comparison["fonte"], int(comparison["concorda"]),
+                comparison["latencia_principal"], comparison["latencia_candidato"],
+                comparison["custo_principal"], comparison["custo_candidato"], time.time()
+            )
+        )
+
+    def _recent_offenses(self, user_id: int, now: float) -> deque:
+        """Horários das infrações do usuário que ainda caem na janela (descarta as antigas)"""
+        record = self.offenders.get(user_id)
+        if record is None:
+            return deque()
+        recent = record[0]
+        while recent and now - recent[0] > self.offense_window:
+            recent.popleft()
+        return recent
+
+    def offense_count(self, user_id: int) -> int:
+        """Infrações do usuário dentro da janela (só as que caem nela, não a sequência desde a primeira)"""
+        return len(self._recent_offenses(user_id, time.time()))
+
+    def register_offense(self, user_id: int, classification: str) -> int:
+        """Conta uma nova infração e retorna o total na janela (incluindo esta)"""
+        now = time.time()
+        recent = self._recent_offenses(user_id, now)
+        recent.append(now)
+        offenses = len(recent)
+        record = self.offenders.get(user_id)
+        total = (record[1] if record else 0) + 1
+        self.offenders[user_id] = [recent, total, classification, now]
+        self._enqueue(
+            "INSERT INTO user_offenses (user_id, offenses, total_offenses, last_classification, last_offense_at) "
+            "VALUES (?, ?, 1, ?, ?) ON CONFLICT (user_id) DO UPDATE SET offenses = excluded.offenses, "
+            "total_offenses = total_offenses + 1, last_classification = excluded.last_classification, "
+            "last_offense_at = excluded.last_offense_at",
+            (user_id, offenses, classification, now)
+        )
+        return offenses
+
+    def record_verdict(self, message: discord.Message, analysis: dict, outcome: dict, is_edit: bool = False,
+                       offenses: int = None, burst: list = None):
+        """Registra o veredito da mensagem (e de cada mensagem da rajada), as ações executadas e os tempos"""
+        now = time.time()
+        classification = outcome["classificacao"]
+        total_seconds = outcome.get("tempo_total") or 0.0
+        messages = burst or [message]
+        for judged in messages:
+            self._enqueue(
+                "INSERT INTO verdicts (message_id, guild_id, channel_id, user_id, classification, confidence, "
+                "source, reason, is_edit, offenses, time_to_delete, total_seconds, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    judged.id, judged.guild.id if judged.guild else None, judged.channel.id, judged.author.id,
+                    classification, analysis.get("confianca"), analysis.get("fonte", "ia"), analysis.get("motivo"),
+                    int(is_edit), offenses, outcome.get("tempo_ate_exclusao"), total_seconds, now
+                )
+            )
+        for action in outcome.get("acoes", []):
+            self._enqueue(
+                "INSERT INTO actions (message_id, action, ok, duration, error, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (message.id, action["acao"], int(action["ok"]), action["duracao"], action["erro"], now)
+            )
+
+        day = day_key(now)
+        stats = self.daily.setdefault((day, classification), [0, 0.0])
+        stats[0] += 1
+        stats[1] += total_seconds
+        self.totals[classification] = self.totals.get(classification, 0) + 1
+        self._enqueue(
+            "INSERT INTO daily_stats (day, classification, count, total_seconds) VALUES (?, ?, 1, ?) "
+            "ON CONFLICT (day, classification) DO UPDATE SET count = count + 1, "
+            "total_seconds = total_seconds + excluded.total_seconds",
+            (day, classification, total_seconds)
+        )
+        if not is_edit and message.channel is not None:
+            for judged in messages:
+                self.close_message(judged.channel.id, judged.id)
+
+    def today(self) -> dict:
+        """Mensagens por classificação hoje"""
+        day = day_key(time.time())
+        return {classification: stats[0] for (stats_day, classification), stats in self.daily.items() if stats_day == day}
+
+    def stats(self) -> dict:
+        now = time.time()
+        return {
+            "today": self.today(),
+            "totals": dict(self.totals),
+            "repeat_offenders": sum(1 for user_id in self.offenders if len(self._recent_offenses(user_id, now)) > 1),
+            "pending": len(self.pending),
+            "written": self.written,
+        }
+
+
+moderation_store = ModerationStore(
+    db_path=STATE_DB_PATH,
+    flush_interval=STATE_FLUSH_INTERVAL,
+    flush_max=STATE_FLUSH_MAX,
+    offense_window=OFFENSE_WINDOW_DAYS * 86400
+)
+
+
+# ==================== INTENTS DO BOT ====================
+intents = discord.Intents.default()
+intents.message_content = True
+intents.members = True
+intents.guilds = True
+
+
+def shard_options() -> dict:
+    """Argumentos de shard do bot a partir de SHARD_COUNT/SHARD_IDS.
+
+    SHARD_IDS exige o número total em SHARD_COUNT: com "auto" (ou vazio) o discord.py
+    recusa a lista de shards só na conexão, então o erro sai aqui, ao carregar a configuração.
+    """
+    options = {}
+    if SHARD_COUNT and SHARD_COUNT != "auto":
+        if not SHARD_COUNT.isdigit() or int(SHARD_COUNT) < 1:
+            raise ValueError(f"SHARD_COUNT inválido ({SHARD_COUNT!r}): use vazio, \"auto\" ou o número de shards")
+        options["shard_count"] = int(SHARD_COUNT)
+    if SHARD_IDS.strip():
+        if "shard_count" not in options:
+            raise ValueError("SHARD_IDS exige o número total de shards em SHARD_COUNT (não vale vazio nem \"auto\")")
+        shard_ids = [int(shard_id) for shard_id in SHARD_IDS.split(",") if shard_id.strip()]
+        invalid = [shard_id for shard_id in shard_ids if not 0 <= shard_id < options["shard_count"]]
+        if invalid:
+            raise ValueError(f"SHARD_IDS fora do intervalo 0-{options['shard_count'] - 1}: {invalid}")
+        options["shard_ids"] = shard_ids
+    return options
+
+
+# Com SHARD_COUNT, um processo atende vários shards (AutoShardedBot); a análise é compartilhada
+BotBase = commands.AutoShardedBot if SHARD_COUNT else commands.Bot
+
+
+class FeedbackModerationBot(BotBase):
+    """Bot com ciclo de vida dos recursos compartilhados (clientes HTTP/OpenAI, cache, relatórios, fila, métricas).
+
+    Todos os servidores e canais configurados usam o mesmo cliente OpenAI, cache, fila e lotes.
+    No SIGTERM/SIGINT, o encerramento para de aceitar mensagens, termina a fila (até
+    SHUTDOWN_DRAIN_TIMEOUT) e devolve ao checkpoint o que não deu tempo de processar.
+    """
+
+    draining = False
+    shutdown_task: asyncio.Task | None = None
+    unprocessed: list = []  # Mensagens recebidas durante o encerramento
+
+    async def setup_hook(self):
+        get_openai_client()
+        logger.info("✅ Cliente OpenAI assíncrono inicializado")
+        get_http_session("discord")
+        get_http_session("cdn")
+        logger.info("✅ Sessões HTTP compartilhadas inicializadas")
+        await classification_cache.open()
+        await moderation_store.start()
+        await action_journal.load()
+        await leader_reporter.start()
+        await moderation_queue.start()
+        await held_messages.start()
+        await coupon_dispatcher.start()
+        await shadow_classifier.start()
+        await metrics_server.start()
+
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, lambda: asyncio.create_task(self.close()))
+            except (NotImplementedError, RuntimeError):
+                pass  # Windows / fora da thread principal: encerramento padrão
+
+    async def close(self):
+        # O sinal e o discord.py (ao sair do `async with`) chamam close(): o encerramento roda uma vez
+        if self.shutdown_task is None:
+            self.shutdown_task = asyncio.create_task(self._shutdown())
+        await self.shutdown_task
+
+    async def _shutdown(self):
+        self.draining = True
+        self.unprocessed = []
+        logger.info(f"🛑 Encerrando - terminando as mensagens em andamento (até {SHUTDOWN_DRAIN_TIMEOUT:.0f}s)")
+        # Uma etapa que falhe não impede as outras nem o fechamento da conexão com o Discord
+        try:
+            try:
+                await self._drain()
+            except Exception:
+                logger.exception("❌ Erro ao terminar as mensagens em andamento")
+            for step in (
+                shadow_classifier.stop, coupon_dispatcher.stop, flood_guard.stop, leader_reporter.stop,
+                moderation_store.stop, close_openai_client, close_http_sessions, classification_cache.close
+            ):
+                try:
+                    await step()
+                except Exception:
+                    logger.exception(f"❌ Erro no encerramento ({step.__qualname__})")
+        finally:
+            await super().close()
+
+    async def _drain(self):
+        """Para as entradas, espera a fila esvaziar e devolve ao checkpoint o que não foi processado"""
+        await metrics_server.stop()
+        await catch_up.stop()
+        await held_messages.stop()
+        await edit_tracker.stop()
+        await flood_guard.flush_all()
+        if not await moderation_queue.drain(SHUTDOWN_DRAIN_TIMEOUT):
+            logger.warning("⚠️ Tempo de encerramento esgotado - o restante fica para a próxima inicialização")
+        leftover = moderation_queue.unfinished_jobs()
+        await moderation_queue.stop()
+
+        # O que não foi processado volta a ser lido do histórico (CatchUpScanner) na próxima inicialização;
+        # ações já começadas são retomadas pelo diário
+        messages = [*self.unprocessed]
+        for job in [*leftover, *held_messages.jobs.values()]:
+            if not job.is_edit:
+                messages.extend(job.burst or [job.message])
+        for message in messages:
+            moderation_store.rewind_checkpoint(message.channel.id, message.id)
+        if messages:
+            logger.info(f"↩️ {len(messages)} mensagem(ns) não processada(s) ficam para a recuperação")
+
+
+bot = FeedbackModerationBot(command_prefix="!", intents=intents, **shard_options())
+
+
+# ==================== FUNÇÕES AUXILIARES ====================
+
+async def download_image_bytes(url: str, max_bytes: int = None) -> bytes:
+    """Baixa uma imagem e retorna os bytes (None se falhar ou passar de max_bytes)"""
+    try:
+        async with get_http_session("cdn").get(url) as response:
+            if response.status == 200:
+                if max_bytes and response.content_length and response.content_length > max_bytes:
+                    logger.warning(f"⚠️ Imagem maior que o limite ({response.content_length} bytes): {url}")
+                    return None
+                data = bytearray()
+                async for chunk in response.content.iter_chunked(64 * 1024):
+                    data.extend(chunk)
+                    if max_bytes and len(data) > max_bytes:
+                        logger.warning(f"⚠️ Imagem maior que o limite ({max_bytes} bytes): {url}")
+                        return None
+                return bytes(data)
+    except Exception as e:
+        logger.warning(f"Erro ao baixar imagem: {e}")
+    return None
+
+
+async def download_image_as_base64(url: str) -> str:
+    """Baixa uma imagem e converte para base64"""
+    image_data = await download_image_bytes(url)
+    if image_data is None:
+        return None
+    return base64.b64encode(image_data).decode('utf-8')
+
+
+# ==================== PRÉ-PROCESSAMENTO DE IMAGENS ====================
+
+def _difference_hash(image) -> str:
+    """Hash perceptual (dHash 64 bits): igual para a mesma imagem reenviada/recomprimida"""
+    pixels = image.convert("L").resize((9, 8), Image.LANCZOS).tobytes()
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return f"dhash:{bits:016x}"
+
+
+def _choose_detail(image) -> str:
+    """Escolhe "low" ou "high": imagens pequenas ou sem texto não precisam de alta resolução"""
+    if IMAGE_DETAIL in ("low", "high"):
+        return IMAGE_DETAIL
+    if max(image.size) <= 512:
+        return "low"
+    # Prints de tela/chat (texto para ler) têm poucas cores dominando a imagem; fotos, não
+    sample = image.convert("RGB").resize((256, 256), Image.NEAREST)
+    colors = sorted(sample.getcolors(256 * 256), reverse=True)
+    dominant = sum(count for count, _ in colors[:8]) / (256 * 256)
+    return "high" if dominant > 0.5 else "low"
+
+
+def _process_image_bytes(data: bytes) -> tuple[str, str, str]:
+    """Hash perceptual, JPEG redimensionado (data URL) e nível de detalhe (roda em thread)"""
+    with Image.open(BytesIO(data)) as image:
+        image.load()
+        image_hash = _difference_hash(image)
+        detail = _choose_detail(image)
+        max_side = IMAGE_MAX_SIDE if detail == "high" else min(IMAGE_MAX_SIDE, 512)
+        resized = image.convert("RGB")
+        resized.thumbnail((max_side, max_side), Image.LANCZOS)
+        buffer = BytesIO()
+        resized.save(buffer, format="JPEG", quality=85, optimize=True)
+        logger.debug(f"🖼️ Imagem {image.size[0]}x{image.size[1]} → {resized.size[0]}x{resized.size[1]} (detail={detail})")
+    data_url = "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode("utf-8")
+    return image_hash, data_url, detail
+
+
+async def prepare_image(attachment: discord.Attachment) -> dict:
+    """Prepara um anexo para a IA: {"hash", "part"} (hash None = não dá para usar o cache)"""
+    fallback_detail = IMAGE_DETAIL if IMAGE_DETAIL in ("low", "high") else "high"
+
+    if attachment.size and attachment.size > IMAGE_MAX_BYTES:
+        logger.warning(f"⚠️ Anexo grande demais ({attachment.size} bytes) - enviando URL com detail=low")
+        return {"hash": None, "part": {"url": attachment.url, "detail": "low"}}
+
+    data = await download_image_bytes(attachment.url, IMAGE_MAX_BYTES)
+    if data is None:
+        return {"hash": None, "part": {"url": attachment.url, "detail": fallback_detail}}
+
+    if Image is not None:
+        try:
+            image_hash, data_url, detail = await asyncio.to_thread(_process_image_bytes, data)
+            return {"hash": image_hash, "part": {"url": data_url, "detail": detail}}
+        except Exception as e:
+            logger.warning(f"⚠️ Não foi possível processar a imagem ({e}) - enviando URL original")
+
+    return {"hash": hashlib.sha256(data).hexdigest(), "part": {"url": attachment.url, "detail": fallback_detail}}
+
+
+# Anexos já preparados, por ID: edições que mantêm a imagem não a baixam/processam de novo
+prepared_images: OrderedDict[int, dict] = OrderedDict()
+PREPARED_IMAGES_MAX = 500
+
+
+async def _prepare_image_cached(attachment: discord.Attachment) -> dict:
+    prepared = prepared_images.get(attachment.id)
+    if prepared is None:
+        prepared = await prepare_image(attachment)
+        prepared_images[attachment.id] = prepared
+        while len(prepared_images) > PREPARED_IMAGES_MAX:
+            prepared_images.popitem(last=False)
+    else:
+        prepared_images.move_to_end(attachment.id)
+    return prepared
+
+
+async def prepare_images(attachments: list) -> list:
+    """Baixa e prepara até 3 anexos em paralelo (reaproveita os já preparados)"""
+    return list(await asyncio.gather(*[_prepare_image_cached(att) for att in attachments[:3]]))
+
+
+def response_tokens(response) -> dict:
+    """Tokens de uma resposta da OpenAI: {"prompt", "cache", "resposta"}"""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return {"prompt": 0, "cache": 0, "resposta": 0}
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "prompt": usage.prompt_tokens or 0,
+        "cache": getattr(details, "cached_tokens", 0) or 0,
+        "resposta": usage.completion_tokens or 0,
+    }
+
+
+def record_token_usage(response):
+    """Registra os tokens usados em uma chamada à OpenAI"""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    metrics.inc("feedback_ai_tokens_total", usage.prompt_tokens or 0, tipo="prompt")
+    metrics.inc("feedback_ai_tokens_total", usage.completion_tokens or 0, tipo="completion")
+    # Parte do prompt servida pelo cache de prompt da OpenAI (0 enquanto o prefixo tiver menos de 1024 tokens)
+    details = getattr(usage, "prompt_tokens_details", None)
+    metrics.inc("feedback_ai_tokens_total", getattr(details, "cached_tokens", 0) or 0, tipo="prompt_cache")
+    metrics.observe("feedback_ai_tokens_per_call", usage.total_tokens or 0, buckets=TOKEN_BUCKETS)
+
+
+def build_feedback_content(text_content: str, images: list = None, item_id: str = None,
+                           instructions: str = "") -> list:
+    """Parte variável da requisição: instruções da loja, texto do feedback (com o ID no modo em lote)
+    e até 3 imagens.
+
+    `images` aceita URLs ou partes já preparadas ({"url", "detail"}, ver prepare_images).
+    """
+    feedback_text = f"FEEDBACK DO CLIENTE:\n{text_content if text_content else '(Sem texto - apenas imagem)'}"
+    if instructions:
+        feedback_text = f"INSTRUÇÕES DA LOJA:\n{instructions}\n\n{feedback_text}"
+    if item_id is not None:
+        feedback_text = f"ID: {item_id}\n{feedback_text}"
+    content = [{"type": "text", "text": feedback_text}]
+    for image in (images or [])[:3]:  # Máximo 3 imagens
+        content.append({
+            "type": "image_url",
+            "image_url": {"url": image, "detail": "high"} if isinstance(image, str) else image
+        })
+    return content
+
+
+async def request_verdict_json(messages: list, max_tokens: int, response_format: dict, router: AIRouter = None):
+    """Faz a chamada à OpenAI (via AIRouter) e devolve (JSON da resposta ou None, tokens usados, modelo).
+
+    Levanta AIUnavailable se nenhum modelo responder dentro do prazo. Com outro `router`
+    (modo sombra), os tokens não entram nas métricas da classificação principal.
+    """
+    model, response = await (router or ai_router).complete(
+        messages=messages,
+        max_tokens=max_tokens,
+        temperature=0.3,
+        response_format=response_format
+    )
+    if router is None:
+        record_token_usage(response)
+
+    parse_started = time.monotonic()
+    try:
+        return json.loads(response.choices[0].message.content or ""), response_tokens(response), model
+    except json.JSONDecodeError:
+        return None, response_tokens(response), model
+    finally:
+        metrics.observe("feedback_ai_parse_seconds", time.monotonic() - parse_started)
+
+
+def ai_error_result(reason: str) -> dict:
+    """Resultado sem veredito: a mensagem não é aprovada nem punida (fica guardada, ver HeldMessages)"""
+    return {"classificacao": "INDEFINIDO", "motivo": reason, "confianca": 0.0, "erro": True}
+
+
+async def analyze_feedback_with_ai(text_content: str, images: list = None, instructions: str = "",
+                                   router: AIRouter = None) -> dict:
+    """Analisa o feedback usando OpenAI GPT-4 Vision.
+
+    `images` aceita URLs ou partes já preparadas ({"url", "detail"}, ver prepare_images).
+    `instructions` são as instruções extras da loja (ChannelConfig.prompt). Com `router`,
+    a chamada usa outros backends (avaliação), fora do limite das chamadas ao vivo.
+    """
+    try:
+        # Prefixo estático primeiro, feedback por último
+        messages = [
+            {"role": "system", "content": ANALYSIS_PROMPT},
+            {"role": "user", "content": build_feedback_content(text_content, images, instructions=instructions)}
+        ]
+        data, tokens, model = await request_verdict_json(
+            messages, VERDICT_MAX_TOKENS, build_response_format("veredito", VERDICT_SCHEMA), router=router
+        )
+        result = parse_verdict(data)
+        if result is None:
+            metrics.inc("feedback_failures_total", caminho="json_invalido")
+            logger.warning(f"⚠️ Resposta da IA fora do schema: {str(data)[:200]}")
+            return ai_error_result("Resposta da IA fora do formato")
+        result["tokens"] = tokens
+        result["modelo"] = model
+        return result
+
+    except AIUnavailable as e:
+        logger.error(f"IA indisponível: {e}")
+        metrics.inc("feedback_failures_total", caminho="ia_indisponivel")
+        return ai_error_result(f"IA indisponível: {e}")
+    except Exception as e:
+        logger.error(f"Erro na análise de IA: {e}")
+        metrics.inc("feedback_failures_total", caminho="erro_ia")
+        return ai_error_result(f"Erro na análise: {e}")
+
+
+# ==================== LOTES DE CLASSIFICAÇÃO ====================
+
+async def analyze_feedback_batch(items: list) -> dict:
+    """Classifica vários feedbacks em uma única chamada à IA.
+
+    Cada item é {"id", "text", "images"}. Retorna {id: resultado} apenas com os
+    resultados válidos; IDs ausentes ficam para o chamador reenviar sozinhos. Com a IA
+    indisponível, todos voltam como erro (reenviar sozinhos só repetiria a espera).
+    """
+    user_content = []
+    for item in items:
+        user_content.extend(build_feedback_content(item["text"], item["images"], item["id"], item["instructions"]))
+
+    messages = [
+        {"role": "system", "content": ANALYSIS_PROMPT},
+        {"role": "system", "content": BATCH_ANALYSIS_PROMPT},
+        {"role": "user", "content": user_content}
+    ]
+
+    try:
+        data, tokens, model = await request_verdict_json(
+            messages, VERDICT_MAX_TOKENS * len(items), build_response_format("vereditos", BATCH_VERDICT_SCHEMA)
+        )
+    except AIUnavailable as e:
+        logger.error(f"IA indisponível para o lote ({len(items)} mensagens): {e}")
+        metrics.inc("feedback_failures_total", caminho="ia_indisponivel")
+        return {item["id"]: ai_error_result(f"IA indisponível: {e}") for item in items}
+    except Exception as e:
+        logger.error(f"Erro na análise de IA em lote ({len(items)} mensagens): {e}")
+        metrics.inc("feedback_failures_total", caminho="erro_ia_lote")
+        return {}
+
+    entries = data.get("r") if isinstance(data, dict) else None
+    if not isinstance(entries, list):
+        metrics.inc("feedback_failures_total", caminho="json_invalido_lote")
+        return {}
+
+    expected = {item["id"] for item in items}
+    # Tokens da chamada divididos igualmente entre as mensagens do lote
+    share = {kind: value / len(items) for kind, value in tokens.items()}
+    results = {}
+    for entry in entries:
+        result = parse_verdict(entry)
+        if result is not None and str(entry.get("id")) in expected:
+            result["tokens"] = share
+            result["modelo"] = model
+            results[str(entry["id"])] = result
+    return results
+
+
+class ClassificationBatcher:
+    """Junta as classificações que chegam dentro de uma janela curta em uma única chamada à IA.
+
+    Cada chamador espera o próprio future; quando o lote fecha (janela expirada ou
+    tamanho máximo), uma task faz a chamada e devolve cada resultado ao seu dono.
+    Itens que voltam faltando ou inválidos são reenviados como chamadas individuais.
+    """
+
+    def __init__(self, window: float, max_size: int):
+        self.window = window
+        self.max_size = max(1, max_size)
+        self.pending: list[dict] = []
+        self.timer: asyncio.Task | None = None
+        self.tasks: set[asyncio.Task] = set()
+        self.batches = 0
+        self.items = 0
+        self.fallbacks = 0
+
+    async def classify(self, text_content: str, images: list = None, message_id=None, instructions: str = "") -> dict:
+        future = asyncio.get_running_loop().create_future()
+        item_id = str(message_id) if message_id is not None else f"item{self.items}"
+        if any(item["id"] == item_id for item in self.pending):
+            item_id = f"{item_id}-{len(self.pending)}"
+        self.pending.append({
+            "id": item_id, "text": text_content, "images": images or [], "instructions": instructions, "future": future
+        })
+        self.items += 1
+
+        if len(self.pending) >= self.max_size:
+            self._flush()
+        elif self.timer is None:
+            self.timer = asyncio.create_task(self._flush_later())
+        return await future
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.window)
+        self.timer = None
+        self._flush()
+
+    def _flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+        task = asyncio.create_task(self._run(batch))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _run(self, batch: list):
+        self.batches += 1
+        metrics.observe("feedback_ai_batch_size", len(batch), buckets=BATCH_SIZE_BUCKETS)
+        try:
+            results = await analyze_feedback_batch(batch) if len(batch) > 1 else {}
+            missing = [item for item in batch if item["id"] not in results]
+            if missing:
+                if len(batch) > 1:
+                    self.fallbacks += len(missing)
+                    logger.warning(f"⚠️ Lote com {len(missing)}/{len(batch)} resultados faltando - reenviando individualmente")
+                singles = await asyncio.gather(*[
+                    analyze_feedback_with_ai(item["text"], item["images"], item["instructions"]) for item in missing
+                ])
+                results.update({item["id"]: result for item, result in zip(missing, singles)})
+            for item in batch:
+                if not item["future"].done():
+                    item["future"].set_result(results[item["id"]])
+        except Exception as e:
+            for item in batch:
+                if not item["future"].done():
+                    item["future"].set_exception(e)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_size": self.items / self.batches if self.batches else 0.0,
+            "fallbacks": self.fallbacks
+        }
+
+
+classification_batcher = ClassificationBatcher(
+    window=AI_BATCH_WINDOW_MS / 1000,
+    max_size=AI_BATCH_MAX_SIZE
+)
+
+
+async def request_ai_classification(text_content: str, images: list, message_id=None, instructions: str = "",
+                                    batch: bool = None, router: AIRouter = None) -> dict:
+    """Chamada à IA: em lote quando AI_BATCH_ENABLED (ou `batch`), senão individual.
+
+    Com `router` próprio (avaliação) a chamada é sempre individual: os lotes usam o ai_router.
+    """
+    if router is None and (AI_BATCH_ENABLED if batch is None else batch):
+        return await classification_batcher.classify(text_content, images, message_id, instructions)
+    return await analyze_feedback_with_ai(text_content, images, instructions, router)
+
+
+async def classify_feedback(text_content: str, attachments: list = None, message_id=None,
+                            instructions: str = "", batch: bool = None, use_cache: bool = True,
+                            router: AIRouter = None) -> dict:
+    """Classifica o feedback: pré-classificador local, depois cache, depois IA.
+
+    Todas as lojas compartilham o mesmo backend (cliente, cache, lotes); `instructions`
+    (prompt extra da loja) entra na chave do cache. `batch` força (ou desliga) o modo em lote;
+    `use_cache=False` sempre consulta a IA e `router` troca os backends (usados na avaliação).
+    """
+    attachments = (attachments or [])[:3]
+
+    # Com a IA fora (circuitos abertos), o pré-classificador decide o que puder mesmo se desativado
+    if PRECLASSIFIER_ENABLED or not (router or ai_router).available():
+        local_result = local_classifier.classify(text_content, len(attachments))
+        if local_result is not None:
+            logger.debug(f"⚡ Decidido localmente: {local_result['motivo']}")
+            return local_result
+
+    images = await prepare_images(attachments)
+    image_parts = [image["part"] for image in images]
+    if not use_cache or any(image["hash"] is None for image in images):
+        # Sem o conteúdo de todas as imagens não dá para montar a chave
+        return await request_ai_classification(text_content, image_parts, message_id, instructions, batch, router)
+
+    key = classification_cache.make_key(text_content, [image["hash"] for image in images], instructions)
+    cached = await classification_cache.get(key)
+    if cached is not None:
+        logger.debug("♻️ Classificação reaproveitada do cache")
+        cached["fonte"] = "cache"
+        return cached
+
+    result = await request_ai_classification(text_content, image_parts, message_id, instructions, batch, router)
+    # Vereditos do modelo reserva não vão para o cache: a versão do cache é a do modelo principal,
+    # e eles seriam servidos por CACHE_TTL depois que o principal voltasse
+    if not result.get("erro") and result.get("modelo", OPENAI_MODEL) == OPENAI_MODEL:
+        # Os tokens são da chamada que gerou o veredito; reaproveitado do cache ele não custa nada
+        await classification_cache.set(key, {k: v for k, v in result.items() if k != "tokens"})
+    return result
+
+
+async def send_user_warning(user: discord.User, classification: str, is_edit: bool = False,
+                            timeout_duration: timedelta = None, offenses: int = 1, config: ChannelConfig = None):
+    """Envia mensagem de aviso para o usuário (em inglês)"""
+    try:
+        store_name = (config.store_name if config else STORE_NAME).upper()
+        coupon_code = config.coupon_code if config else COUPON_CODE
+        edit_text = " (edited message)" if is_edit else ""
+        repeat_text = f"\n🔁 **Repeat offense:** this is offense #{offenses} - mutes get longer each time." if offenses > 1 else ""
+        
+        if classification == "NEGATIVO":
+            message = f"""⚠️ **WARNING - {store_name}**{edit_text}
+
+Your message in the feedback channel has been removed for violating server rules.
+
+📋 **Rule violated:** Offensive/harmful feedback
+⏰ **Consequence:** You have been muted for **{describe_timeout(timeout_duration or TIMEOUT_NEGATIVO_DURATION, english=True)}**{repeat_text}
+
+🚨 **WARNING:** If you continue breaking the rules, you will be **PERMANENTLY BANNED** from the server.
+
+If you believe this was a mistake, please contact support after the mute period."""
+
+        elif classification == "POSSO_PERDER_CLIENTE":
+            message = f"""⚠️ **WARNING - {store_name}**{edit_text}
+
+Your message in the feedback channel has been removed.
+
+📋 **Reason:** The content may harm the store's image
+⏰ **Consequence:** You have been muted for **{describe_timeout(timeout_duration or TIMEOUT_MEDIO_DURATION, english=True)}**{repeat_text}
+
+💡 If you have issues with the product, please contact support directly.
+
+🎁 5% off coupon after sending positive feedback: **{coupon_code}**"""
+
+        await user.send(message)
+        logger.info(f"✅ Aviso enviado para {user.name}#{user.discriminator}")
+        return True
+        
+    except discord.Forbidden:
+        logger.warning(f"❌ Não foi possível enviar DM para {user.name} (DMs fechadas)")
+        moderation_store.mark_dm_closed(user.id)
+        return False
+    except Exception as e:
+        logger.error(f"❌ Erro ao enviar aviso: {e}")
+        return False
+
+
+CLASSIFICATION_EMOJI = {
+    "POSITIVO": "🟢",
+    "POSSO_PERDER_CLIENTE": "🟡",
+    "NEGATIVO": "🔴"
+}
+
+ACTION_TEXT = {
+    "POSITIVO": "Nenhuma ação (feedback aprovado)",
+    "POSSO_PERDER_CLIENTE": "Mensagem excluída + Silenciado por 1 HORA",
+    "NEGATIVO": "Mensagem excluída + Silenciado por 1 DIA (24h)",
+    "REVISAR": "Nenhuma (mensagem mantida, sem veredito da IA) - revisar manualmente"
+}
+
+
+def build_incident(
+    message: discord.Message,
+    classification: str,
+    reason: str,
+    confidence: float,
+    is_edit: bool = False,
+    original_content: str = None,
+    timeout_duration: timedelta = None,
+    offenses: int = 1,
+    burst: list = None,
+    config: ChannelConfig = None
+) -> dict:
+    """Registra os dados de um incidente para o relatório (sem depender da mensagem depois)"""
+    messages = burst or [message]
+    attachments = [att for m in messages for att in m.attachments]
+    config = config or get_channel_config(message.channel.id)
+    return {
+        "guild": message.guild,
+        "leader_id": config.leader_id if config else LEADER_ID,
+        "channel_id": message.channel.id,
+        "author_id": message.author.id,
+        "author_mention": message.author.mention,
+        "author_name": f"{message.author.name}#{message.author.discriminator}",
+        "content": burst_content(messages),
+        "original_content": original_content,
+        "attachment_urls": [att.url for att in attachments[:3]],
+        "attachment_count": len(attachments),
+        "burst_count": len(messages),
+        "classification": classification,
+        "reason": reason,
+        "confidence": confidence,
+        "is_edit": is_edit,
+        "timeout_duration": timeout_duration,
+        "offenses": offenses,
+        "timestamp": datetime.now(),
+    }
+
+
+def build_incident_embed(incident: dict) -> discord.Embed:
+    """Monta o embed de um incidente"""
+    classification = incident["classification"]
+    colors = {
+        "POSITIVO": discord.Color.green(),
+        "POSSO_PERDER_CLIENTE": discord.Color.gold(),
+        "NEGATIVO": discord.Color.red()
+    }
+    embed = discord.Embed(
+        title=f"{CLASSIFICATION_EMOJI.get(classification, '⚪')} {classification} "
+              f"({incident['confidence'] * 100:.1f}%)",
+        color=colors.get(classification, discord.Color.light_grey()),
+        timestamp=incident["timestamp"]
+    )
+    embed.add_field(
+        name="👤 Usuário",
+        value=f"{incident['author_mention']} ({incident['author_name']})\n🆔 {incident['author_id']}",
+        inline=False
+    )
+    if incident["is_edit"]:
+        embed.add_field(name="📝 Mensagem Original", value=(incident["original_content"] or "(Sem texto)")[:300], inline=False)
+        embed.add_field(name="📝 Mensagem Editada", value=(incident["content"] or "(Sem texto)")[:300], inline=False)
+    else:
+        name = "💬 Conteúdo" if incident.get("burst_count", 1) == 1 else f"💬 Conteúdo ({incident['burst_count']} mensagens agrupadas)"
+        embed.add_field(name=name, value=(incident["content"] or "(Sem texto)")[:300], inline=False)
+    if incident["attachment_urls"]:
+        embed.add_field(
+            name=f"📎 Anexos ({incident['attachment_count']})",
+            value="\n".join(f"• {url}" for url in incident["attachment_urls"])[:1000],
+            inline=False
+        )
+        embed.set_image(url=incident["attachment_urls"][0])
+    embed.add_field(name="🤖 Motivo da IA", value=(incident["reason"] or "-")[:200], inline=False)
+    action_text = ACTION_TEXT.get(classification, "Desconhecida")
+    if incident.get("timeout_duration") and classification != "POSITIVO":
+        action_text = f"Mensagem excluída + Silenciado por {describe_timeout(incident['timeout_duration'])}"
+    embed.add_field(name="⚡ Ação Tomada", value=action_text, inline=False)
+    offenses = incident.get("offenses", 1)
+    if offenses > 1:
+        history = f"{offenses}ª infração nos últimos {OFFENSE_WINDOW_DAYS:g} dias"
+        if BAN_SUGGEST_AFTER and offenses >= BAN_SUGGEST_AFTER:
+            history += "\n⛔ **Sugestão: banimento** (reincidente)"
+        embed.add_field(name="📈 Reincidência", value=history, inline=False)
+    return embed
+
+
+async def send_leader_report(leader: discord.User | discord.Member, incidents: list) -> int:
+    """Envia os incidentes ao líder como embeds, agrupando vários por mensagem.
+
+    Retorna quantos incidentes foram entregues (do início da lista): se uma mensagem falhar
+    no meio do relatório, as anteriores já saíram e só o resto deve ser tentado de novo.
+    """
+    delivered = 0
+    try:
+        edited = sum(1 for incident in incidents if incident["is_edit"])
+        today = moderation_store.today()
+        header = (
+            f"📊 **RELATÓRIO DE FEEDBACK MODERADO** - {len(incidents)} incidente(s)"
+            + (f" ({edited} editado(s))" if edited else "")
+            + "\n📅 Hoje: " + " | ".join(
+                f"{CLASSIFICATION_EMOJI[name]} {today.get(name, 0)}" for name in CLASSIFICATION_EMOJI
+            )
+        )
+
+        # Limites do Discord: 10 embeds e 6000 caracteres por mensagem
+        batches, batch, batch_size = [], [], 0
+        for incident in incidents:
+            embed = build_incident_embed(incident)
+            if batch and (len(batch) == 10 or batch_size + len(embed) > 6000):
+                batches.append(batch)
+                batch, batch_size = [], 0
+            batch.append(embed)
+            batch_size += len(embed)
+        if batch:
+            batches.append(batch)
+
+        for i, embeds in enumerate(batches):
+            send_started = time.monotonic()
+            await leader.send(content=header if i == 0 else None, embeds=embeds)
+            metrics.observe("feedback_action_seconds", time.monotonic() - send_started, acao="dm_lider")
+            delivered += len(embeds)  # um embed por incidente
+
+        logger.info(f"✅ Relatório enviado para o líder ({len(incidents)} incidente(s), {len(batches)} mensagem(ns))")
+        return delivered
+        
+    except discord.Forbidden:
+        logger.error(f"❌ Não foi possível enviar relatório para o líder (DMs fechadas)")
+        return delivered
+    except Exception as e:
+        logger.error(f"❌ Erro ao enviar relatório ({delivered} de {len(incidents)} incidente(s) entregues): {e}")
+        return delivered
+
+
+class LeaderReporter:
+    """Agrupa os incidentes em resumos periódicos para o líder.
+
+    Os incidentes são enviados quando a janela de tempo expira ou quando o limite de
+    incidentes é atingido; NEGATIVO com confiança alta é enviado na hora. Se o líder não
+    puder ser resolvido ou a DM falhar, os incidentes ainda não entregues voltam para o resumo
+    e são tentados de novo no próximo envio (até `max_incidents * 10` por líder).
+    """
+
+    def __init__(self, window: float, max_incidents: int, escalation_confidence: float):
+        self.window = window
+        self.max_incidents = max(1, max_incidents)
+        self.escalation_confidence = escalation_confidence
+        self.pending: dict[int, list[dict]] = {}  # líder -> incidentes
+        self.lock = asyncio.Lock()
+        self.task: asyncio.Task | None = None
+
+        # Estatísticas
+        self.incidents = 0
+        self.reports_sent = 0
+
+    async def start(self):
+        """Inicia o envio periódico dos resumos"""
+        if self.window > 0:
+            self.task = asyncio.create_task(self._flush_loop(), name="leader-digest")
+
+    async def stop(self):
+        """Para o envio periódico e envia o que estiver pendente"""
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        await self.flush()
+
+    async def report(self, incident: dict) -> bool:
+        """Adiciona um incidente ao resumo do líder do canal (ou envia na hora se for urgente)"""
+        self.incidents += 1
+        leader_id = incident["leader_id"]
+        async with self.lock:
+            pending = self.pending.setdefault(leader_id, [])
+            pending.append(incident)
+            urgent = (
+                incident["classification"] == "NEGATIVO"
+                and incident["confidence"] >= self.escalation_confidence
+            )
+            if not (urgent or self.window <= 0 or len(pending) >= self.max_incidents):
+                return True
+        if urgent:
+            logger.info("🚨 Incidente urgente - enviando relatório imediatamente")
+        return await self.flush(leader_id)
+
+    async def flush(self, leader_id: int = None) -> bool:
+        """Envia os incidentes pendentes (de um líder ou de todos), um resumo por líder"""
+        async with self.lock:
+            if leader_id is None:
+                groups, self.pending = self.pending, {}
+            else:
+                groups = {leader_id: self.pending.pop(leader_id, [])}
+        ok = True
+        for leader_id, incidents in groups.items():
+            if not incidents:
+                continue
+            try:
+                leader = await resolve_leader(incidents[0]["guild"], leader_id)
+                delivered = await send_leader_report(leader, incidents)
+            except Exception as e:
+                logger.error(f"❌ Erro ao resolver o líder {leader_id}: {e}")
+                delivered = 0
+            if delivered:
+                await action_journal.delivered(incidents[:delivered])
+            sent = delivered == len(incidents)
+            if sent:
+                self.reports_sent += 1
+            else:
+                # Só volta para o resumo o que não saiu (as mensagens anteriores já foram entregues)
+                entity_cache.forget_leader(leader_id)
+                await self._requeue(leader_id, incidents[delivered:])
+            ok = sent and ok
+        return ok
+
+    async def _requeue(self, leader_id: int, incidents: list):
+        """Devolve ao resumo os incidentes que não foram enviados"""
+        async with self.lock:
+            pending = incidents + self.pending.get(leader_id, [])
+            dropped = len(pending) - self.max_incidents * 10
+            if dropped > 0:
+                pending = pending[dropped:]
+                logger.error(f"❌ Líder {leader_id} inacessível - {dropped} incidente(s) antigo(s) descartado(s)")
+            self.pending[leader_id] = pending
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.window)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"❌ Erro ao enviar resumo ao líder: {e}")
+
+
+leader_reporter = LeaderReporter(
+    window=REPORT_DIGEST_WINDOW,
+    max_incidents=REPORT_DIGEST_MAX,
+    escalation_confidence=REPORT_ESCALATION_CONFIDENCE
+)
+
+
+async def timeout_user_via_api(guild_id: int, user_id: int, duration: timedelta, reason: str):
+    """Aplica timeout usando a API REST do Discord diretamente (fallback)"""
+    try:
+        # Calcular o timestamp ISO 8601 para quando o timeout expira
+        timeout_until = (datetime.now(timezone.utc) + duration).isoformat()
+        
+        headers = {
+            "Content-Type": "application/json",
+            "X-Audit-Log-Reason": reason
+        }
+        
+        payload = {
+            "communication_disabled_until": timeout_until
+        }
+        
+        status, body = await discord_api_request(
+            "PATCH",
+            f"/guilds/{guild_id}/members/{user_id}",
+            route=f"PATCH /guilds/{guild_id}/members",
+            headers=headers,
+            json=payload
+        )
+        if status == 200:
+            logger.info(f"✅ Usuário silenciado via API REST")
+            return True
+        else:
+            logger.error(f"❌ Erro API Discord ({status}): {body}")
+            return False
+                    
+    except Exception as e:
+        logger.error(f"❌ Erro ao silenciar via API: {e}")
+        return False
+
+
+# Maior timeout aceito pelo Discord
+MAX_TIMEOUT_DURATION = timedelta(days=28)
+
+
+def escalate_timeout(base: timedelta, offenses: int) -> timedelta:
+    """Silenciamento progressivo: multiplica a duração base a cada reincidência na janela"""
+    return min(base * ESCALATION_FACTOR ** max(offenses - 1, 0), MAX_TIMEOUT_DURATION)
+
+
+def describe_timeout(duration: timedelta, english: bool = False) -> str:
+    """Duração legível do silenciamento ("1 HORA", "2 DIAS" / "1 DAY (24 hours)")"""
+    hours = max(round(duration.total_seconds() / 3600), 1)
+    if hours < 24:
+        unit = ("HOUR", "HOURS") if english else ("HORA", "HORAS")
+        return f"{hours} {unit[hours > 1]}"
+    days = round(hours / 24)
+    if english:
+        return f"{days} {'DAYS' if days > 1 else 'DAY'} ({days * 24} hours)"
+    return f"{days} {'DIAS' if days > 1 else 'DIA'}"
+
+
+async def timeout_user(member: discord.Member, duration: timedelta, reason: str = "Feedback negativo/ofensivo"):
+    """Aplica timeout (silenciamento) ao usuário - tenta discord.py, depois API REST"""
+    try:
+        # Método 1: discord.py com timedelta diretamente
+        await member.timeout(duration, reason=reason)
+        logger.info(f"✅ Usuário {member.name} silenciado via discord.py")
+        return True
+    except Exception as e:
+        logger.warning(f"⚠️ Falha discord.py ({e}), tentando via API REST...")
+        
+        # Método 2: Fallback para API REST
+        return await timeout_user_via_api(
+            guild_id=member.guild.id,
+            user_id=member.id,
+            duration=duration,
+            reason=reason
+        )
+
+
+async def delete_message_safely(message: discord.Message):
+    """Deleta uma mensagem de forma segura"""
+    try:
+        await message.delete()
+        logger.info(f"✅ Mensagem deletada: {message.id}")
+        return True
+    except discord.NotFound:
+        logger.warning(f"⚠️ Mensagem já foi deletada: {message.id}")
+        return False
+    except discord.Forbidden:
+        logger.error(f"❌ Sem permissão para deletar mensagem: {message.id}")
+        return False
+    except Exception as e:
+        logger.error(f"❌ Erro ao deletar mensagem: {e}")
+        return False
+
+
+async def delete_messages_safely(messages: list):
+    """Apaga várias mensagens do mesmo canal numa única chamada (bulk delete), com fallback uma a uma"""
+    if len(messages) == 1:
+        return await delete_message_safely(messages[0])
+    try:
+        await messages[0].channel.delete_messages(messages)
+        logger.info(f"✅ {len(messages)} mensagens deletadas em lote")
+        return True
+    except Exception as e:
+        logger.warning(f"⚠️ Bulk delete falhou ({e}) - deletando uma a uma")
+        results = await asyncio.gather(*[delete_message_safely(m) for m in messages])
+        return all(results)
+
+
+# ==================== CACHE DE ENTIDADES ====================
+
+class EntityCache:
+    """Líderes, membros e servidores resolvidos uma vez e reaproveitados.
+
+    - Líder: o canal de DM fica guardado; relatórios não buscam o usuário nem abrem a DM de novo.
+    - Membros: o cache do discord.py é consultado primeiro; só quem não está nele é buscado
+      via API (uma vez, LRU com `max_members`), e apenas quando há punição a aplicar.
+    - Servidores: handles dos servidores configurados, guardados no on_ready.
+
+    É aquecido no on_ready e atualizado pelos eventos de membro (on_member_update/remove).
+    """
+
+    def __init__(self, max_members: int):
+        self.max_members = max(1, max_members)
+        self.leaders: dict[int, discord.abc.Messageable] = {}  # leader_id -> canal de DM
+        self.members: OrderedDict[tuple[int, int], discord.Member] = OrderedDict()
+        self.guilds: dict[int, discord.Guild] = {}
+        self.lock = asyncio.Lock()
+        self.hits = 0
+        self.fetches = 0
+
+    async def warm(self, client: commands.Bot):
+        """Resolve os servidores e as DMs dos líderes de todos os canais configurados"""
+        for config in channel_configs.values():
+            guild = client.get_guild(config.guild_id)
+            if guild is not None:
+                self.guilds[guild.id] = guild
+            try:
+                await self.leader(guild, config.leader_id)
+            except Exception as e:
+                logger.warning(f"⚠️ Não foi possível resolver o líder {config.leader_id}: {e}")
+        logger.info(f"✅ Cache de entidades: {len(self.guilds)} servidor(es), {len(self.leaders)} líder(es)")
+
+    def guild(self, guild_id: int) -> discord.Guild | None:
+        guild = self.guilds.get(guild_id)
+        if guild is None:
+            guild = bot.get_guild(guild_id)
+            if guild is not None:
+                self.guilds[guild_id] = guild
+        return guild
+
+    async def leader(self, guild: discord.Guild | None, leader_id: int) -> discord.abc.Messageable:
+        """Canal de DM do líder (resolvido uma vez)"""
+        channel = self.leaders.get(leader_id)
+        if channel is not None:
+            self.hits += 1
+            return channel
+        async with self.lock:
+            channel = self.leaders.get(leader_id)
+            if channel is not None:
+                return channel
+            user = (guild.get_member(leader_id) if guild else None) or bot.get_user(leader_id)
+            if user is None:
+                self.fetches += 1
+                metrics.inc("feedback_entity_fetch_total", tipo="lider")
+                user = await bot.fetch_user(leader_id)
+            channel = user.dm_channel or await user.create_dm()
+            self.leaders[leader_id] = channel
+            return channel
+
+    def forget_leader(self, leader_id: int):
+        """Descarta a DM do líder (ex.: envio falhou); a próxima será resolvida de novo"""
+        self.leaders.pop(leader_id, None)
+
+    async def member(self, guild: discord.Guild, user) -> discord.Member | None:
+        """Membro do servidor para o autor (None se ele saiu do servidor)"""
+        if isinstance(user, discord.Member):
+            return user
+        member = guild.get_member(user.id)
+        if member is not None:
+            return member
+        key = (guild.id, user.id)
+        member = self.members.get(key)
+        if member is not None:
+            self.hits += 1
+            self.members.move_to_end(key)
+            return member
+        self.fetches += 1
+        metrics.inc("feedback_entity_fetch_total", tipo="membro")
+        try:
+            member = await guild.fetch_member(user.id)
+        except discord.NotFound:
+            return None
+        except discord.HTTPException as e:
+            logger.warning(f"⚠️ Erro ao buscar o membro {user.id}: {e}")
+            return None
+        self._store_member(member)
+        return member
+
+    def _store_member(self, member: discord.Member):
+        key = (member.guild.id, member.id)
+        self.members[key] = member
+        self.members.move_to_end(key)
+        while len(self.members) > self.max_members:
+            self.members.popitem(last=False)
+
+    def update_member(self, member: discord.Member):
+        """on_member_update: troca o objeto guardado (cargos, timeout) pelo atual"""
+        if (member.guild.id, member.id) in self.members:
+            self._store_member(member)
+
+    def forget_member(self, member: discord.Member):
+        """on_member_remove: o membro saiu do servidor"""
+        self.members.pop((member.guild.id, member.id), None)
+
+    def stats(self) -> dict:
+        return {
+            "leaders": len(self.leaders),
+            "members": len(self.members),
+            "guilds": len(self.guilds),
+            "hits": self.hits,
+            "fetches": self.fetches,
+        }
+
+
+entity_cache = EntityCache(max_members=MEMBER_CACHE_MAX)
+
+
+# ==================== CUPONS POR DM ====================
+
+class CouponDispatcher:
+    """Fila de baixa prioridade para as DMs de agradecimento com cupom.
+
+    - Um cupom por usuário a cada `dedupe_period` segundos (contando os que ainda estão na fila).
+    - Usuários com DMs fechadas (Forbidden) ficam registrados no histórico e nunca são tentados de novo.
+    - As DMs saem uma por vez, a cada `send_interval` segundos, e esperam enquanto a moderação
+      precisar da API: `busy_depth` mensagens ou mais na fila de moderação ou folga do limite
+      global abaixo de `min_headroom`. Depois de `max_wait` segundos esperando, um cupom sai
+      mesmo assim (com tráfego constante, a fila nunca esvazia).
+    """
+
+    def __init__(self, dedupe_period: float, max_pending: int, send_interval: float, min_headroom: float,
+                 busy_depth: int, max_wait: float):
+        self.dedupe_period = dedupe_period
+        self.max_pending = max(1, max_pending)
+        self.send_interval = send_interval
+        self.min_headroom = min_headroom
+        self.busy_depth = max(1, busy_depth)
+        self.max_wait = max_wait
+        self.pending: OrderedDict[int, tuple] = OrderedDict()  # user_id -> (usuário, config)
+        self.wakeup = asyncio.Event()
+        self.task: asyncio.Task | None = None
+        self.sent = 0
+        self.deduped = 0
+        self.closed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.yields = 0
+        self.forced = 0
+
+    async def start(self):
+        self.task = asyncio.create_task(self._loop(), name="coupon-dispatcher")
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        if self.pending:
+            logger.warning(f"⚠️ {len(self.pending)} cupom(ns) não enviado(s) ao encerrar")
+
+    def offer(self, user: discord.User, config: ChannelConfig) -> str:
+        """Agenda o cupom do usuário; retorna o resultado (agendado, repetido, dm_fechada, fila_cheia)"""
+        result = self._admit(user)
+        metrics.inc("feedback_coupon_total", resultado=result)
+        if result == "agendado":
+            self.pending[user.id] = (user, config)
+            self.wakeup.set()
+        return result
+
+    def _admit(self, user: discord.User) -> str:
+        if moderation_store.dm_closed(user.id):
+            self.closed += 1
+            return "dm_fechada"
+        last_sent = moderation_store.last_coupon_at(user.id)
+        if user.id in self.pending or (last_sent and time.time() - last_sent < self.dedupe_period):
+            self.deduped += 1
+            return "repetido"
+        if len(self.pending) >= self.max_pending:
+            self.dropped += 1
+            return "fila_cheia"
+        return "agendado"
+
+    def moderation_busy(self) -> bool:
+        """A moderação está usando a API (ou tem várias mensagens esperando)"""
+        return (
+            moderation_queue.queue.qsize() >= self.busy_depth
+            or discord_rate_limiter.headroom() < self.min_headroom
+        )
+
+    async def _loop(self):
+        while True:
+            if not self.pending:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+            waiting_since = time.monotonic()
+            while self.moderation_busy():
+                if self.max_wait > 0 and time.monotonic() - waiting_since >= self.max_wait:
+                    self.forced += 1
+                    logger.info(f"🎁 Cupom esperando há {self.max_wait:.0f}s pela moderação - enviando mesmo assim")
+                    break
+                self.yields += 1
+                await asyncio.sleep(0.5)
+            _, (user, config) = self.pending.popitem(last=False)
+            await self._send(user, config)
+            if self.send_interval > 0:
+                await asyncio.sleep(self.send_interval)
+
+    async def _send(self, user: discord.User, config: ChannelConfig):
+        started = time.monotonic()
+        try:
+            await user.send(
+                f"🎉 **Thank you for your positive feedback!**\n\n"
+                f"🎁 5% off coupon: **{config.coupon_code}**\n"
+                f"🔗 {config.store_url}"
+            )
+            moderation_store.record_coupon(user.id)
+            self.sent += 1
+            metrics.inc("feedback_coupon_total", resultado="enviado")
+        except discord.Forbidden:
+            logger.info(f"📪 {user.name} não aceita DMs - cupom não será mais enviado")
+            moderation_store.mark_dm_closed(user.id)
+            self.closed += 1
+            metrics.inc("feedback_coupon_total", resultado="dm_fechada")
+        except Exception as e:
+            logger.warning(f"⚠️ Erro ao enviar cupom para {user.name}: {e}")
+            self.failed += 1
+            metrics.inc("feedback_failures_total", caminho="acao_cupom")
+        metrics.observe("feedback_action_seconds", time.monotonic() - started, acao="cupom")
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self.pending),
+            "sent": self.sent,
+            "deduped": self.deduped,
+            "closed": self.closed,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "yields": self.yields,
+            "forced": self.forced,
+        }
+
+
+coupon_dispatcher = CouponDispatcher(
+    dedupe_period=COUPON_DEDUPE_HOURS * 3600,
+    max_pending=COUPON_QUEUE_MAX,
+    send_interval=COUPON_SEND_INTERVAL,
+    min_headroom=COUPON_MIN_HEADROOM,
+    busy_depth=COUPON_BUSY_QUEUE_DEPTH,
+    max_wait=COUPON_MAX_WAIT
+)
+
+
+# ==================== DIÁRIO DE AÇÕES ====================
+
+def serialize_incident(incident: dict) -> dict:
+    """Incidente em JSON (o servidor vira ID, a duração vira segundos)"""
+    data = {key: value for key, value in incident.items() if key != "guild"}
+    data["guild_id"] = incident["guild"].id if incident.get("guild") else None
+    duration = incident.get("timeout_duration")
+    data["timeout_duration"] = duration.total_seconds() if duration else None
+    data["timestamp"] = incident["timestamp"].isoformat()
+    return data
+
+
+def deserialize_incident(data: dict) -> dict:
+    incident = {key: value for key, value in data.items() if key != "guild_id"}
+    incident["guild"] = entity_cache.guild(data["guild_id"]) if data.get("guild_id") else None
+    incident["timeout_duration"] = timedelta(seconds=data["timeout_duration"]) if data.get("timeout_duration") else None
+    incident["timestamp"] = datetime.fromisoformat(data["timestamp"])
+    return incident
+
+
+class ActionJournal:
+    """Diário write-ahead das ações de moderação (tabela action_journal do histórico).
+
+    Antes da primeira ação, o veredito e as ações planejadas são gravados na hora (fora do
+    lote); cada ação concluída é marcada e a entrada é apagada quando todas terminam. Se o
+    processo parar no meio, as entradas abertas são lidas no setup_hook e as ações que
+    faltam são refeitas no on_ready. Refazer é idempotente: excluir uma mensagem já excluída
+    é ignorado e o silenciamento vai até o mesmo horário final. O relatório ao líder só conta
+    como feito quando o resumo com o incidente é enviado: até lá a entrada fica aberta. O
+    aviso por DM e o relatório podem se repetir se o processo parar entre o envio e a marcação.
+    """
+
+    def __init__(self, store: ModerationStore):
+        self.store = store
+        self.recovered: list[dict] = []
+        self.recovered_message_ids: set[int] = set()
+        self.interrupted = 0
+        self.replayed = 0
+
+    async def load(self):
+        """Lê as entradas abertas da execução anterior (refeitas no on_ready)"""
+        self.recovered = await self.store.journal_pending()
+        self.interrupted = len(self.recovered)
+        for entry in self.recovered:
+            self.recovered_message_ids.update(entry["payload"]["message_ids"])
+        if self.recovered:
+            logger.warning(f"📒 {len(self.recovered)} moderação(ões) interrompida(s) serão retomadas")
+
+    async def begin(self, message: discord.Message, burst: list, incident: dict, timeout_duration: timedelta,
+                    timeout_reason: str, steps: list) -> int | None:
+        """Grava o veredito e as ações planejadas antes de executá-las"""
+        try:
+            return await self.store.journal_open(message.id, {
+                "message_ids": [m.id for m in burst or [message]],
+                "channel_id": message.channel.id,
+                "guild_id": message.guild.id if message.guild else None,
+                "user_id": message.author.id,
+                "timeout_until": time.time() + timeout_duration.total_seconds(),
+                "timeout_reason": timeout_reason,
+                "incident": serialize_incident(incident),
+                "steps": steps,
+            })
+        except Exception as e:
+            logger.error(f"❌ Erro ao gravar o diário de ações ({message.id}): {e}")
+            metrics.inc("feedback_failures_total", caminho="diario")
+            return None
+
+    async def track(self, entry_id: int | None, step: str, coro):
+        """Executa a ação e, se deu certo, marca no diário"""
+        result = await coro
+        if entry_id is not None and result is not False:
+            await self.store.journal_mark(entry_id, step)
+        return result
+
+    async def finish(self, entry_id: int | None, incident: dict = None):
+        """Ações terminadas: fecha a entrada, ou deixa para `delivered` se o relatório ainda está no resumo"""
+        if entry_id is None:
+            return
+        if incident is not None:
+            incident["actions_done"] = True
+            if not incident.get("delivered"):
+                return
+        await self.store.journal_close(entry_id)
+
+    async def delivered(self, incidents: list):
+        """Resumo enviado ao líder: fecha as entradas cujas outras ações já terminaram"""
+        for incident in incidents:
+            incident["delivered"] = True
+            if incident.get("journal_id") is not None and incident.get("actions_done"):
+                await self.store.journal_close(incident["journal_id"])
+
+    async def replay(self, client: commands.Bot):
+        """Refaz as ações que faltaram nas entradas da execução anterior"""
+        entries, self.recovered = self.recovered, []
+        for entry in entries:
+            pending = [step for step in entry["payload"]["steps"] if step not in entry["done"]]
+            logger.info(f"📒 Retomando a moderação de {entry['message_id']}: {', '.join(pending) or 'nada pendente'}")
+            incident = deserialize_incident(entry["payload"]["incident"])
+            incident["journal_id"] = entry["id"]
+            for step in pending:
+                try:
+                    await asyncio.wait_for(
+                        self._replay_step(client, step, entry["payload"], incident), timeout=ACTION_TIMEOUT
+                    )
+                except Exception as e:
+                    logger.error(f"❌ Ação '{step}' da mensagem {entry['message_id']} não foi retomada: {e}")
+                    metrics.inc("feedback_failures_total", caminho=f"acao_{step}")
+            await self.finish(entry["id"], incident if "relatorio_lider" in pending else None)
+            self.replayed += 1
+            metrics.inc("feedback_journal_replayed_total")
+
+    async def _replay_step(self, client: commands.Bot, step: str, payload: dict, incident: dict):
+        guild = entity_cache.guild(payload["guild_id"]) if payload["guild_id"] else None
+
+        if step == "excluir":
+            channel = client.get_channel(payload["channel_id"]) or await client.fetch_channel(payload["channel_id"])
+            for message_id in payload["message_ids"]:
+                try:
+                    await channel.get_partial_message(message_id).delete()
+                except discord.NotFound:
+                    pass  # Já excluída
+
+        elif step == "silenciar":
+            remaining = payload["timeout_until"] - time.time()
+            if remaining > 0 and guild is not None:
+                member = await entity_cache.member(guild, discord.Object(id=payload["user_id"]))
+                if member is not None:
+                    await timeout_user(member, timedelta(seconds=remaining), payload["timeout_reason"])
+
+        elif step == "avisar_usuario":
+            user = client.get_user(payload["user_id"]) or await client.fetch_user(payload["user_id"])
+            await send_user_warning(
+                user, incident["classification"], incident["is_edit"], incident["timeout_duration"],
+                incident["offenses"], get_channel_config(payload["channel_id"])
+            )
+
+        elif step == "relatorio_lider":
+            await leader_reporter.report(incident)
+
+    def stats(self) -> dict:
+        return {"interrupted": self.interrupted, "replayed": self.replayed, "pending": len(self.recovered)}
+
+
+action_journal = ActionJournal(moderation_store)
+
+
+# ==================== EXECUTOR DE AÇÕES ====================
+
+async def run_action(name: str, coro, timeout: float = ACTION_TIMEOUT) -> dict:
+    """Executa uma ação de moderação com limite de tempo e registra o resultado"""
+    started = time.monotonic()
+    discord_rate_limiter.record_request()
+    error = None
+    try:
+        ok = await asyncio.wait_for(coro, timeout=timeout) is not False
+    except asyncio.TimeoutError:
+        ok, error = False, f"timeout ({timeout:.0f}s)"
+    except Exception as e:
+        ok, error = False, str(e)
+    elapsed = time.monotonic() - started
+    metrics.observe("feedback_action_seconds", elapsed, acao=name)
+    if not ok:
+        metrics.inc("feedback_failures_total", caminho=f"acao_{name}")
+    if error:
+        logger.error(f"❌ Ação '{name}' falhou: {error}")
+    return {"acao": name, "ok": ok, "duracao": elapsed, "erro": error}
+
+
+async def resolve_leader(guild: discord.Guild, leader_id: int = None):
+    """Obtém o canal de DM do líder (do cache de entidades; busca via API só na primeira vez)"""
+    return await entity_cache.leader(guild, leader_id or LEADER_ID)
+
+
+async def execute_moderation_actions(
+    message: discord.Message,
+    classification: str,
+    reason: str,
+    confidence: float,
+    timeout_duration: timedelta,
+    timeout_reason: str,
+    is_edit: bool = False,
+    original_content: str = None,
+    started: float = None,
+    offenses: int = 1,
+    burst: list = None,
+    config: ChannelConfig = None
+) -> dict:
+    """Apaga a mensagem imediatamente e executa os efeitos colaterais em paralelo.
+
+    Retorna o registro do resultado: cada ação com ok/duração/erro, o tempo até a exclusão
+    e o tempo total (contados a partir de `started`). Com `burst` (rajada agrupada), todas as
+    mensagens do grupo são apagadas de uma vez e o usuário recebe um único aviso/relatório.
+    As ações passam pelo diário (ActionJournal) e são retomadas se o processo parar no meio.
+    """
+    started = started or time.monotonic()
+    config = config or get_channel_config(message.channel.id)
+    incident = build_incident(
+        message, classification, reason, confidence, is_edit, original_content, timeout_duration, offenses, burst,
+        config
+    )
+    entry_id = await action_journal.begin(
+        message, burst, incident, timeout_duration, timeout_reason,
+        ["excluir", "silenciar", "avisar_usuario", "relatorio_lider"]
+    )
+    incident["journal_id"] = entry_id
+
+    # 1. Excluir primeiro: a mensagem não fica visível enquanto o resto acontece
+    delete_result = await run_action("excluir", action_journal.track(
+        entry_id, "excluir", delete_messages_safely(burst) if burst else delete_message_safely(message)
+    ))
+    time_to_delete = time.monotonic() - started
+
+    # 2. Silenciamento, aviso e relatório são independentes entre si
+    actions = {}
+    member = await entity_cache.member(message.guild, message.author)
+    if member:
+        actions["silenciar"] = action_journal.track(
+            entry_id, "silenciar", timeout_user(member, timeout_duration, timeout_reason)
+        )
+    actions["avisar_usuario"] = action_journal.track(entry_id, "avisar_usuario", send_user_warning(
+        message.author, classification, is_edit, timeout_duration, offenses, config
+    ))
+    # O relatório é marcado no diário quando o resumo for enviado (LeaderReporter → ActionJournal.delivered)
+    actions["relatorio_lider"] = leader_reporter.report(incident)
+
+    results = await asyncio.gather(*[run_action(name, coro) for name, coro in actions.items()])
+    await action_journal.finish(entry_id, incident)
+
+    outcome = {
+        "mensagem_id": message.id,
+        "classificacao": classification,
+        "acoes": [delete_result, *results],
+        "tempo_ate_exclusao": time_to_delete,
+        "tempo_total": time.monotonic() - started,
+    }
+    failed = [r["acao"] for r in outcome["acoes"] if not r["ok"]]
+    logger.info(
+        "Ações de moderação concluídas",
+        extra=log_fields(
+            mensagem_id=message.id,
+            tempo_ate_exclusao_ms=round(time_to_delete * 1000),
+            tempo_total_ms=round(outcome["tempo_total"] * 1000),
+            falhas=",".join(failed) or None
+        )
+    )
+    return outcome
+
+
+def is_feedback_message(message: discord.Message) -> bool:
+    """Verifica se a mensagem deve ser moderada (canal de feedback configurado, autor humano)"""
+    return not message.author.bot and message.channel.id in channel_configs
+
+
+def burst_content(messages: list) -> str:
+    """Texto de uma rajada agrupada: o conteúdo das mensagens, uma por linha"""
+    return "\n".join(m.content for m in messages if m.content)
+
+
+def cheap_classify(text_content: str, image_count: int = 0) -> dict | None:
+    """Classificação local usada quando a fila está cheia (None = caso ambíguo, fica para a IA)"""
+    return local_classifier.classify(text_content, image_count)
+
+
+async def process_feedback_message(
+    message: discord.Message,
+    is_edit: bool = False,
+    original_content: str = None,
+    analysis: dict = None,
+    burst: list = None
+):
+    """Processa uma mensagem de feedback (nova ou editada) e retorna o registro do resultado.
+
+    `burst` é uma rajada agrupada pelo FloodGuard (a última mensagem vem em `message`):
+    o conteúdo de todas é classificado junto, numa única análise.
+    """
+    
+    # Ignorar mensagens do próprio bot e de outros canais
+    if not is_feedback_message(message):
+        return None
+
+    # Edição de uma mensagem que outra análise já excluiu (e puniu) enquanto esta esperava na fila
+    if is_edit and edit_tracker.was_removed(message.id):
+        edit_tracker.removed += 1
+        return None
+
+    started = time.monotonic()
+    config = get_channel_config(message.channel.id)
+    messages = burst or [message]
+    content = message.content if burst is None else burst_content(burst)
+    
+    if burst is not None:
+        kind = f"Rajada de {len(burst)} mensagens"
+    else:
+        kind = "Mensagem EDITADA" if is_edit else "Nova mensagem"
+    logger.info(
+        f"📨 {kind} de {message.author.name}",
+        extra=log_fields(
+            mensagem_id=message.id,
+            autor_id=message.author.id,
+            conteudo=content[:100],
+            anexos=sum(len(m.attachments) for m in messages)
+        )
+    )
+    
+    # Coletar anexos de imagem
+    image_attachments = [
+        attachment for m in messages for attachment in m.attachments
+        if attachment.filename.lower().endswith(IMAGE_EXTENSIONS)
+    ]
+    
+    # Analisar com IA (a não ser que já venha classificada)
+    if analysis is None:
+        logger.debug("🤖 Analisando feedback com IA...")
+        classify_started = time.monotonic()
+        analysis = await classify_feedback(content, image_attachments, message.id, config.prompt)
+        # Modo sombra: uma amostra também vai para o classificador candidato, em segundo plano
+        shadow_classifier.sample(message, content, image_attachments, config, analysis, time.monotonic() - classify_started)
+
+    # Sem veredito (IA fora do ar ou resposta inválida): nada de aprovar nem punir.
+    # A mensagem fica guardada e volta para a fila quando a IA se recuperar.
+    if analysis.get("erro"):
+        held_messages.hold(message, is_edit, original_content, burst)
+        return {"mensagem_id": message.id, "classificacao": "INDEFINIDO", "acoes": [], "guardada": True}
+
+    # Guardar o que foi classificado, para as próximas edições
+    for m in messages:
+        edit_tracker.remember(m, analysis)
+    held_messages.settle(message.id)
+    
+    classification = analysis.get("classificacao", "POSITIVO")
+    reason = analysis.get("motivo") or "Sem motivo especificado"
+    confidence = analysis.get("confianca", 0.5)
+    
+    metrics.inc("feedback_classifications_total", classificacao=classification, fonte=analysis.get("fonte", "ia"))
+    logger.info(
+        f"📊 Resultado: {classification} (Confiança: {confidence * 100:.1f}%)",
+        extra=log_fields(mensagem_id=message.id, classificacao=classification, confianca=confidence, motivo=reason)
+    )
+    
+    outcome = {"mensagem_id": message.id, "classificacao": classification, "acoes": []}
+    offenses = None
+
+    # Processar baseado na classificação
+    if classification == "POSITIVO":
+        logger.info("✅ Feedback positivo - Nenhuma ação necessária")
+        
+        # Cupom de desconto: fila de baixa prioridade, um por usuário no período
+        coupon_dispatcher.offer(message.author, config)
+            
+    elif classification == "POSSO_PERDER_CLIENTE":
+        # Reincidentes ficam mais tempo silenciados
+        offenses = moderation_store.register_offense(message.author.id, classification)
+        timeout_duration = escalate_timeout(config.timeout_medio, offenses)
+        logger.info(f"🟡 Feedback pode prejudicar - Excluindo e silenciando {describe_timeout(timeout_duration)}...")
+        
+        # Excluir, silenciar (1 HORA na primeira vez, ou o tempo do canal), avisar usuário e reportar ao líder
+        outcome = await execute_moderation_actions(
+            message, classification, reason, confidence,
+            timeout_duration=timeout_duration,
+            timeout_reason="Feedback pode prejudicar a imagem da loja",
+            is_edit=is_edit,
+            original_content=original_content,
+            started=started,
+            offenses=offenses,
+            burst=burst,
+            config=config
+        )
+        
+    elif classification == "NEGATIVO":
+        offenses = moderation_store.register_offense(message.author.id, classification)
+        timeout_duration = escalate_timeout(config.timeout_negativo, offenses)
+        logger.info(f"🔴 Feedback negativo - Excluindo e silenciando {describe_timeout(timeout_duration)}...")
+        
+        # Excluir, silenciar (1 DIA na primeira vez, ou o tempo do canal), avisar usuário e reportar ao líder
+        outcome = await execute_moderation_actions(
+            message, classification, reason, confidence,
+            timeout_duration=timeout_duration,
+            timeout_reason="Feedback negativo/ofensivo",
+            is_edit=is_edit,
+            original_content=original_content,
+            started=started,
+            offenses=offenses,
+            burst=burst,
+            config=config
+        )
+    
+    outcome["tempo_total"] = time.monotonic() - started
+    metrics.observe("feedback_message_seconds", outcome["tempo_total"], classificacao=classification)
+    moderation_store.record_verdict(message, analysis, outcome, is_edit, offenses, burst)
+    return outcome
+
+
+# ==================== FILA DE MODERAÇÃO ====================
+
+class FeedbackJob:
+    """Mensagem aguardando na fila de moderação"""
+
+    __slots__ = ("message", "is_edit", "original_content", "burst", "enqueued_at")
+
+    def __init__(self, message: discord.Message, is_edit: bool, original_content: str = None, burst: list = None):
+        self.message = message
+        self.is_edit = is_edit
+        self.original_content = original_content
+        self.burst = burst
+        self.enqueued_at = time.monotonic()
+
+
+class ModerationQueue:
+    """Fila limitada + pool de workers entre os eventos do Discord e a análise de IA"""
+
+    def __init__(self, workers: int, max_size: int, full_policy: str = "defer", defer_timeout: float = 30.0):
+        self.worker_count = max(1, workers)
+        self.full_policy = full_policy
+        self.defer_timeout = defer_timeout
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        self.workers: list[asyncio.Task] = []
+        self.current: dict[int, FeedbackJob] = {}  # worker -> mensagem em processamento
+        self.pending_ids: Counter = Counter()  # mensagens enviadas e ainda sem veredito
+        self.started_at = time.monotonic()
+
+        # Métricas
+        self.busy_workers = 0
+        self.busy_time = 0.0
+        self.processed = 0
+        self.shed = 0
+        self.cheap = 0
+        self.deferred = 0
+        self.recent_waits = deque(maxlen=200)
+
+    async def start(self):
+        """Inicia os workers"""
+        self.started_at = time.monotonic()
+        for i in range(self.worker_count):
+            self.workers.append(asyncio.create_task(self._worker(i), name=f"moderation-worker-{i}"))
+        logger.info(f"✅ Fila de moderação iniciada ({self.worker_count} workers, máx. {self.queue.maxsize} mensagens)")
+
+    async def stop(self):
+        """Cancela os workers"""
+        for task in self.workers:
+            task.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers.clear()
+
+    async def drain(self, timeout: float) -> bool:
+        """Espera a fila esvaziar e os workers terminarem (False se o tempo acabar antes)"""
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def unfinished_jobs(self) -> list[FeedbackJob]:
+        """Mensagens em processamento ou ainda na fila (chamado antes de `stop`, no encerramento)"""
+        jobs = list(self.current.values())
+        while not self.queue.empty():
+            jobs.append(self.queue.get_nowait())
+            self.queue.task_done()
+        return jobs
+
+    async def submit(self, message: discord.Message, is_edit: bool = False, original_content: str = None,
+                     burst: list = None) -> bool:
+        """Enfileira uma mensagem (ou rajada agrupada); aplica a política de fila cheia se necessário"""
+        job = FeedbackJob(message, is_edit, original_content, burst)
+        self._track(job)
+        try:
+            self.queue.put_nowait(job)
+            return True
+        except asyncio.QueueFull:
+            pass
+
+        if self.full_policy == "shed":
+            self._untrack(job)
+            self.shed += 1
+            logger.warning(f"⚠️ Fila cheia - mensagem {message.id} descartada")
+            return False
+
+        if self.full_policy == "cheap":
+            messages = burst or [message]
+            analysis = cheap_classify(burst_content(messages), sum(len(m.attachments) for m in messages))
+            if analysis is not None:
+                self.cheap += 1
+                logger.warning(f"⚠️ Fila cheia - classificação local para {message.id}")
+                try:
+                    await process_feedback_message(message, is_edit, original_content, analysis=analysis, burst=burst)
+                finally:
+                    self._untrack(job)
+                return True
+            # Ambígua: nada de aprovar (e mandar cupom) sem a IA; espera uma vaga como no defer
+            logger.warning(f"⚠️ Fila cheia - {message.id} ambígua para a classificação local, esperando vaga para a IA")
+
+        # defer: espera uma vaga até o limite de tempo
+        self.deferred += 1
+        try:
+            await asyncio.wait_for(self.queue.put(job), timeout=self.defer_timeout)
+            return True
+        except asyncio.TimeoutError:
+            self._untrack(job)
+            self.shed += 1
+            logger.warning(f"⚠️ Fila cheia por {self.defer_timeout:.0f}s - mensagem {message.id} descartada")
+            return False
+
+    def _track(self, job: FeedbackJob):
+        self.pending_ids.update(m.id for m in job.burst or [job.message])
+
+    def _untrack(self, job: FeedbackJob):
+        self.pending_ids.subtract(m.id for m in job.burst or [job.message])
+        for m in job.burst or [job.message]:
+            if self.pending_ids[m.id] <= 0:
+                del self.pending_ids[m.id]
+
+    def is_pending(self, message_id: int) -> bool:
+        """Mensagem na fila ou em análise (nova ou edição)"""
+        return message_id in self.pending_ids
+
+    async def _worker(self, worker_id: int):
+        while True:
+            job = await self.queue.get()
+            wait = time.monotonic() - job.enqueued_at
+            self.recent_waits.append(wait)
+            metrics.observe("feedback_queue_wait_seconds", wait)
+            self.busy_workers += 1
+            self.current[worker_id] = job
+            started = time.monotonic()
+            try:
+                await process_feedback_message(job.message, job.is_edit, job.original_content, burst=job.burst)
+            except Exception:
+                logger.exception(f"❌ Erro no worker {worker_id}")
+            finally:
+                self._untrack(job)
+                self.current.pop(worker_id, None)
+                self.busy_time += time.monotonic() - started
+                self.busy_workers -= 1
+                self.processed += 1
+                self.queue.task_done()
+
+    def stats(self) -> dict:
+        """Profundidade da fila, tempo de espera e utilização dos workers"""
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        waits = sorted(self.recent_waits)
+        return {
+            "depth": self.queue.qsize(),
+            "max_size": self.queue.maxsize,
+            "workers": self.worker_count,
+            "busy_workers": self.busy_workers,
+            "utilization": min(self.busy_time / (elapsed * self.worker_count), 1.0),
+            "avg_wait": sum(waits) / len(waits) if waits else 0.0,
+            "max_wait": waits[-1] if waits else 0.0,
+            "processed": self.processed,
+            "shed": self.shed,
+            "cheap": self.cheap,
+            "deferred": self.deferred,
+        }
+
+
+moderation_queue = ModerationQueue(
+    workers=QUEUE_WORKERS,
+    max_size=QUEUE_MAX_SIZE,
+    full_policy=QUEUE_FULL_POLICY,
+    defer_timeout=QUEUE_DEFER_TIMEOUT
+)
+
+class HeldMessages:
+    """Mensagens sem veredito porque a IA estava indisponível.
+
+    Cada mensagem fica guardada uma vez (a versão mais recente) e volta para a fila de
+    moderação quando um circuito da IA fecha de novo. A cada `retry_interval` segundos,
+    com os circuitos ainda abertos, uma mensagem é liberada como teste de recuperação.
+    Depois de `max_attempts` análises sem veredito (ex.: resposta sempre fora do formato),
+    a mensagem sai da espera, fica marcada para revisão e o líder do canal é avisado.
+    """
+
+    def __init__(self, max_size: int, retry_interval: float, max_attempts: int):
+        self.max_size = max(1, max_size)
+        self.retry_interval = retry_interval
+        self.max_attempts = max(1, max_attempts)
+        self.jobs: OrderedDict[int, FeedbackJob] = OrderedDict()
+        self.attempts: dict[int, int] = {}  # mensagem -> análises sem veredito
+        self.needs_review: OrderedDict[int, FeedbackJob] = OrderedDict()
+        self.wakeup = asyncio.Event()
+        self.task: asyncio.Task | None = None
+        self.tasks: set[asyncio.Task] = set()
+        self.held = 0
+        self.released = 0
+        self.dropped = 0
+        self.reviews = 0
+
+    async def start(self):
+        self.task = asyncio.create_task(self._loop(), name="held-messages")
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        # Avisos de revisão em andamento entram no resumo do líder antes de ele ser enviado
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    def hold(self, message: discord.Message, is_edit: bool = False, original_content: str = None,
+             burst: list = None):
+        """Guarda a mensagem para reanálise (ou marca para revisão, se já esgotou as tentativas)"""
+        job = FeedbackJob(message, is_edit, original_content, burst)
+        # Só conta a tentativa com a IA no ar: numa queda, esperar é o esperado
+        attempts = self.attempts.get(message.id, 0) + (1 if ai_router.available() else 0)
+        if attempts >= self.max_attempts:
+            self._flag_for_review(job, attempts)
+            return
+        self.attempts[message.id] = attempts
+        self.jobs[message.id] = job
+        self.jobs.move_to_end(message.id)
+        self.held += 1
+        metrics.inc("feedback_held_total")
+        logger.warning(f"⏸️ Mensagem {message.id} guardada até a IA voltar ({len(self.jobs)} na espera)")
+        while len(self.jobs) > self.max_size:
+            dropped_id, _ = self.jobs.popitem(last=False)
+            self.attempts.pop(dropped_id, None)
+            self.dropped += 1
+            logger.error(f"❌ Espera cheia - mensagem {dropped_id} não será reanalisada")
+
+    def settle(self, message_id: int):
+        """A mensagem recebeu veredito: zera as tentativas"""
+        self.attempts.pop(message_id, None)
+
+    def _flag_for_review(self, job: FeedbackJob, attempts: int):
+        """Tira a mensagem da espera e avisa o líder: nenhuma ação automática é tomada"""
+        message = job.message
+        self.jobs.pop(message.id, None)
+        self.attempts.pop(message.id, None)
+        self.needs_review[message.id] = job
+        while len(self.needs_review) > self.max_size:
+            self.needs_review.popitem(last=False)
+        self.reviews += 1
+        metrics.inc("feedback_held_review_total")
+        logger.error(f"❌ Mensagem {message.id} sem veredito após {attempts} tentativa(s) - aguardando revisão do líder")
+        for m in job.burst or [message]:
+            moderation_store.close_message(m.channel.id, m.id)
+        incident = build_incident(
+            message, "REVISAR", f"A IA não deu um veredito válido em {attempts} tentativa(s)", 0.0,
+            is_edit=job.is_edit, original_content=job.original_content, burst=job.burst
+        )
+        task = asyncio.create_task(leader_reporter.report(incident))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def wake(self):
+        """Chamado quando um circuito da IA fecha"""
+        self.wakeup.set()
+
+    async def _loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.retry_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            if not self.jobs:
+                continue
+            # IA de volta: libera tudo; ainda fora: só uma, que serve de teste do circuito
+            count = len(self.jobs) if ai_router.available() else 1
+            logger.info(f"▶️ Liberando {count} mensagem(ns) guardada(s) para reanálise")
+            for _ in range(count):
+                if not self.jobs:
+                    break
+                _, job = self.jobs.popitem(last=False)
+                self.released += 1
+                await moderation_queue.submit(job.message, job.is_edit, job.original_content, burst=job.burst)
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self.jobs),
+            "held": self.held,
+            "released": self.released,
+            "dropped": self.dropped,
+            "needs_review": len(self.needs_review),
+            "reviews": self.reviews,
+        }
+
+
+held_messages = HeldMessages(max_size=HOLD_MAX, retry_interval=HOLD_RETRY_INTERVAL, max_attempts=HOLD_MAX_ATTEMPTS)
+ai_router.on_recover(held_messages.wake)
+
+metrics.gauge("feedback_queue_depth", lambda: moderation_queue.queue.qsize())
+metrics.gauge("feedback_queue_busy_workers", lambda: moderation_queue.busy_workers)
+metrics.gauge("feedback_queue_utilization", lambda: moderation_queue.stats()["utilization"])
+metrics.gauge("feedback_queue_shed", lambda: moderation_queue.shed)
+metrics.gauge("feedback_held_pending", lambda: len(held_messages.jobs))
+metrics.gauge("feedback_cache_hits", lambda: classification_cache.hits)
+metrics.gauge("feedback_cache_misses", lambda: classification_cache.misses)
+metrics.gauge("feedback_local_decided", lambda: local_classifier.decided)
+metrics.gauge("feedback_local_escalated", lambda: local_classifier.escalated)
+
+
+# ==================== EDIÇÕES ====================
+
+def message_fingerprint(message: discord.Message) -> dict:
+    """O que é classificado em uma mensagem: texto normalizado + IDs dos anexos de imagem"""
+    return {
+        "text": normalize_feedback_text(message.content),
+        "attachments": tuple(
+            att.id for att in message.attachments if att.filename.lower().endswith(IMAGE_EXTENSIONS)
+        ),
+    }
+
+
+class EditTracker:
+    """Reanálise incremental de mensagens editadas.
+
+    Guarda o último veredito e a impressão digital do que foi classificado em cada mensagem,
+    ignora edições triviais e agrupa edições seguidas (debounce) em uma única análise. A edição
+    espera o veredito da mensagem original e é descartada se ela já foi excluída (e punida).
+    """
+
+    def __init__(self, debounce: float, similarity_threshold: float, max_records: int):
+        self.debounce = debounce
+        self.similarity_threshold = similarity_threshold
+        self.max_records = max_records
+        self.records: OrderedDict[int, dict] = OrderedDict()
+        self.pending: dict[int, dict] = {}
+
+        # Estatísticas
+        self.edits = 0
+        self.skipped = 0
+        self.debounced = 0
+        self.reanalyzed = 0
+        self.removed = 0
+
+    def remember(self, message: discord.Message, analysis: dict):
+        """Guarda o veredito e a impressão digital da mensagem classificada"""
+        self.records[message.id] = {"fingerprint": message_fingerprint(message), "analysis": analysis}
+        self.records.move_to_end(message.id)
+        while len(self.records) > self.max_records:
+            self.records.popitem(last=False)
+
+    def mark_deleted(self, message: discord.Message):
+        """Mensagem excluída sem análise (autor silenciado): edições dela não são reanalisadas"""
+        self.records[message.id] = {"fingerprint": message_fingerprint(message), "analysis": None, "deleted": True}
+        self.records.move_to_end(message.id)
+        while len(self.records) > self.max_records:
+            self.records.popitem(last=False)
+
+    def was_removed(self, message_id: int) -> bool:
+        """A mensagem já foi excluída (veredito NEGATIVO/POSSO_PERDER_CLIENTE ou autor silenciado)"""
+        record = self.records.get(message_id)
+        if record is None:
+            return False
+        if record.get("deleted"):
+            return True
+        return record["analysis"].get("classificacao") in ("NEGATIVO", "POSSO_PERDER_CLIENTE")
+
+    def is_trivial(self, previous: dict, current: dict) -> bool:
+        """Edição que não muda o veredito: mesmo texto (ou quase) e nenhuma imagem nova"""
+        if not set(current["attachments"]) <= set(previous["attachments"]):
+            return False
+        if current["text"] == previous["text"]:
+            return True
+
+        similarity = difflib.SequenceMatcher(None, previous["text"], current["text"]).ratio()
+        if similarity < self.similarity_threshold:
+            return False
+        # Correção de digitação só é trivial se não acrescentar ataque ou negação ("é bom" → "não é bom")
+        added = " ".join(set(current["text"].split()) - set(previous["text"].split()))
+        return not local_classifier.has_signal_terms(added)
+
+    async def handle_edit(self, before: discord.Message, after: discord.Message):
+        """Agenda a reanálise da mensagem editada (com debounce)"""
+        self.edits += 1
+        pending = self.pending.get(after.id)
+        if pending:
+            # Nova edição dentro da janela: substitui a anterior, mantém o conteúdo original
+            pending["task"].cancel()
+            self.debounced += 1
+            original_content = pending["original_content"]
+            previous = pending["previous"]
+        else:
+            original_content = before.content
+            record = self.records.get(after.id)
+            previous = record["fingerprint"] if record else message_fingerprint(before)
+
+        task = asyncio.create_task(self._reanalyze_later(after))
+        self.pending[after.id] = {
+            "task": task,
+            "original_content": original_content,
+            "previous": previous,
+        }
+
+    async def _reanalyze_later(self, message: discord.Message):
+        await asyncio.sleep(self.debounce)
+        # Original (ou edição anterior) ainda numa rajada, na fila ou em análise: espera o veredito dele
+        while moderation_queue.is_pending(message.id) or flood_guard.is_collecting(message):
+            await asyncio.sleep(0.2)
+        pending = self.pending.pop(message.id)
+
+        if self.was_removed(message.id):
+            self.removed += 1
+            logger.debug(f"⏭️ Edição em {message.id} ignorada - a mensagem já foi excluída")
+            return
+
+        if self.is_trivial(pending["previous"], message_fingerprint(message)):
+            self.skipped += 1
+            logger.debug(f"⏭️ Edição trivial em {message.id} - mantendo o veredito anterior")
+            return
+
+        self.reanalyzed += 1
+        logger.info(f"🔄 Mensagem EDITADA detectada de {message.author.name}", extra=log_fields(mensagem_id=message.id))
+        await moderation_queue.submit(message, is_edit=True, original_content=pending["original_content"])
+
+    async def stop(self):
+        """Cancela as reanálises agendadas (encerramento: a fila não aceita mais mensagens)"""
+        tasks = [pending["task"] for pending in self.pending.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.pending.clear()
+
+    def stats(self) -> dict:
+        """Edições recebidas, ignoradas, agrupadas e reanalisadas"""
+        return {
+            "edits": self.edits,
+            "skipped": self.skipped,
+            "debounced": self.debounced,
+            "reanalyzed": self.reanalyzed,
+            "removed": self.removed,
+        }
+
+
+edit_tracker = EditTracker(
+    debounce=EDIT_DEBOUNCE,
+    similarity_threshold=EDIT_SIMILARITY_THRESHOLD,
+    max_records=EDIT_TRACK_MAX
+)
+
+
+# ==================== CONTROLE DE FLOOD ====================
+
+def is_timed_out(user) -> bool:
+    """Usuário já silenciado (só membros têm timeout)"""
+    check = getattr(user, "is_timed_out", None)
+    return bool(check and check())
+
+
+class FloodGuard:
+    """Limite por usuário na entrada da fila de moderação.
+
+    Cada autor tem um token bucket (`burst` mensagens, repostas a `rate` por segundo).
+    Com tokens, a mensagem segue para a fila normalmente. Sem tokens, ela entra na rajada
+    do autor: as mensagens dos próximos `collapse_window` segundos (até `collapse_max`)
+    são analisadas juntas, numa única classificação, e apagadas com bulk delete se forem
+    reprovadas. Mensagens de quem já está silenciado são apagadas direto, sem análise.
+    """
+
+    def __init__(self, burst: int, rate: float, collapse_window: float, collapse_max: int):
+        self.capacity = burst
+        self.rate = rate
+        self.collapse_window = collapse_window
+        self.collapse_max = max(1, collapse_max)
+        self.buckets: dict[int, list[float]] = {}  # user_id -> [tokens, atualizado em]
+        self.bursts: dict[int, list] = {}
+        self.timers: dict[int, asyncio.Task] = {}
+        self.tasks: set[asyncio.Task] = set()
+        self.allowed = 0
+        self.collapsed = 0
+        self.flushed = 0
+        self.direct_deletes = 0
+
+    def _take_token(self, user_id: int) -> bool:
+        now = time.monotonic()
+        tokens, updated_at = self.buckets.get(user_id, (self.capacity, now))
+        tokens = min(self.capacity, tokens + (now - updated_at) * self.rate)
+        allowed = tokens >= 1
+        self.buckets[user_id] = [tokens - 1 if allowed else tokens, now]
+        if len(self.buckets) > 10000:
+            self._prune(now)
+        return allowed
+
+    def _prune(self, now: float):
+        """Esquece os buckets já cheios (equivalem a um usuário novo)"""
+        for user_id in [
+            user_id for user_id, (tokens, updated_at) in self.buckets.items()
+            if tokens + (now - updated_at) * self.rate >= self.capacity
+        ]:
+            del self.buckets[user_id]
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def admit(self, message: discord.Message):
+        """Decide o caminho de uma mensagem nova do canal de feedback"""
+        if is_timed_out(message.author):
+            self.direct_deletes += 1
+            metrics.inc("feedback_flood_total", acao="silenciado")
+            logger.info(f"🔇 {message.author.name} já está silenciado - excluindo {message.id} sem análise")
+            self._spawn(run_action("excluir", delete_message_safely(message)))
+            edit_tracker.mark_deleted(message)
+            moderation_store.close_message(message.channel.id, message.id)
+            return
+
+        user_id = message.author.id
+        burst = self.bursts.get(user_id)
+        if burst is not None:
+            burst.append(message)
+            self.collapsed += 1
+            metrics.inc("feedback_flood_total", acao="agrupada")
+            if len(burst) >= self.collapse_max:
+                await self._flush(user_id)
+            return
+
+        if self.capacity <= 0 or self._take_token(user_id):
+            self.allowed += 1
+            await moderation_queue.submit(message, is_edit=False)
+            return
+
+        # Limite estourado: começa a juntar a rajada deste autor
+        logger.info(f"🌊 Flood de {message.author.name} - agrupando as próximas mensagens por {self.collapse_window:.0f}s")
+        self.bursts[user_id] = [message]
+        self.collapsed += 1
+        metrics.inc("feedback_flood_total", acao="agrupada")
+        self.timers[user_id] = asyncio.create_task(self._flush_later(user_id))
+
+    async def _flush_later(self, user_id: int):
+        await asyncio.sleep(self.collapse_window)
+        self.timers.pop(user_id, None)
+        await self._flush(user_id)
+
+    async def _flush(self, user_id: int):
+        """Envia a rajada do autor para a fila como uma única análise"""
+        timer = self.timers.pop(user_id, None)
+        if timer is not None and timer is not asyncio.current_task():
+            timer.cancel()
+        burst = self.bursts.pop(user_id, None)
+        if not burst:
+            return
+        self.flushed += 1
+        metrics.inc("feedback_flood_total", acao="rajada")
+        await moderation_queue.submit(burst[-1], is_edit=False, burst=burst)
+
+    def is_collecting(self, message: discord.Message) -> bool:
+        """Mensagem numa rajada ainda sendo juntada (sem veredito)"""
+        return any(m.id == message.id for m in self.bursts.get(message.author.id, ()))
+
+    async def flush_all(self):
+        """Envia todas as rajadas pendentes para a fila sem esperar a janela (encerramento)"""
+        for user_id in list(self.bursts):
+            await self._flush(user_id)
+
+    async def stop(self):
+        """Cancela as rajadas pendentes e as exclusões em andamento"""
+        for task in [*self.timers.values(), *self.tasks]:
+            task.cancel()
+        await asyncio.gather(*self.timers.values(), *self.tasks, return_exceptions=True)
+        self.timers.clear()
+        self.bursts.clear()
+
+    def stats(self) -> dict:
+        return {
+            "allowed": self.allowed,
+            "collapsed": self.collapsed,
+            "bursts": self.flushed,
+            "direct_deletes": self.direct_deletes,
+            "pending": sum(len(burst) for burst in self.bursts.values()),
+        }
+
+
+flood_guard = FloodGuard(
+    burst=FLOOD_BURST,
+    rate=FLOOD_RATE_PER_MINUTE / 60,
+    collapse_window=FLOOD_COLLAPSE_WINDOW,
+    collapse_max=FLOOD_COLLAPSE_MAX
+)
+
+
+# ==================== RECUPERAÇÃO DE MENSAGENS ====================
+
+class CatchUpScanner:
+    """Recupera as mensagens enviadas enquanto o bot estava fora do ar ou desconectado.
+
+    A cada on_ready, o histórico de cada canal de feedback é lido a partir do checkpoint
+    (até onde as mensagens novas têm veredito, gravado no histórico de moderação), da mais antiga
+    para a mais nova, até `max_messages` por canal. As mensagens são analisadas fora da
+    fila de moderação, no máximo `concurrency` por vez e em lote na IA. O tráfego ao vivo
+    tem prioridade: enquanto houver mensagens na fila ou todos os workers ocupados, a
+    recuperação espera.
+    """
 
-🔴 3. NEGATIVO
-Use esta categoria se:
-- O usuário está ofendendo, acusando, mentindo ou tentando prejudicar a imagem da Blazerd Store;
-- Usa palavras agressivas ou ofensivas;
-- Chama o produto de "scam", "lixo", "roubo", "enganoso", etc.;
-- O tom é claramente de ataque, difamação ou intenção de causar dano.
+    def __init__(self, enabled: bool, max_messages: int, max_age: float, concurrency: int):
+        self.enabled = enabled
+        self.max_messages = max_messages
+        self.max_age = max_age
+        self.concurrency = max(1, concurrency)
+        self.task: asyncio.Task | None = None
+        self.live_ids: set[int] = set()
+        self.runs = 0
+        self.scanned = 0
+        self.recovered = 0
+        self.skipped = 0
+        self.yields = 0
+        self.last_run_at: float | None = None
 
-💬 Exemplo de mensagens NEGATIVAS:
-- "Esse servidor é uma fraude."
-- "Roubaram meu dinheiro."
-- "Não comprem, é scam."
-- "Suporte horrível, não funciona nada."
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
 
-🛑 Ação: silenciar o usuário e reprovar o feedback.
+    def note_live(self, message: discord.Message):
+        """Mensagem recebida ao vivo durante a recuperação (não é analisada de novo)"""
+        if self.running:
+            self.live_ids.add(message.id)
 
-🧩 OBSERVAÇÕES IMPORTANTES
-- Se só houver imagem, NUNCA marque como negativo (pode ser apenas o cliente mostrando o bot funcionando).
-- Se houver texto + imagem, analise o texto como prioridade.
-- Se for só emoji, "ok", "funciona", ou qualquer frase curta neutra → POSITIVO.
-- Se a crítica for forte, agressiva ou insultante, mesmo curta → NEGATIVO.
-- Se for crítica leve mas pública, que pode afastar outros clientes, → POSSO_PERDER_CLIENTE.
+    def schedule(self, channels: list):
+        """Inicia a recuperação dos canais em segundo plano (ignora se já houver uma em andamento)"""
+        if not self.enabled or self.running:
+            return
+        self.task = asyncio.create_task(self.run(channels), name="catch-up")
 
-🔎 Formato esperado de resposta
-Responda APENAS com um JSON no seguinte formato:
-{
-    "classificacao": "POSITIVO" | "POSSO_PERDER_CLIENTE" | "NEGATIVO",
-    "motivo": "Breve explicação do motivo da classificação",
-    "confianca": 0.0 a 1.0
-}
-"""
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
 
-# ==================== INTENTS DO BOT ====================
-intents = discord.Intents.default()
-intents.message_content = True
-intents.members = True
-intents.guilds = True
+    async def run(self, channels: list):
+        """Recupera os canais, um por vez"""
+        self.runs += 1
+        self.last_run_at = time.time()
+        try:
+            for channel in channels:
+                try:
+                    await self.scan(channel)
+                except discord.HTTPException as e:
+                    logger.error(f"❌ Erro ao ler o histórico do canal {channel.id}: {e}")
+        finally:
+            self.live_ids.clear()
 
-bot = commands.Bot(command_prefix="!", intents=intents)
+    def start_after(self, channel_id: int) -> int | None:
+        """ID a partir do qual o canal é lido (None = canal novo, nada a recuperar)"""
+        checkpoint = moderation_store.checkpoint(channel_id)
+        if checkpoint is None:
+            return None
+        if self.max_age > 0:
+            oldest = discord.utils.time_snowflake(datetime.now(timezone.utc) - timedelta(seconds=self.max_age))
+            return max(checkpoint, oldest)
+        return checkpoint
 
+    async def scan(self, channel) -> int:
+        """Lê o histórico do canal depois do checkpoint e analisa o que não foi processado"""
+        after = self.start_after(channel.id)
+        if after is None:
+            # Primeira vez no canal: o que veio antes do bot não é moderado
+            moderation_store.advance_checkpoint(channel.id, discord.utils.time_snowflake(datetime.now(timezone.utc)))
+            return 0
 
-# ==================== FUNÇÕES AUXILIARES ====================
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks: set[asyncio.Task] = set()
+        page: list = []
+        recovered = 0
 
-async def download_image_as_base64(url: str) -> str:
-    """Baixa uma imagem e converte para base64"""
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status == 200:
-                    image_data = await response.read()
-                    return base64.b64encode(image_data).decode('utf-8')
-    except Exception as e:
-        print(f"Erro ao baixar imagem: {e}")
-    return None
+        async def process_page(messages: list):
+            nonlocal recovered
+            # Mensagens ao vivo ainda na fila ou em análise (ex.: reconexão no meio do tráfego). Lido antes
+            # da consulta: a que fechar durante ela já tem o veredito na fila de gravação
+            in_flight = set(moderation_store.open_messages.get(channel.id, ()))
+            done = await moderation_store.processed_messages([m.id for m in messages])
+            skip = done | in_flight | self.live_ids | action_journal.recovered_message_ids
+            for message in messages:
+                if message.id in skip or not is_feedback_message(message):
+                    self.skipped += 1
+                    metrics.inc("feedback_backfill_total", resultado="ignorada")
+                    continue
+                await self._wait_for_live_traffic()
+                await semaphore.acquire()
+                task = asyncio.create_task(self._recover(message, semaphore))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                recovered += 1
 
+        async for message in channel.history(limit=self.max_messages, after=discord.Object(id=after), oldest_first=True):
+            self.scanned += 1
+            page.append(message)
+            if len(page) >= 100:
+                await process_page(page)
+                page = []
+        if page:
+            await process_page(page)
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        if recovered:
+            logger.info(f"🔁 {recovered} mensagem(ns) recuperada(s) no canal {channel.id}")
+        return recovered
 
-async def analyze_feedback_with_ai(text_content: str, image_urls: list = None) -> dict:
-    """Analisa o feedback usando OpenAI GPT-4 Vision"""
-    try:
-        messages = [
-            {"role": "system", "content": ANALYSIS_PROMPT}
-        ]
-        
-        # Construir conteúdo da mensagem
-        user_content = []
-        
-        # Adicionar texto
-        feedback_text = f"FEEDBACK DO CLIENTE:\n{text_content if text_content else '(Sem texto - apenas imagem)'}"
-        user_content.append({"type": "text", "text": feedback_text})
-        
-        # Adicionar imagens se houver
-        if image_urls:
-            for img_url in image_urls[:3]:  # Máximo 3 imagens
-                user_content.append({
-                    "type": "image_url",
-                    "image_url": {"url": img_url, "detail": "high"}
-                })
-        
-        messages.append({"role": "user", "content": user_content})
-        
-        # Fazer chamada à API
-        client = openai.OpenAI(api_key=OPENAI_API_KEY)
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages,
-            max_tokens=500,
-            temperature=0.3
-        )
-        
-        # Parsear resposta JSON
-        response_text = response.choices[0].message.content.strip()
-        
-        # Tentar extrair JSON da resposta
+    async def _wait_for_live_traffic(self):
+        """Cede a vez enquanto a fila ao vivo tiver mensagens ou todos os workers estiverem ocupados"""
+        while moderation_queue.queue.qsize() or moderation_queue.busy_workers >= moderation_queue.worker_count:
+            self.yields += 1
+            await asyncio.sleep(0.2)
+
+    async def _recover(self, message: discord.Message, semaphore: asyncio.Semaphore):
+        moderation_store.open_message(message)
         try:
-            # Remover possíveis marcadores de código
-            if "```json" in response_text:
-                response_text = response_text.split("```json")[1].split("```")[0]
-            elif "```" in response_text:
-                response_text = response_text.split("```")[1].split("```")[0]
-            
-            result = json.loads(response_text)
-            return result
-        except json.JSONDecodeError:
-            # Se não conseguir parsear, tentar extrair classificação manualmente
-            if "NEGATIVO" in response_text.upper():
-                return {"classificacao": "NEGATIVO", "motivo": response_text, "confianca": 0.7}
-            elif "POSSO_PERDER_CLIENTE" in response_text.upper():
-                return {"classificacao": "POSSO_PERDER_CLIENTE", "motivo": response_text, "confianca": 0.7}
-            else:
-                return {"classificacao": "POSITIVO", "motivo": response_text, "confianca": 0.7}
-                
-    except Exception as e:
-        print(f"Erro na análise de IA: {e}")
-        return {"classificacao": "POSITIVO", "motivo": f"Erro na análise: {e}", "confianca": 0.0}
+            config = get_channel_config(message.channel.id)
+            image_attachments = [
+                attachment for attachment in message.attachments
+                if attachment.filename.lower().endswith(IMAGE_EXTENSIONS)
+            ]
+            analysis = await classify_feedback(message.content, image_attachments, message.id, config.prompt, batch=True)
+            await process_feedback_message(message, analysis=analysis)
+            self.recovered += 1
+            metrics.inc("feedback_backfill_total", resultado="recuperada")
+        except Exception:
+            logger.exception(f"❌ Erro ao recuperar a mensagem {message.id}")
+        finally:
+            semaphore.release()
 
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "runs": self.runs,
+            "scanned": self.scanned,
+            "recovered": self.recovered,
+            "skipped": self.skipped,
+            "yields": self.yields,
+            "last_run_at": self.last_run_at,
+        }
 
-async def send_user_warning(user: discord.User, classification: str, is_edit: bool = False):
-    """Envia mensagem de aviso para o usuário (em inglês)"""
-    try:
-        edit_text = " (edited message)" if is_edit else ""
-        
-        if classification == "NEGATIVO":
-            message = f"""⚠️ **WARNING - BLAZERD STORE**{edit_text}
 
-Your message in the feedback channel has been removed for violating server rules.
+catch_up = CatchUpScanner(
+    enabled=BACKFILL_ENABLED,
+    max_messages=BACKFILL_MAX_MESSAGES,
+    max_age=BACKFILL_MAX_AGE_HOURS * 3600,
+    concurrency=BACKFILL_CONCURRENCY
+)
 
-📋 **Rule violated:** Offensive/harmful feedback
-⏰ **Consequence:** You have been muted for **1 DAY (24 hours)**
 
-🚨 **WARNING:** If you continue breaking the rules, you will be **PERMANENTLY BANNED** from the server.
+# ==================== AVALIAÇÃO ====================
 
-If you believe this was a mistake, please contact support after the mute period."""
+EVALUATION_LABELS = list(VERDICT_CODES.values())
 
-        elif classification == "POSSO_PERDER_CLIENTE":
-            message = f"""⚠️ **WARNING - BLAZERD STORE**{edit_text}
 
-Your message in the feedback channel has been removed.
+class UrlAttachment:
+    """Imagem de um exemplo de avaliação (URL) no formato de discord.Attachment"""
 
-📋 **Reason:** The content may harm the store's image
-⏰ **Consequence:** You have been muted for **1 HOUR**
+    __slots__ = ("id", "url", "size", "filename")
 
-💡 If you have issues with the product, please contact support directly.
+    def __init__(self, url: str):
+        self.id = int(hashlib.sha256(url.encode()).hexdigest()[:15], 16)
+        self.url = url
+        self.size = 0
+        self.filename = url.split("?", 1)[0].rsplit("/", 1)[-1] or "imagem.png"
 
-🎁 5% off coupon after sending positive feedback: **E9GSMSBS**"""
 
-        await user.send(message)
-        print(f"✅ Aviso enviado para {user.name}#{user.discriminator}")
-        
-    except discord.Forbidden:
-        print(f"❌ Não foi possível enviar DM para {user.name} (DMs fechadas)")
-    except Exception as e:
-        print(f"❌ Erro ao enviar aviso: {e}")
+def normalize_label(label: str) -> str | None:
+    """Rótulo do arquivo (nome ou código P/R/N) → classificação"""
+    label = (label or "").strip().upper()
+    label = VERDICT_CODES.get(label, label)
+    return label if label in EVALUATION_LABELS else None
 
 
-async def send_leader_report(
-    leader: discord.User | discord.Member,
-    author: discord.Member,
-    message_content: str,
-    attachments: list,
-    classification: str,
-    reason: str,
-    confidence: float,
-    is_edit: bool = False,
-    original_content: str = None
-):
-    """Envia relatório completo para o líder do servidor"""
-    try:
-        edit_info = ""
-        if is_edit and original_content:
-            edit_info = f"\n📝 **Mensagem Original:** {original_content[:500]}\n📝 **Mensagem Editada:** {message_content[:500]}"
-        
-        # Classificação emoji
-        class_emoji = {
-            "POSITIVO": "🟢",
-            "POSSO_PERDER_CLIENTE": "🟡", 
-            "NEGATIVO": "🔴"
-        }
-        
-        # Ação tomada
-        action_text = {
-            "POSITIVO": "Nenhuma ação (feedback aprovado)",
-            "POSSO_PERDER_CLIENTE": "Mensagem excluída + Silenciado por 1 HORA",
-            "NEGATIVO": "Mensagem excluída + Silenciado por 1 DIA (24h)"
-        }
-        
-        report = f"""📊 **RELATÓRIO DE FEEDBACK MODERADO**
-{'━' * 40}
+def parse_labeled_feedback(data: str, filename: str = "") -> list[dict]:
+    """Lê exemplos rotulados em JSONL ({"texto", "rotulo", "imagens"}) ou CSV (colunas texto, rotulo, imagens).
 
-{class_emoji.get(classification, '⚪')} **Classificação:** {classification}
-📈 **Confiança da IA:** {confidence * 100:.1f}%
+    `imagens` é uma lista de URLs (no CSV, separadas por espaço); contagens (corpus do benchmark)
+    são ignoradas. Linhas sem texto/imagem ou com rótulo desconhecido geram ValueError.
+    """
+    data = data.lstrip("\ufeff")
+    if filename.lower().endswith((".jsonl", ".json")) or data.lstrip().startswith("{"):
+        rows = [json.loads(line) for line in data.splitlines() if line.strip()]
+    else:
+        rows = list(csv.DictReader(io.StringIO(data)))
 
-👤 **Usuário:** {author.mention} ({author.name}#{author.discriminator})
-🆔 **ID do Usuário:** {author.id}
+    items = []
+    for line, row in enumerate(rows, start=1):
+        text = (row.get("texto") or row.get("text") or "").strip()
+        images = row.get("imagens") or []
+        if isinstance(images, str):
+            images = images.split()
+        elif not isinstance(images, list):
+            images = []
+        label = normalize_label(row.get("rotulo") or row.get("label"))
+        if label is None:
+            raise ValueError(f"Linha {line}: rótulo inválido ({row.get('rotulo') or row.get('label')!r})")
+        if not text and not images:
+            raise ValueError(f"Linha {line}: exemplo sem texto nem imagem")
+        items.append({"texto": text, "rotulo": label, "imagens": images[:3]})
+        if len(items) > EVAL_MAX_ITEMS:
+            raise ValueError(f"Arquivo com mais de {EVAL_MAX_ITEMS} exemplos")
+    return items
 
-{'📝 **Tipo:** Mensagem EDITADA' if is_edit else '📝 **Tipo:** Mensagem Nova'}
-{edit_info if is_edit else f'💬 **Conteúdo:** {message_content[:500] if message_content else "(Sem texto)"}'}
 
-📎 **Anexos:** {len(attachments)} arquivo(s)
-{'🖼️ **URLs das imagens:**' if attachments else ''}
-{chr(10).join([f'• {att.url}' for att in attachments[:3]]) if attachments else ''}
+def estimate_cost(prompt_tokens: float, cached_tokens: float, completion_tokens: float, prices: tuple = None) -> float:
+    """Custo estimado em USD pelos preços (prompt, prompt em cache, resposta) por milhão de tokens (padrão AI_PRICE_*)"""
+    prompt_price, cached_price, completion_price = prices or (AI_PRICE_PROMPT, AI_PRICE_CACHED_PROMPT, AI_PRICE_COMPLETION)
+    return (
+        (prompt_tokens - cached_tokens) * prompt_price
+        + cached_tokens * cached_price
+        + completion_tokens * completion_price
+    ) / 1_000_000
 
-🤖 **Motivo da IA:** {reason}
 
-⚡ **Ação Tomada:** {action_text.get(classification, 'Desconhecida')}
+async def evaluate_labeled_feedback(items: list, concurrency: int = EVAL_CONCURRENCY, instructions: str = "",
+                                    progress=None) -> dict:
+    """Classifica os exemplos pelo caminho real (pré-classificador + IA, sem o cache de classificação)
+    com no máximo `concurrency` ao mesmo tempo e retorna o relatório de acurácia.
 
-🕐 **Data/Hora:** {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}
-{'━' * 40}"""
+    As chamadas usam backends próprios (semáforo e circuitos separados, como no modo sombra):
+    a avaliação não ocupa as vagas de AI_MAX_CONCURRENCY da moderação ao vivo. Os tokens são
+    os das respostas dos exemplos. `progress(feitos, total)` (assíncrona) é chamada a cada
+    exemplo concluído. A concorrência fica entre 1 e EVAL_MAX_CONCURRENCY.
+    """
+    concurrency = min(max(1, concurrency), max(1, EVAL_MAX_CONCURRENCY))
+    semaphore = asyncio.Semaphore(concurrency)
+    router = AIRouter(
+        backends=[
+            build_ai_backend(model, semaphore=asyncio.Semaphore(concurrency), name=f"{model} (avaliação)")
+            for model in dict.fromkeys([OPENAI_MODEL, AI_FALLBACK_MODEL]) if model
+        ],
+        deadline=AI_DEADLINE
+    )
+    predictions: list = [None] * len(items)
+    latencies: list = [0.0] * len(items)
+    done = 0
+    started = time.monotonic()
 
-        await leader.send(report)
-        
-        # Enviar imagens separadamente se houver (para o líder ver o conteúdo)
-        for i, att in enumerate(attachments[:3]):
-            try:
-                await leader.send(f"**Anexo {i+1}:** {att.url}")
-            except:
-                pass
-                
-        print(f"✅ Relatório enviado para o líder")
-        
-    except discord.Forbidden:
-        print(f"❌ Não foi possível enviar relatório para o líder (DMs fechadas)")
-    except Exception as e:
-        print(f"❌ Erro ao enviar relatório: {e}")
+    async def evaluate(index: int, item: dict):
+        nonlocal done
+        async with semaphore:
+            item_started = time.monotonic()
+            attachments = [UrlAttachment(url) for url in item["imagens"]]
+            predictions[index] = await classify_feedback(
+                item["texto"], attachments, f"aval-{index}", instructions, use_cache=False, router=router
+            )
+            latencies[index] = time.monotonic() - item_started
+        done += 1
+        if progress is not None:
+            await progress(done, len(items))
 
+    await asyncio.gather(*[evaluate(index, item) for index, item in enumerate(items)])
 
-async def timeout_user_via_api(guild_id: int, user_id: int, duration: timedelta, reason: str):
-    """Aplica timeout usando a API REST do Discord diretamente (fallback)"""
-    try:
-        from datetime import timezone
-        
-        # Calcular o timestamp ISO 8601 para quando o timeout expira
-        timeout_until = (datetime.now(timezone.utc) + duration).isoformat()
-        
-        url = f"https://discord.com/api/v10/guilds/{guild_id}/members/{user_id}"
-        
-        headers = {
-            "Authorization": f"Bot {DISCORD_TOKEN}",
-            "Content-Type": "application/json",
-            "X-Audit-Log-Reason": reason
-        }
-        
-        payload = {
-            "communication_disabled_until": timeout_until
+    tokens = {"prompt": 0, "prompt_cache": 0, "completion": 0}
+    for prediction in predictions:
+        used = prediction.get("tokens") or {}
+        tokens["prompt"] += used.get("prompt", 0)
+        tokens["prompt_cache"] += used.get("cache", 0)
+        tokens["completion"] += used.get("resposta", 0)
+    predicted_labels = [*EVALUATION_LABELS, "INDEFINIDO"]
+    confusion = {real: {predicted: 0 for predicted in predicted_labels} for real in EVALUATION_LABELS}
+    sources = {}
+    for item, prediction in zip(items, predictions):
+        predicted = "INDEFINIDO" if prediction.get("erro") else prediction["classificacao"]
+        confusion[item["rotulo"]][predicted] += 1
+        source = prediction.get("fonte", "ia")
+        sources[source] = sources.get(source, 0) + 1
+
+    per_class = {}
+    for label in EVALUATION_LABELS:
+        true_positives = confusion[label][label]
+        predicted_total = sum(confusion[real][label] for real in EVALUATION_LABELS)
+        support = sum(confusion[label].values())
+        per_class[label] = {
+            "precisao": true_positives / predicted_total if predicted_total else 0.0,
+            "recall": true_positives / support if support else 0.0,
+            "suporte": support,
         }
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.patch(url, headers=headers, json=payload) as response:
-                if response.status == 200:
-                    print(f"✅ Usuário silenciado via API REST")
-                    return True
-                else:
-                    error_text = await response.text()
-                    print(f"❌ Erro API Discord ({response.status}): {error_text}")
-                    return False
-                    
-    except Exception as e:
-        print(f"❌ Erro ao silenciar via API: {e}")
-        return False
 
+    correct = sum(confusion[label][label] for label in EVALUATION_LABELS)
+    return {
+        "total": len(items),
+        "acertos": correct,
+        "acuracia": correct / len(items) if items else 0.0,
+        "erros_ia": sum(row["INDEFINIDO"] for row in confusion.values()),
+        "matriz": confusion,
+        "classes": per_class,
+        "fontes": sources,
+        "latencia": {p: percentile(latencies, p) for p in (50, 95, 99)},
+        "duracao": time.monotonic() - started,
+        "tokens": tokens,
+        "custo": estimate_cost(tokens["prompt"], tokens["prompt_cache"], tokens["completion"]),
+    }
 
-async def timeout_user(member: discord.Member, duration: timedelta, reason: str = "Feedback negativo/ofensivo"):
-    """Aplica timeout (silenciamento) ao usuário - tenta discord.py, depois API REST"""
-    try:
-        # Método 1: discord.py com timedelta diretamente
-        await member.timeout(duration, reason=reason)
-        print(f"✅ Usuário {member.name} silenciado via discord.py")
-        return True
-    except Exception as e:
-        print(f"⚠️ Falha discord.py ({e}), tentando via API REST...")
-        
-        # Método 2: Fallback para API REST
-        return await timeout_user_via_api(
-            guild_id=member.guild.id,
-            user_id=member.id,
-            duration=duration,
-            reason=reason
+
+def format_evaluation_report(report: dict) -> str:
+    """Relatório da avaliação em texto (tabelas alinhadas para terminal ou bloco de código)"""
+    short = {"POSITIVO": "POS", "POSSO_PERDER_CLIENTE": "PPC", "NEGATIVO": "NEG", "INDEFINIDO": "IND"}
+    columns = [*EVALUATION_LABELS, "INDEFINIDO"]
+    lines = [
+        f"Exemplos: {report['total']} | Acurácia: {report['acuracia'] * 100:.1f}% "
+        f"({report['acertos']}/{report['total']}) | Erros da IA: {report['erros_ia']}",
+        "",
+        "Matriz de confusão (linha = rótulo, coluna = previsto)",
+        "       " + "".join(f"{short[c]:>6}" for c in columns),
+    ]
+    for real in EVALUATION_LABELS:
+        lines.append(f"{short[real]:<7}" + "".join(f"{report['matriz'][real][c]:>6}" for c in columns))
+    lines += ["", f"{'Classe':<7}{'Precisão':>10}{'Recall':>9}{'Suporte':>9}"]
+    for label, values in report["classes"].items():
+        lines.append(
+            f"{short[label]:<7}{values['precisao'] * 100:>9.1f}%{values['recall'] * 100:>8.1f}%{values['suporte']:>9}"
         )
+    latency = report["latencia"]
+    tokens = report["tokens"]
+    lines += [
+        "",
+        f"Latência: p50 {latency[50] * 1000:.0f}ms | p95 {latency[95] * 1000:.0f}ms | p99 {latency[99] * 1000:.0f}ms "
+        f"| duração {report['duracao']:.1f}s",
+        "Fontes: " + ", ".join(f"{source}={count}" for source, count in sorted(report["fontes"].items())),
+        f"Tokens: prompt {tokens['prompt']:.0f} ({tokens['prompt_cache']:.0f} em cache) | resposta {tokens['completion']:.0f} "
+        f"| custo estimado US$ {report['custo']:.4f}",
+    ]
+    return "\n".join(lines)
 
 
-async def delete_message_safely(message: discord.Message):
-    """Deleta uma mensagem de forma segura"""
+async def run_evaluation_cli(path: str, concurrency: int, channel_id: int = None):
+    """python main.py avaliar <arquivo>: avaliação pelo terminal, sem conectar ao Discord"""
+    with open(path, encoding="utf-8") as f:
+        items = parse_labeled_feedback(f.read(), path)
+    config = get_channel_config(channel_id) if channel_id else None
+
+    async def progress(done: int, total: int):
+        print(f"\r⏳ {done}/{total} exemplos", end="", file=sys.stderr, flush=True)
+
     try:
-        await message.delete()
-        print(f"✅ Mensagem deletada: {message.id}")
-        return True
-    except discord.NotFound:
-        print(f"⚠️ Mensagem já foi deletada: {message.id}")
-        return False
-    except discord.Forbidden:
-        print(f"❌ Sem permissão para deletar mensagem: {message.id}")
-        return False
-    except Exception as e:
-        print(f"❌ Erro ao deletar mensagem: {e}")
-        return False
+        report = await evaluate_labeled_feedback(items, concurrency, config.prompt if config else "", progress)
+    finally:
+        await close_openai_client()
+        await close_http_sessions()
+    print(file=sys.stderr)
+    print(format_evaluation_report(report))
 
 
-async def process_feedback_message(message: discord.Message, is_edit: bool = False, original_content: str = None):
-    """Processa uma mensagem de feedback (nova ou editada)"""
-    
-    # Ignorar mensagens do próprio bot
-    if message.author.bot:
-        return
-    
-    # Verificar se é o canal correto
-    if message.channel.id != FEEDBACK_CHANNEL_ID:
-        return
-    
-    print(f"\n{'=' * 50}")
-    print(f"📨 {'Mensagem EDITADA' if is_edit else 'Nova mensagem'} de {message.author.name}")
-    print(f"📝 Conteúdo: {message.content[:100]}...")
-    print(f"📎 Anexos: {len(message.attachments)}")
-    
-    # Coletar URLs de imagens
-    image_urls = []
-    for attachment in message.attachments:
-        if any(attachment.filename.lower().endswith(ext) for ext in ['.png', '.jpg', '.jpeg', '.gif', '.webp']):
-            image_urls.append(attachment.url)
-    
-    # Analisar com IA
-    print("🤖 Analisando feedback com IA...")
-    analysis = await analyze_feedback_with_ai(message.content, image_urls)
-    
-    classification = analysis.get("classificacao", "POSITIVO")
-    reason = analysis.get("motivo", "Sem motivo especificado")
-    confidence = analysis.get("confianca", 0.5)
-    
-    print(f"📊 Resultado: {classification} (Confiança: {confidence * 100:.1f}%)")
-    print(f"📝 Motivo: {reason}")
-    
-    # Obter o líder
-    guild = message.guild
-    leader = guild.get_member(LEADER_ID) or await bot.fetch_user(LEADER_ID)
-    
-    # Processar baseado na classificação
-    if classification == "POSITIVO":
-        print("✅ Feedback positivo - Nenhuma ação necessária")
-        
-        # Opcional: Enviar cupom de desconto
+# ==================== MODO SOMBRA ====================
+
+class ShadowClassifier:
+    """Compara um classificador candidato (outro modelo e/ou prompt) com o principal no tráfego real.
+
+    Uma amostra (`sample_rate`) das mensagens classificadas também vai para o candidato, em
+    segundo plano, com semáforo e circuito próprios: a moderação não espera por ele e as
+    chamadas não disputam vagas com as da classificação principal. Só o veredito principal
+    gera ações. Concordância, latência e custo de cada comparação vão para o histórico de
+    moderação; o líder de cada canal recebe um resumo a cada `report_interval` segundos.
+    """
+
+    def __init__(self, model: str, prompt: str, sample_rate: float, max_pending: int, max_concurrency: int,
+                 prices: tuple, report_interval: float):
+        self.model = model
+        self.prompt = prompt
+        self.enabled = bool(model) and sample_rate > 0
+        self.sample_rate = sample_rate
+        self.max_pending = max(1, max_pending)
+        self.prices = prices
+        self.report_interval = report_interval
+        self.router = AIRouter(
+            backends=[AIBackend(
+                model=model,
+                timeout=AI_TIMEOUT,
+                max_retries=AI_MAX_RETRIES,
+                retry_base_delay=AI_RETRY_BASE_DELAY,
+                breaker=CircuitBreaker(f"{model} (sombra)", AI_BREAKER_FAILURES, AI_BREAKER_COOLDOWN),
+                semaphore=asyncio.Semaphore(max(1, max_concurrency)),
+                name=f"{model} (sombra)"
+            )],
+            deadline=AI_DEADLINE
+        ) if model else None
+        self.tasks: set[asyncio.Task] = set()
+        self.report_task: asyncio.Task | None = None
+        self.window: dict[int, list[dict]] = {}  # líder -> comparações desde o último resumo
+        self.recent: deque[dict] = deque(maxlen=1000)
+        self.compared = 0
+        self.agreed = 0
+        self.errors = 0
+        self.skipped = 0
+
+    async def start(self):
+        if self.enabled and self.report_interval > 0:
+            self.report_task = asyncio.create_task(self._report_loop(), name="shadow-report")
+
+    async def stop(self):
+        """Cancela o resumo periódico e as comparações em andamento (não afetam a moderação)"""
+        for task in [*self.tasks, *([self.report_task] if self.report_task else [])]:
+            task.cancel()
+        await asyncio.gather(*self.tasks, *([self.report_task] if self.report_task else []), return_exceptions=True)
+        self.report_task = None
+
+    def sample(self, message: discord.Message, text_content: str, attachments: list, config: ChannelConfig,
+               primary: dict, primary_latency: float):
+        """Envia (ou não, pela amostragem) a mensagem já classificada para o candidato"""
+        if not self.enabled or primary.get("erro") or random.random() >= self.sample_rate:
+            return
+        if len(self.tasks) >= self.max_pending:
+            self.skipped += 1
+            metrics.inc("feedback_shadow_total", resultado="descartada")
+            return
+        task = asyncio.create_task(
+            self._compare(message, text_content, attachments, config, primary, primary_latency)
+        )
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _classify(self, text_content: str, attachments: list, instructions: str) -> tuple:
+        images = await prepare_images(attachments)
+        messages = [
+            {"role": "system", "content": self.prompt},
+            {"role": "user", "content": build_feedback_content(
+                text_content, [image["part"] for image in images], instructions=instructions
+            )}
+        ]
+        data, tokens, _ = await request_verdict_json(
+            messages, VERDICT_MAX_TOKENS, build_response_format("veredito", VERDICT_SCHEMA), router=self.router
+        )
+        return parse_verdict(data), tokens
+
+    async def _compare(self, message: discord.Message, text_content: str, attachments: list, config: ChannelConfig,
+                       primary: dict, primary_latency: float):
+        started = time.monotonic()
         try:
-            await message.author.send(
-                f"🎉 **Thank you for your positive feedback!**\n\n"
-                f"🎁 5% off coupon: **E9GSMSBS**\n"
-                f"🔗 https://blazerdstore.com/"
+            candidate, tokens = await self._classify(text_content, attachments, config.prompt)
+        except Exception as e:
+            logger.debug(f"Modo sombra: candidato falhou para {message.id}: {e}")
+            candidate, tokens = None, None
+        latency = time.monotonic() - started
+        if candidate is None:
+            self.errors += 1
+            metrics.inc("feedback_shadow_total", resultado="erro")
+            return
+
+        primary_tokens = primary.get("tokens") or {"prompt": 0, "cache": 0, "resposta": 0}
+        comparison = {
+            "mensagem_id": message.id,
+            "canal_id": message.channel.id,
+            "servidor_id": config.guild_id,
+            "conteudo": text_content[:200],
+            "principal": primary["classificacao"],
+            "candidato": candidate["classificacao"],
+            "fonte": primary.get("fonte", "ia"),
+            "concorda": primary["classificacao"] == candidate["classificacao"],
+            "latencia_principal": primary_latency,
+            "latencia_candidato": latency,
+            "custo_principal": estimate_cost(primary_tokens["prompt"], primary_tokens["cache"], primary_tokens["resposta"]),
+            "custo_candidato": estimate_cost(tokens["prompt"], tokens["cache"], tokens["resposta"], self.prices),
+        }
+        self.compared += 1
+        self.agreed += comparison["concorda"]
+        self.recent.append(comparison)
+        window = self.window.setdefault(config.leader_id, [])
+        if len(window) < 5000:
+            window.append(comparison)
+        metrics.inc("feedback_shadow_total", resultado="concorda" if comparison["concorda"] else "discorda")
+        metrics.observe("feedback_shadow_call_seconds", latency)
+        moderation_store.record_shadow(comparison, OPENAI_MODEL, self.model)
+        if not comparison["concorda"]:
+            logger.info(
+                f"🌓 Modo sombra discorda: principal {comparison['principal']} x candidato {comparison['candidato']}",
+                extra=log_fields(mensagem_id=message.id, conteudo=text_content[:100])
             )
-        except:
-            pass
-            
-    elif classification == "POSSO_PERDER_CLIENTE":
-        print("🟡 Feedback pode prejudicar - Excluindo e silenciando 1 HORA...")
-        
-        # Deletar mensagem
-        await delete_message_safely(message)
-        
-        # Silenciar usuário por 1 HORA
-        member = message.author if isinstance(message.author, discord.Member) else guild.get_member(message.author.id)
-        if member:
-            await timeout_user(member, TIMEOUT_MEDIO_DURATION, "Feedback pode prejudicar a imagem da loja")
-        
-        # Enviar aviso ao usuário
-        await send_user_warning(message.author, classification, is_edit)
-        
-        # Enviar relatório ao líder
-        await send_leader_report(
-            leader=leader,
-            author=message.author,
-            message_content=message.content,
-            attachments=message.attachments,
-            classification=classification,
-            reason=reason,
-            confidence=confidence,
-            is_edit=is_edit,
-            original_content=original_content
+
+    @staticmethod
+    def summarize(comparisons: list) -> dict:
+        """Concordância, divergências, latência e custo (por 1000 mensagens) de um conjunto de comparações.
+
+        Latência e custo só contam as mensagens que o principal mandou para a IA (as locais e
+        do cache continuariam assim com o candidato).
+        """
+        ai_comparisons = [c for c in comparisons if c["fonte"] == "ia"]
+        disagreements = {}
+        for comparison in comparisons:
+            if not comparison["concorda"]:
+                pair = (comparison["principal"], comparison["candidato"])
+                disagreements[pair] = disagreements.get(pair, 0) + 1
+        per_thousand = 1000 / len(ai_comparisons) if ai_comparisons else 0.0
+        return {
+            "comparisons": len(comparisons),
+            "agreement": sum(c["concorda"] for c in comparisons) / len(comparisons) if comparisons else 0.0,
+            "disagreements": sorted(disagreements.items(), key=lambda item: -item[1]),
+            "primary_p50": percentile([c["latencia_principal"] for c in ai_comparisons], 50),
+            "candidate_p50": percentile([c["latencia_candidato"] for c in ai_comparisons], 50),
+            "primary_cost": sum(c["custo_principal"] for c in ai_comparisons) * per_thousand,
+            "candidate_cost": sum(c["custo_candidato"] for c in ai_comparisons) * per_thousand,
+        }
+
+    def build_report_embed(self, comparisons: list) -> discord.Embed:
+        """Resumo do modo sombra para o líder"""
+        summary = self.summarize(comparisons)
+        embed = discord.Embed(
+            title=f"🌓 Modo sombra: {OPENAI_MODEL} x {self.model}",
+            description=(
+                f"{summary['comparisons']} mensagem(ns) comparada(s) | "
+                f"Concordância: **{summary['agreement'] * 100:.1f}%**"
+            ),
+            color=discord.Color.dark_grey()
         )
-        
-    elif classification == "NEGATIVO":
-        print("🔴 Feedback negativo - Excluindo e silenciando...")
-        
-        # Deletar mensagem
-        await delete_message_safely(message)
-        
-        # Silenciar usuário por 1 DIA
-        member = message.author if isinstance(message.author, discord.Member) else guild.get_member(message.author.id)
-        if member:
-            await timeout_user(member, TIMEOUT_NEGATIVO_DURATION, "Feedback negativo/ofensivo")
-        
-        # Enviar aviso ao usuário
-        await send_user_warning(message.author, classification, is_edit)
-        
-        # Enviar relatório ao líder
-        await send_leader_report(
-            leader=leader,
-            author=message.author,
-            message_content=message.content,
-            attachments=message.attachments,
-            classification=classification,
-            reason=reason,
-            confidence=confidence,
-            is_edit=is_edit,
-            original_content=original_content
+        embed.add_field(
+            name="Latência p50 (IA)",
+            value=f"Principal: {summary['primary_p50'] * 1000:.0f}ms\nCandidato: {summary['candidate_p50'] * 1000:.0f}ms",
+            inline=True
         )
-    
-    print(f"{'=' * 50}\n")
+        embed.add_field(
+            name="Custo por 1000 mensagens",
+            value=f"Principal: US$ {summary['primary_cost']:.3f}\nCandidato: US$ {summary['candidate_cost']:.3f}",
+            inline=True
+        )
+        if summary["disagreements"]:
+            embed.add_field(
+                name="Divergências (principal → candidato)",
+                value="\n".join(
+                    f"{CLASSIFICATION_EMOJI[primary]} {primary} → {CLASSIFICATION_EMOJI[candidate]} {candidate}: {count}"
+                    for (primary, candidate), count in summary["disagreements"][:6]
+                ),
+                inline=False
+            )
+            examples = [c for c in comparisons if not c["concorda"]][-3:]
+            embed.add_field(
+                name="Exemplos",
+                value="\n".join(
+                    f"• \"{(c['conteudo'] or '(imagem)')[:80]}\" → {c['principal']} x {c['candidato']}" for c in examples
+                )[:1024],
+                inline=False
+            )
+        return embed
+
+    async def report(self):
+        """Envia o resumo das comparações desde o último envio ao líder de cada canal"""
+        window, self.window = self.window, {}
+        for leader_id, comparisons in window.items():
+            if not comparisons:
+                continue
+            try:
+                leader = await resolve_leader(entity_cache.guild(comparisons[0]["servidor_id"]), leader_id)
+                await leader.send(embed=self.build_report_embed(comparisons))
+            except Exception as e:
+                logger.error(f"❌ Erro ao enviar o resumo do modo sombra ao líder {leader_id}: {e}")
+
+    async def _report_loop(self):
+        while True:
+            await asyncio.sleep(self.report_interval)
+            await self.report()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "model": self.model,
+            "compared": self.compared,
+            "agreed": self.agreed,
+            "errors": self.errors,
+            "skipped": self.skipped,
+            "pending": len(self.tasks),
+            **{key: value for key, value in self.summarize(list(self.recent)).items() if key != "disagreements"},
+        }
+
+
+def load_shadow_prompt(path: str) -> str:
+    """Prompt candidato do modo sombra (vazio = o mesmo ANALYSIS_PROMPT)"""
+    if not path:
+        return ANALYSIS_PROMPT
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+shadow_classifier = ShadowClassifier(
+    model=SHADOW_MODEL or (OPENAI_MODEL if SHADOW_PROMPT_PATH else ""),
+    prompt=load_shadow_prompt(SHADOW_PROMPT_PATH),
+    sample_rate=SHADOW_SAMPLE_RATE,
+    max_pending=SHADOW_MAX_PENDING,
+    max_concurrency=SHADOW_MAX_CONCURRENCY,
+    prices=(SHADOW_PRICE_PROMPT, SHADOW_PRICE_CACHED_PROMPT, SHADOW_PRICE_COMPLETION),
+    report_interval=SHADOW_REPORT_HOURS * 3600
+)
 
 
 # ==================== EVENTOS DO BOT ====================
@@ -474,39 +4483,68 @@ async def process_feedback_message(message: discord.Message, is_edit: bool = Fal
 @bot.event
 async def on_ready():
     """Evento quando o bot está pronto"""
-    print(f"""
+    channels = "\n".join(
+        f"   • {config.store_name}: canal {config.channel_id} | servidor {config.guild_id} | "
+        f"líder {config.leader_id} | timeouts {describe_timeout(config.timeout_medio)} / "
+        f"{describe_timeout(config.timeout_negativo)}"
+        for config in list(channel_configs.values())[:20]
+    )
+    if len(channel_configs) > 20:
+        channels += f"\n   • ... e mais {len(channel_configs) - 20} canal(is)"
+    shards = f"{len(bot.shards)} de {bot.shard_count}" if isinstance(bot, commands.AutoShardedBot) else "sem shards"
+    logger.info(f"""
 {'=' * 60}
-🤖 BOT DE MODERAÇÃO DE FEEDBACK - BLAZERD STORE
+🤖 BOT DE MODERAÇÃO DE FEEDBACK
 {'=' * 60}
 ✅ Bot conectado como: {bot.user.name}#{bot.user.discriminator}
 🆔 Bot ID: {bot.user.id}
+🧩 Shards: {shards} | Servidores: {len(bot.guilds)}
 {'=' * 60}
-📋 CONFIGURAÇÕES:
-   • Canal de Feedback: {FEEDBACK_CHANNEL_ID}
-   • ID do Líder: {LEADER_ID}
-   • Timeout Médio: 1 hora
-   • Timeout Negativo: 1 dia
-   • Servidor: {GUILD_ID}
+📋 CANAIS DE FEEDBACK ({len(channel_configs)}):
+{channels}
 {'=' * 60}
-🔍 Monitorando canal de feedback...
+🔍 Monitorando canais de feedback...
 {'=' * 60}
 """)
 
+    await entity_cache.warm(bot)
+    await action_journal.replay(bot)
+
+    # Mensagens enviadas enquanto o bot estava fora (início ou reconexão)
+    channels = [channel for channel in map(bot.get_channel, channel_configs) if channel is not None]
+    catch_up.schedule(channels)
+
 
 @bot.event
 async def on_message(message: discord.Message):
     """Evento para novas mensagens"""
-    await process_feedback_message(message, is_edit=False)
+    if is_feedback_message(message):
+        if bot.draining:
+            bot.unprocessed.append(message)  # Encerrando: fica para a recuperação
+        else:
+            catch_up.note_live(message)
+            moderation_store.open_message(message)
+            await flood_guard.admit(message)
     await bot.process_commands(message)
 
 
+@bot.event
+async def on_member_update(before: discord.Member, after: discord.Member):
+    """Mantém o cache de entidades atualizado"""
+    entity_cache.update_member(after)
+
+
+@bot.event
+async def on_member_remove(member: discord.Member):
+    entity_cache.forget_member(member)
+
+
 @bot.event
 async def on_message_edit(before: discord.Message, after: discord.Message):
     """Evento para mensagens editadas"""
-    # Só processa se o conteúdo mudou
-    if before.content != after.content or before.attachments != after.attachments:
-        print(f"\n🔄 Mensagem EDITADA detectada de {after.author.name}")
-        await process_feedback_message(after, is_edit=True, original_content=before.content)
+    # Edições triviais e edições em sequência são tratadas pelo EditTracker
+    if is_feedback_message(after) and not bot.draining:
+        await edit_tracker.handle_edit(before, after)
 
 
 # ==================== COMANDOS ADMINISTRATIVOS ====================
@@ -520,10 +4558,238 @@ async def status_command(ctx):
         color=discord.Color.green()
     )
     embed.add_field(name="Estado", value="✅ Online", inline=True)
-    embed.add_field(name="Canal Monitorado", value=f"<#{FEEDBACK_CHANNEL_ID}>", inline=True)
-    embed.add_field(name="Líder", value=f"<@{LEADER_ID}>", inline=True)
-    embed.add_field(name="Timeout Médio", value="1 hora", inline=True)
-    embed.add_field(name="Timeout Negativo", value="1 dia", inline=True)
+    for config in guild_channel_configs(ctx.guild.id if ctx.guild else 0)[:5]:
+        embed.add_field(
+            name=f"Canal Monitorado - {config.store_name}",
+            value=(
+                f"<#{config.channel_id}> | Líder: <@{config.leader_id}>\n"
+                f"Timeouts: {describe_timeout(config.timeout_medio)} / {describe_timeout(config.timeout_negativo)}"
+            ),
+            inline=False
+        )
+    embed.add_field(name="Canais no Total", value=str(len(channel_configs)), inline=True)
+    if isinstance(bot, commands.AutoShardedBot):
+        embed.add_field(name="Shards", value=f"{len(bot.shards)} de {bot.shard_count}", inline=True)
+
+    queue_stats = moderation_queue.stats()
+    embed.add_field(
+        name="Fila de Moderação",
+        value=(
+            f"Profundidade: {queue_stats['depth']}/{queue_stats['max_size']}\n"
+            f"Espera média: {queue_stats['avg_wait']:.2f}s (máx. {queue_stats['max_wait']:.2f}s)\n"
+            f"Workers ocupados: {queue_stats['busy_workers']}/{queue_stats['workers']}\n"
+            f"Utilização: {queue_stats['utilization'] * 100:.1f}%\n"
+            f"Processadas: {queue_stats['processed']} | Descartadas: {queue_stats['shed']}"
+        ),
+        inline=False
+    )
+
+    cache_stats = classification_cache.stats()
+    embed.add_field(
+        name="Cache de Classificação",
+        value=(
+            f"Acertos: {cache_stats['hits']} | Erros: {cache_stats['misses']}\n"
+            f"Taxa de acerto: {cache_stats['hit_rate'] * 100:.1f}%\n"
+            f"Entradas em memória: {cache_stats['size']}"
+        ),
+        inline=False
+    )
+
+    held_stats = held_messages.stats()
+    states = {"closed": "🟢 fechado", "half_open": "🟡 em teste", "open": "🔴 aberto"}
+    embed.add_field(
+        name="Backend de IA",
+        value=(
+            "\n".join(
+                f"{backend['model']}: {states.get(backend['state'], backend['state'])} "
+                f"({backend['failures']} falha(s) seguidas)"
+                for backend in ai_router.stats()
+            ) + "\n"
+            f"Guardadas para reanálise: {held_stats['pending']} | Liberadas: {held_stats['released']} | "
+            f"Perdidas: {held_stats['dropped']} | Aguardando revisão: {held_stats['needs_review']}"
+        ),
+        inline=False
+    )
+
+    flood_stats = flood_guard.stats()
+    embed.add_field(
+        name="Controle de Flood",
+        value=(
+            f"Liberadas: {flood_stats['allowed']} | Agrupadas: {flood_stats['collapsed']} "
+            f"em {flood_stats['bursts']} rajada(s)\n"
+            f"Excluídas sem análise (silenciados): {flood_stats['direct_deletes']}"
+        ),
+        inline=False
+    )
+
+    store_stats = moderation_store.stats()
+    embed.add_field(
+        name="Histórico de Moderação",
+        value=(
+            "Hoje: " + " | ".join(
+                f"{CLASSIFICATION_EMOJI[name]} {store_stats['today'].get(name, 0)}" for name in CLASSIFICATION_EMOJI
+            ) + "\n"
+            "Total: " + " | ".join(
+                f"{CLASSIFICATION_EMOJI[name]} {store_stats['totals'].get(name, 0)}" for name in CLASSIFICATION_EMOJI
+            ) + "\n"
+            f"Reincidentes ({OFFENSE_WINDOW_DAYS:g} dias): {store_stats['repeat_offenders']} | "
+            f"Gravações pendentes: {store_stats['pending']}"
+        ),
+        inline=False
+    )
+
+    catch_up_stats = catch_up.stats()
+    if catch_up.enabled:
+        last_run = (
+            f"<t:{int(catch_up_stats['last_run_at'])}:R>" if catch_up_stats["last_run_at"] else "nunca"
+        )
+        embed.add_field(
+            name="Recuperação de Mensagens",
+            value=(
+                f"{'🔄 Em andamento' if catch_up_stats['running'] else '⏹️ Parada'} | Última: {last_run}\n"
+                f"Lidas: {catch_up_stats['scanned']} | Recuperadas: {catch_up_stats['recovered']} | "
+                f"Já processadas: {catch_up_stats['skipped']} | Pausas p/ tráfego ao vivo: {catch_up_stats['yields']}"
+            ),
+            inline=False
+        )
+
+    journal_stats = action_journal.stats()
+    if journal_stats["interrupted"]:
+        embed.add_field(
+            name="Diário de Ações",
+            value=(
+                f"Moderações interrompidas no último encerramento: {journal_stats['interrupted']} | "
+                f"Retomadas: {journal_stats['replayed']} | Pendentes: {journal_stats['pending']}"
+            ),
+            inline=False
+        )
+
+    embed.add_field(
+        name="Relatórios ao Líder",
+        value=(
+            f"Incidentes: {leader_reporter.incidents} | Relatórios enviados: {leader_reporter.reports_sent}\n"
+            f"Pendentes no resumo: {sum(len(incidents) for incidents in leader_reporter.pending.values())}"
+        ),
+        inline=False
+    )
+
+    shadow_stats = shadow_classifier.stats()
+    if shadow_stats["enabled"]:
+        embed.add_field(
+            name=f"Modo Sombra ({shadow_stats['model']})",
+            value=(
+                f"Comparadas: {shadow_stats['compared']} | Concordância: "
+                f"{shadow_stats['agreed'] / shadow_stats['compared'] * 100 if shadow_stats['compared'] else 0:.1f}% | "
+                f"Erros: {shadow_stats['errors']} | Puladas: {shadow_stats['skipped']}\n"
+                f"p50 IA: {shadow_stats['primary_p50'] * 1000:.0f}ms x {shadow_stats['candidate_p50'] * 1000:.0f}ms | "
+                f"Custo/1000: US$ {shadow_stats['primary_cost']:.3f} x {shadow_stats['candidate_cost']:.3f}"
+            ),
+            inline=False
+        )
+
+    coupon_stats = coupon_dispatcher.stats()
+    embed.add_field(
+        name="Cupons por DM",
+        value=(
+            f"Enviados: {coupon_stats['sent']} | Na fila: {coupon_stats['pending']} | "
+            f"Repetidos: {coupon_stats['deduped']} | DMs fechadas: {coupon_stats['closed']}\n"
+            f"Falhas: {coupon_stats['failed']} | Descartados: {coupon_stats['dropped']} | "
+            f"Pausas p/ moderação: {coupon_stats['yields']} | Enviados após a espera máxima: {coupon_stats['forced']}"
+        ),
+        inline=False
+    )
+
+    entity_stats = entity_cache.stats()
+    embed.add_field(
+        name="Cache de Entidades",
+        value=(
+            f"Líderes: {entity_stats['leaders']} | Membros buscados: {entity_stats['members']} | "
+            f"Servidores: {entity_stats['guilds']}\n"
+            f"Acertos: {entity_stats['hits']} | Buscas via API: {entity_stats['fetches']}"
+        ),
+        inline=False
+    )
+
+    edit_stats = edit_tracker.stats()
+    embed.add_field(
+        name="Edições",
+        value=(
+            f"Recebidas: {edit_stats['edits']} | Reanalisadas: {edit_stats['reanalyzed']}\n"
+            f"Triviais ignoradas: {edit_stats['skipped']} | Agrupadas: {edit_stats['debounced']} | "
+            f"Já excluídas: {edit_stats['removed']}"
+        ),
+        inline=False
+    )
+
+    local_stats = local_classifier.stats()
+    embed.add_field(
+        name="Pré-classificador Local",
+        value=(
+            f"Decididas localmente: {local_stats['decided']}\n"
+            f"Escaladas para a IA: {local_stats['escalated']} ({local_stats['escalation_rate'] * 100:.1f}%)"
+        ),
+        inline=False
+    )
+
+    if AI_BATCH_ENABLED:
+        batch_stats = classification_batcher.stats()
+        embed.add_field(
+            name="Lotes de Classificação",
+            value=(
+                f"Chamadas: {batch_stats['batches']} | Mensagens: {batch_stats['items']}\n"
+                f"Média por chamada: {batch_stats['avg_size']:.1f} | Reenviadas sozinhas: {batch_stats['fallbacks']}"
+            ),
+            inline=False
+        )
+
+    def latency(name: str, **labels) -> str:
+        histogram = metrics.histogram(name, **labels)
+        if histogram is None:
+            return "-"
+        return f"{histogram.percentile(50) * 1000:.0f}/{histogram.percentile(95) * 1000:.0f}ms"
+
+    embed.add_field(
+        name="Latência (p50/p95)",
+        value=(
+            f"Fila: {latency('feedback_queue_wait_seconds')}\n"
+            f"IA: {latency('feedback_ai_call_seconds', modelo=OPENAI_MODEL)}\n"
+            f"Parse: {latency('feedback_ai_parse_seconds')}\n"
+            f"Exclusão: {latency('feedback_action_seconds', acao='excluir')}\n"
+            f"Silenciamento: {latency('feedback_action_seconds', acao='silenciar')}\n"
+            f"DM aviso: {latency('feedback_action_seconds', acao='avisar_usuario')}"
+        ),
+        inline=True
+    )
+
+    classifications = metrics.counters_by("feedback_classifications_total", "classificacao")
+    sources = metrics.counters_by("feedback_classifications_total", "fonte")
+    embed.add_field(
+        name="Classificações",
+        value=(
+            "\n".join(f"{CLASSIFICATION_EMOJI.get(c, '⚪')} {c}: {n:.0f}" for c, n in sorted(classifications.items()))
+            + "\n" + " | ".join(f"{source}: {n:.0f}" for source, n in sorted(sources.items()))
+        ) if classifications else "Nenhuma ainda",
+        inline=True
+    )
+
+    failures = metrics.counters_by("feedback_failures_total", "caminho")
+    embed.add_field(
+        name="Falhas",
+        value="\n".join(f"{path}: {n:.0f}" for path, n in sorted(failures.items())) or "Nenhuma",
+        inline=True
+    )
+
+    tokens = metrics.histogram("feedback_ai_tokens_per_call")
+    embed.add_field(
+        name="Tokens OpenAI",
+        value=(
+            f"Prompt: {metrics.counter('feedback_ai_tokens_total', tipo='prompt'):.0f} | "
+            f"Resposta: {metrics.counter('feedback_ai_tokens_total', tipo='completion'):.0f} | "
+            f"Prompt em cache: {metrics.counter('feedback_ai_tokens_total', tipo='prompt_cache'):.0f}\n"
+            f"Média por chamada: {tokens.sum / tokens.count if tokens and tokens.count else 0:.0f}"
+        ),
+        inline=False
+    )
     embed.set_footer(text=f"Bot ID: {bot.user.id}")
     
     await ctx.send(embed=embed)
@@ -543,11 +4809,55 @@ async def test_command(ctx, *, texto: str):
     )
     embed.add_field(name="Classificação", value=analysis.get("classificacao", "N/A"), inline=True)
     embed.add_field(name="Confiança", value=f"{analysis.get('confianca', 0) * 100:.1f}%", inline=True)
-    embed.add_field(name="Motivo", value=analysis.get("motivo", "N/A")[:1000], inline=False)
+    embed.add_field(name="Motivo", value=(analysis.get("motivo") or "N/A")[:1000], inline=False)
     
     await ctx.send(embed=embed)
 
 
+@bot.command(name="avaliar")
+@commands.has_permissions(administrator=True)
+async def evaluate_command(ctx, concorrencia: int = EVAL_CONCURRENCY):
+    """Avalia o classificador com um arquivo CSV/JSONL de exemplos rotulados (anexado ao comando)"""
+    if not ctx.message.attachments:
+        await ctx.send("❌ Anexe um arquivo CSV (colunas `texto`, `rotulo`, `imagens`) ou JSONL com os exemplos.")
+        return
+    attachment = ctx.message.attachments[0]
+    try:
+        items = parse_labeled_feedback((await attachment.read()).decode("utf-8"), attachment.filename)
+    except (ValueError, UnicodeDecodeError, json.JSONDecodeError, csv.Error) as e:
+        await ctx.send(f"❌ Arquivo inválido: {e}")
+        return
+    if not items:
+        await ctx.send("❌ O arquivo não tem exemplos.")
+        return
+    if concorrencia <= 0:
+        await ctx.send("❌ A concorrência precisa ser maior que zero.")
+        return
+    concorrencia = min(concorrencia, EVAL_MAX_CONCURRENCY)
+
+    status = await ctx.send(f"⏳ Avaliando {len(items)} exemplo(s) ({concorrencia} por vez)...")
+    last_update = time.monotonic()
+
+    async def progress(done: int, total: int):
+        nonlocal last_update
+        # Edita a mensagem no máximo a cada 3s (rate limit de edição)
+        if done < total and time.monotonic() - last_update < 3:
+            return
+        last_update = time.monotonic()
+        try:
+            await status.edit(content=f"⏳ Avaliando... {done}/{total} ({done / total * 100:.0f}%)")
+        except discord.HTTPException:
+            pass
+
+    config = get_channel_config(ctx.channel.id)
+    report = await evaluate_labeled_feedback(items, concorrencia, config.prompt if config else "", progress)
+    text = format_evaluation_report(report)
+    if len(text) > 1900:
+        await ctx.send("📊 Resultado da avaliação", file=discord.File(io.BytesIO(text.encode()), "avaliacao.txt"))
+    else:
+        await ctx.send(f"📊 **Resultado da avaliação**\n```\n{text}\n```")
+
+
 @bot.command(name="testtimeout")
 @commands.has_permissions(administrator=True)
 async def test_timeout_command(ctx, member: discord.Member, minutos: int = 1):
@@ -565,13 +4875,38 @@ async def test_timeout_command(ctx, member: discord.Member, minutos: int = 1):
 # ==================== INICIALIZAÇÃO ====================
 
 if __name__ == "__main__":
+    log_listener = setup_logging()
+
+    # python main.py avaliar <arquivo> [--concorrencia N] [--canal ID]: avaliação sem o Discord
+    if len(sys.argv) > 1 and sys.argv[1] == "avaliar":
+        parser = argparse.ArgumentParser(prog="main.py avaliar", description="Avalia o classificador com exemplos rotulados")
+        parser.add_argument("arquivo", help="CSV (texto, rotulo, imagens) ou JSONL")
+        parser.add_argument("--concorrencia", type=int, default=EVAL_CONCURRENCY)
+        parser.add_argument("--canal", type=int, default=None, help="Usa as instruções da loja deste canal")
+        args = parser.parse_args(sys.argv[2:])
+        if not OPENAI_API_KEY:
+            logger.error("❌ ERRO: OPENAI_API_KEY não encontrado no .env")
+            log_listener.stop()
+            exit(1)
+        try:
+            asyncio.run(run_evaluation_cli(args.arquivo, args.concorrencia, args.canal))
+        finally:
+            log_listener.stop()
+        exit(0)
+
     if not DISCORD_TOKEN:
-        print("❌ ERRO: DISCORD_TOKEN não encontrado no .env")
+        logger.error("❌ ERRO: DISCORD_TOKEN não encontrado no .env")
+        log_listener.stop()
         exit(1)
     
     if not OPENAI_API_KEY:
-        print("❌ ERRO: OPENAI_API_KEY não encontrado no .env")
+        logger.error("❌ ERRO: OPENAI_API_KEY não encontrado no .env")
+        log_listener.stop()
         exit(1)
     
-    print("🚀 Iniciando bot...")
-    bot.run(DISCORD_TOKEN)
+    logger.info("🚀 Iniciando bot...")
+    try:
+        # log_handler=None: os logs do discord.py usam a configuração de setup_logging
+        bot.run(DISCORD_TOKEN, log_handler=None)
+    finally:
+        log_listener.stop()